@@ -1,7 +1,12 @@
+import multiprocessing
 from flask import Flask
 from flask_cors import CORS
 from dao.database import init_db
 from routes import api
+from routes.uploads import expire_uploads
+from utils.job_queue import start_workers
+from utils.processing import process_recording_job
+from utils.transcription_pool import start_transcription_pool
 
 def create_app():
     app = Flask(__name__)
@@ -15,6 +20,18 @@ def create_app():
     # 初始化数据库
     init_db()
     
+    # 转录进程池以 spawn 方式启动子进程，子进程导入入口模块时会再次执行 create_app，
+    # 后台服务只在主进程中启动
+    if multiprocessing.parent_process() is None:
+        # 启动转录进程池（工作进程启动时预热 Whisper 模型）
+        start_transcription_pool()
+        
+        # 启动后台处理线程（字幕生成、音视频合并）
+        start_workers(process_recording_job)
+        
+        # 清理过期未完成的断点续传会话
+        expire_uploads()
+    
     return app
 
 if __name__ == '__main__':
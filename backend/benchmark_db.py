@@ -0,0 +1,111 @@
+"""
+录制查询的性能对比
+
+比较 SELECT ... FROM recordings WHERE id = ? 的每秒查询次数：
+- connect-per-call：每次查询新建连接（默认回滚日志），连接池之前的做法
+- pooled：dao.database.get_db_connection 连接池（WAL + PRAGMA 调优 + 预编译语句复用）
+
+用法：
+    python benchmark_db.py
+    python benchmark_db.py --rows 10000 --lookups 20000 --threads 8
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+from dao import database
+
+
+def create_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+    CREATE TABLE recordings (
+        id TEXT PRIMARY KEY,
+        session_id TEXT,
+        trajectory_path TEXT,
+        audio_path TEXT,
+        screen_recording_path TEXT,
+        webcam_recording_path TEXT,
+        subtitle_path TEXT,
+        subtitled_video_path TEXT,
+        created_at INTEGER
+    )
+    ''')
+    ids = [f'{i:012x}' for i in range(rows)]
+    conn.executemany(
+        'INSERT INTO recordings (id, session_id, audio_path, screen_recording_path, created_at) VALUES (?, ?, ?, ?, ?)',
+        [(hash_id, hash_id, f'uploads/{hash_id}.webm', f'uploads/{hash_id}_screen.webm', i) for i, hash_id in enumerate(ids)]
+    )
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def connect_per_call(path):
+    def lookup(hash_id):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        row = conn.execute('SELECT audio_path FROM recordings WHERE id = ?', (hash_id,)).fetchone()
+        conn.close()
+        return row
+    return lookup
+
+
+def pooled(path):
+    def lookup(hash_id):
+        conn = database.get_db_connection()
+        row = conn.execute('SELECT audio_path FROM recordings WHERE id = ?', (hash_id,)).fetchone()
+        conn.close()
+        return row
+    return lookup
+
+
+def measure(name, lookup, ids, lookups, threads):
+    per_thread = lookups // threads
+
+    def run():
+        for hash_id in random.choices(ids, k=per_thread):
+            lookup(hash_id)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+
+    rate = per_thread * threads / seconds
+    print(f"{name:<18} {rate:10.0f} 次/秒  ({per_thread * threads} 次查询, {seconds:.2f}s, {threads} 线程)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比每次新建连接与连接池的录制查询性能')
+    parser.add_argument('--rows', type=int, default=5000, help='recordings 表的行数')
+    parser.add_argument('--lookups', type=int, default=20000, help='查询次数')
+    parser.add_argument('--threads', type=int, default=4, help='并发线程数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.db')
+        ids = create_database(path, args.rows)
+
+        before = measure('connect-per-call', connect_per_call(path), ids, args.lookups, args.threads)
+
+        database.DATABASE_PATH = path
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.close()
+        after = measure('pooled', pooled(path), ids, args.lookups, args.threads)
+        database.close_pool()
+
+        print(f"连接池提升 {after / before:.1f} 倍")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+上传轨道补齐的性能对比
+
+比较按麦克风 / 摄像头开关记录补齐轨道的两种方式的耗时和 CPU 时间：
+- re-encode：fill_gaps 滤镜图，整条轨道重新编码
+- smart-cut：cut_track 流复制完整的 GOP，只重新编码时段首尾不完整的 GOP，关闭时段使用填充素材
+
+用法：
+    python benchmark_smart_cut.py                        # test_files/ 中的素材循环拼接到 60 秒
+    python benchmark_smart_cut.py --repeat 24 --toggles 12 --runs 5
+    python benchmark_smart_cut.py --camera webcam.webm --audio audio.webm
+
+填充素材块在计时前生成（与已缓存素材块的部署一致）。CPU 时间来自子进程的 rusage，仅在 Linux / macOS 上可用。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from dao import database
+from utils import filler_cache
+from utils.media_probe import probe_media
+from utils.smart_cut import cut_track
+from utils.track_assembly import FFMPEG_PATH, fill_gaps
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_files')
+
+
+def loop_clip(path, repeat, output_path):
+    """
+    把素材流复制拼接 repeat 次，得到较长的测试输入
+    """
+    concat_list = output_path + '.txt'
+    with open(concat_list, 'w', encoding='utf-8') as f:
+        for _ in range(repeat):
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    subprocess.run(
+        [FFMPEG_PATH, '-f', 'concat', '-safe', '0', '-i', concat_list, '-c', 'copy', '-y', output_path],
+        check=True, capture_output=True
+    )
+    os.unlink(concat_list)
+    return output_path
+
+
+def state_changes(duration, toggles, off_ms):
+    """
+    均匀分布 toggles 次关闭，每次关闭 off_ms 毫秒
+    """
+    changes = [{'timestamp': 0, 'isEnabled': True}]
+    interval = duration / (toggles + 1)
+    for i in range(1, toggles + 1):
+        off = round(interval * i)
+        changes.append({'timestamp': off, 'isEnabled': False})
+        changes.append({'timestamp': off + off_ms, 'isEnabled': True})
+    return changes
+
+
+def _children_cpu():
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(name, pipeline, track, source, changes, total_duration, folder, runs):
+    results = []
+    for i in range(runs):
+        output_path = os.path.join(folder, f'{track}-{name}-{i}.webm')
+        cpu_before = _children_cpu()
+        start = time.perf_counter()
+        pipeline(track, source, changes, total_duration, output_path)
+        seconds = time.perf_counter() - start
+        results.append({
+            'seconds': seconds,
+            'cpu': _children_cpu() - cpu_before,
+            'duration': probe_media(output_path)['duration'],
+        })
+        os.unlink(output_path)
+
+    best = min(results, key=lambda r: r['seconds'])
+    average = sum(r['seconds'] for r in results) / len(results)
+    print(f"{track:<7} {name:<10} 平均 {average:7.2f}s  最快 {best['seconds']:7.2f}s  "
+          f"CPU {best['cpu']:7.2f}s  输出时长 {best['duration'] / 1000:7.2f}s（目标 {total_duration / 1000:.2f}s）")
+    return average
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比整条重新编码与流复制裁剪补齐上传轨道的性能')
+    parser.add_argument('--camera', default=os.path.join(TEST_FILES, 'webcam_test.webm'), help='摄像头素材')
+    parser.add_argument('--audio', default=os.path.join(TEST_FILES, 'audio_test.webm'), help='麦克风素材')
+    parser.add_argument('--repeat', type=int, default=12, help='素材循环拼接的次数')
+    parser.add_argument('--toggles', type=int, default=6, help='关闭麦克风 / 摄像头的次数')
+    parser.add_argument('--off-ms', type=int, default=1500, help='每次关闭的时长（毫秒）')
+    parser.add_argument('--runs', type=int, default=3, help='每种方式的运行次数')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        database.DATABASE_PATH = os.path.join(folder, 'bench.db')
+        database.init_db()
+        filler_cache.FILLER_FOLDER = os.path.join(folder, 'fillers')
+
+        for track, clip in (('camera', args.camera), ('audio', args.audio)):
+            source = loop_clip(clip, args.repeat, os.path.join(folder, f'{track}-source.webm'))
+            # 录制结尾比素材多 2 秒，覆盖补齐结尾的情况
+            total_duration = round(probe_media(source)['duration']) + 2000
+            changes = state_changes(total_duration, args.toggles, args.off_ms)
+
+            # 预热：生成与素材编码一致的填充素材块
+            cut_track(track, source, changes, total_duration, os.path.join(folder, 'warmup.webm'))
+            os.unlink(os.path.join(folder, 'warmup.webm'))
+
+            re_encode = measure('re-encode', fill_gaps, track, source, changes, total_duration, folder, args.runs)
+            smart = measure('smart-cut', cut_track, track, source, changes, total_duration, folder, args.runs)
+            print(f"{track:<7} smart-cut 耗时为 re-encode 的 {smart / re_encode:.0%}")
+
+        database.close_pool()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+带字幕视频生成的性能对比
+
+比较两种生成方式的耗时和磁盘读写：
+- two-step：combine_video_with_audio 写出中间文件，再用 combine_video_with_subtitle 烧录字幕
+- single-pass：combine_video_audio_subtitle 一次 FFmpeg 调用完成
+
+用法：
+    python benchmark_subtitled_video.py                       # 用 FFmpeg 生成 60 秒测试素材
+    python benchmark_subtitled_video.py --duration 300 --runs 5
+    python benchmark_subtitled_video.py --video screen.webm --audio audio.webm --subtitle sub.vtt
+
+磁盘读写统计来自 FFmpeg 子进程的 rusage（块数 x 512 字节），仅在 Linux / macOS 上可用。
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from utils.combine_video import combine_video_with_audio, combine_video_with_subtitle, combine_video_audio_subtitle
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def generate_inputs(folder, duration):
+    """
+    用 FFmpeg 生成测试录屏、音频和字幕
+    """
+    video_path = os.path.join(folder, 'screen.webm')
+    audio_path = os.path.join(folder, 'audio.webm')
+    subtitle_path = os.path.join(folder, 'subtitle.vtt')
+
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={duration}',
+        '-c:v', 'libvpx-vp9', '-deadline', 'realtime', '-cpu-used', '8', '-b:v', '1M',
+        video_path
+    ], check=True)
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:a', 'libopus', audio_path
+    ], check=True)
+    # 每 2 秒一条字幕（不导入 utils.subtitle，避免加载 Whisper / torch）
+    with open(subtitle_path, 'w', encoding='utf-8') as f:
+        f.write('WEBVTT\n\n')
+        for t in range(0, duration, 2):
+            timestamp = f'{t // 3600:02}:{t // 60 % 60:02}:{t % 60:02}'
+            f.write(f'{timestamp}.000 --> {timestamp}.500\n字幕 {t}\n\n')
+    return video_path, audio_path, subtitle_path
+
+
+def _children_io():
+    if resource is None:
+        return 0, 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+
+def two_step(video_path, audio_path, subtitle_path, output_path):
+    temp_path = output_path + '.with_audio.webm'
+    combine_video_with_audio(video_path, audio_path, temp_path)
+    intermediate = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+    success = combine_video_with_subtitle(temp_path, subtitle_path, output_path)
+    if os.path.exists(temp_path):
+        os.unlink(temp_path)
+    return success, intermediate
+
+
+def single_pass(video_path, audio_path, subtitle_path, output_path):
+    return combine_video_audio_subtitle(video_path, audio_path, subtitle_path, output_path), 0
+
+
+def measure(name, pipeline, inputs, folder, runs):
+    results = []
+    for i in range(runs):
+        output_path = os.path.join(folder, f'{name}-{i}.webm')
+        read_before, write_before = _children_io()
+        start = time.perf_counter()
+        success, intermediate = pipeline(*inputs, output_path)
+        seconds = time.perf_counter() - start
+        read_after, write_after = _children_io()
+        if not success:
+            raise RuntimeError(f'{name} 生成失败')
+        results.append({
+            'seconds': seconds,
+            'read': read_after - read_before,
+            'written': write_after - write_before,
+            'intermediate': intermediate,
+            'output': os.path.getsize(output_path),
+        })
+        os.unlink(output_path)
+
+    best = min(results, key=lambda r: r['seconds'])
+    average = sum(r['seconds'] for r in results) / len(results)
+    print(f"{name:<12} 平均 {average:7.2f}s  最快 {best['seconds']:7.2f}s  "
+          f"读 {best['read'] / 1024 / 1024:8.1f}MB  写 {best['written'] / 1024 / 1024:8.1f}MB  "
+          f"中间文件 {best['intermediate'] / 1024 / 1024:6.1f}MB  输出 {best['output'] / 1024 / 1024:6.1f}MB")
+    return average
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比两步生成与单次 FFmpeg 生成带字幕视频的性能')
+    parser.add_argument('--duration', type=int, default=60, help='生成测试素材的时长（秒）')
+    parser.add_argument('--runs', type=int, default=3, help='每种方式的运行次数')
+    parser.add_argument('--video', help='录屏文件，不指定时自动生成')
+    parser.add_argument('--audio', help='音频文件')
+    parser.add_argument('--subtitle', help='字幕文件')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        if args.video:
+            if not args.audio or not args.subtitle:
+                parser.error('指定 --video 时必须同时指定 --audio 和 --subtitle')
+            inputs = (args.video, args.audio, args.subtitle)
+        else:
+            print(f"生成 {args.duration} 秒测试素材...")
+            inputs = generate_inputs(folder, args.duration)
+
+        two_step_seconds = measure('two-step', two_step, inputs, folder, args.runs)
+        single_pass_seconds = measure('single-pass', single_pass, inputs, folder, args.runs)
+        print(f"single-pass 耗时为 two-step 的 {single_pass_seconds / two_step_seconds:.0%}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+录制打包下载的性能对比
+
+比较两种打包方式的首字节时间（TTFB）、总耗时和额外磁盘占用：
+- tempfile：ZIP_DEFLATED 写入临时文件后再发送（原来的做法）
+- streaming：utils.zip_stream.stream_zip 边读边生成，媒体文件 STORED
+
+用法：
+    python benchmark_zip_download.py                  # 生成 3 个 200MB 的随机数据文件（与 webm 一样不可压缩）
+    python benchmark_zip_download.py --size-mb 1024
+    python benchmark_zip_download.py --files screen.webm audio.webm subtitle.vtt
+"""
+import os
+import sys
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+from utils.zip_stream import stream_zip
+
+# 模拟发送响应时每次读取的块大小
+SEND_CHUNK_SIZE = 1024 * 1024
+
+
+def generate_inputs(folder, size_mb):
+    paths = []
+    for name in ('screen.webm', 'audio.webm', 'webcam.webm'):
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        paths.append(path)
+    return paths
+
+
+def tempfile_zip(paths, folder):
+    """
+    原来的做法：先完整写出临时 zip，再读取发送
+    """
+    start = time.perf_counter()
+    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip', dir=folder)
+    temp_zip.close()
+    with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path in paths:
+            zf.write(path, os.path.basename(path))
+    peak_disk = os.path.getsize(temp_zip.name)
+
+    ttfb = None
+    total = 0
+    with open(temp_zip.name, 'rb') as f:
+        while True:
+            chunk = f.read(SEND_CHUNK_SIZE)
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            total += len(chunk)
+    os.unlink(temp_zip.name)
+    return ttfb, time.perf_counter() - start, total, peak_disk
+
+
+def streaming_zip(paths, folder):
+    start = time.perf_counter()
+    ttfb = None
+    total = 0
+    for chunk in stream_zip([{'name': os.path.basename(path), 'path': path} for path in paths]):
+        if ttfb is None:
+            ttfb = time.perf_counter() - start
+        total += len(chunk)
+    return ttfb, time.perf_counter() - start, total, 0
+
+
+def measure(name, pipeline, paths, folder):
+    ttfb, seconds, total, peak_disk = pipeline(paths, folder)
+    input_size = sum(os.path.getsize(path) for path in paths)
+    print(f"{name:<10} TTFB {ttfb * 1000:9.1f}ms  总耗时 {seconds:7.2f}s  "
+          f"吞吐 {input_size / 1024 / 1024 / seconds:7.1f}MB/s  压缩包 {total / 1024 / 1024:8.1f}MB  "
+          f"临时文件峰值 {peak_disk / 1024 / 1024:8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比临时文件打包与流式打包的下载性能')
+    parser.add_argument('--size-mb', type=int, default=200, help='生成的每个测试文件大小（MB）')
+    parser.add_argument('--files', nargs='+', help='使用已有文件，不自动生成')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        if args.files:
+            paths = args.files
+        else:
+            print(f"生成 3 个 {args.size_mb}MB 测试文件...")
+            paths = generate_inputs(folder, args.size_mb)
+
+        measure('tempfile', tempfile_zip, paths, folder)
+        measure('streaming', streaming_zip, paths, folder)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+将已有录制的 JSON 轨迹文件转换为二进制轨迹格式
+
+转换成功后更新 recordings.trajectory_path 并删除原 JSON 文件（指定 --keep-json 时保留）。
+运行中的服务最多在 RECORDING_CACHE_TTL 秒后读到新路径，期间旧路径仍然可读（保留 JSON 时）。
+
+用法：
+    python convert_trajectories.py
+    python convert_trajectories.py --keep-json
+"""
+import os
+import sys
+import argparse
+from dao.database import get_db_connection, init_db
+from utils.trajectory_store import convert_json_trajectory
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将 JSON 轨迹文件转换为二进制轨迹格式')
+    parser.add_argument('--keep-json', action='store_true', help='转换后保留原 JSON 文件')
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_db_connection()
+    recordings = conn.execute(
+        "SELECT id, trajectory_path FROM recordings WHERE trajectory_path LIKE '%.json'"
+    ).fetchall()
+    conn.close()
+
+    converted = 0
+    json_bytes = 0
+    binary_bytes = 0
+    for recording in recordings:
+        json_path = recording['trajectory_path']
+        if not os.path.exists(json_path):
+            print(f"[WARN] 轨迹文件不存在，跳过: {json_path}")
+            continue
+        try:
+            output_path = convert_json_trajectory(json_path)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] 转换失败: {json_path}: {e}")
+            continue
+
+        conn = get_db_connection()
+        conn.execute('UPDATE recordings SET trajectory_path = ? WHERE id = ?', (output_path, recording['id']))
+        conn.commit()
+        conn.close()
+
+        json_bytes += os.path.getsize(json_path)
+        binary_bytes += os.path.getsize(output_path)
+        if not args.keep_json:
+            os.unlink(json_path)
+        converted += 1
+
+    print(f"[INFO] 转换了 {converted}/{len(recordings)} 个轨迹文件，"
+          f"{json_bytes / 1024:.1f}KB -> {binary_bytes / 1024:.1f}KB")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,253 @@
 import sqlite3
 import os
+import threading
 
 # 数据库路径
 DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data.db')
 
-def get_db_connection():
+# 连接池中最多保留的空闲连接数
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+
+# 数据库被其它连接锁住时的最长等待时间（秒）
+DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', '5'))
+
+# 每个连接缓存的预编译语句数量，连接复用后常用查询不再重复编译
+DB_CACHED_STATEMENTS = 256
+
+# 每个连接建立时设置的 PRAGMA
+# - synchronous=NORMAL：WAL 模式下只在检查点时 fsync，掉电最多丢失最近的事务，不会损坏数据库
+# - mmap_size：通过内存映射读取数据库文件，减少 read 系统调用
+# - cache_size：负数表示 KB，每个连接 16MB 页缓存
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -16384',
+    'PRAGMA temp_store = MEMORY',
+)
+
+_pool = []
+_pool_lock = threading.Lock()
+
+
+class PooledConnection(sqlite3.Connection):
     """
-    获取数据库连接
+    连接池中的连接，close() 时归还到连接池而不是真正关闭
     """
-    conn = sqlite3.connect(DATABASE_PATH)
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+        with _pool_lock:
+            if len(_pool) < DB_POOL_SIZE:
+                _pool.append(self)
+                return
+        super().close()
+
+
+def _connect():
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=DB_BUSY_TIMEOUT,
+        factory=PooledConnection,
+        cached_statements=DB_CACHED_STATEMENTS,
+        # 同一时刻只会被一个线程使用，归还后可以交给其它线程
+        check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+
+def get_db_connection():
+    """
+    从连接池获取数据库连接，用完后调用 close() 归还
+
+    连接池为空时新建连接，嵌套获取也不会互相等待。
+    """
+    with _pool_lock:
+        if _pool:
+            return _pool.pop()
+    return _connect()
+
+
+def close_pool():
+    """
+    关闭连接池中所有空闲连接
+    """
+    with _pool_lock:
+        connections = list(_pool)
+        _pool.clear()
+    for conn in connections:
+        sqlite3.Connection.close(conn)
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """
+    为表补充列（仅供迁移使用；引入版本化迁移之前的开发数据库可能已经有这些列）
+    """
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _migration_1_columns(cursor):
+    """
+    recordings 的内容哈希列和 processing_jobs 的耗时指标列
+
+    screen_sha256 / audio_sha256 / webcam_sha256 对应 media_blobs，metrics 为各处理步骤耗时的 JSON。
+    """
+    for column in ('screen_sha256', 'audio_sha256', 'webcam_sha256'):
+        _add_column_if_missing(cursor, 'recordings', column, 'TEXT')
+    _add_column_if_missing(cursor, 'processing_jobs', 'metrics', 'TEXT')
+
+
+def _migration_2_indexes(cursor):
+    """
+    为热点查询添加索引（recording_sessions.session_id 已有 UNIQUE 索引）
+    """
+    # 录制列表按创建时间倒序
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recordings_created_at ON recordings (created_at)')
+    # 旧版分段合成按会话、类型、开始时间读取分段
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_segments_session_type_start '
+        'ON recording_segments (session_id, segment_type, start_time)'
+    )
+    # 处理进度查询每个录制最近的任务，工作线程按状态领取任务
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_recording ON processing_jobs (recording_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON processing_jobs (status, id)')
+    # 断点续传汇总每个会话的分块
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_chunks_session ON upload_chunks (session_id, field)')
+    # 派生产物按最近使用淘汰、按路径刷新
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_artifacts_last_used ON derived_artifacts (last_used_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_artifacts_path ON derived_artifacts (path)')
+
+
+def _migration_3_media_assets(cursor):
+    """
+    新增规范化的 media_assets 表并回填已有录制
+
+    每个录制的每种媒体一行，保存大小、时长、编码和内容哈希，时长和编码由后台任务探测后写入。
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS media_assets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recording_id TEXT,
+        kind TEXT,  -- screen, audio, webcam, subtitle, subtitled
+        path TEXT,
+        size INTEGER,
+        duration REAL,  -- 毫秒，探测前为 NULL
+        codec TEXT,
+        sha256 TEXT,
+        probed_at INTEGER,
+        UNIQUE (recording_id, kind),
+        FOREIGN KEY (recording_id) REFERENCES recordings(id)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_assets_sha256 ON media_assets (sha256)')
+
+    columns = (
+        ('screen', 'screen_recording_path', 'screen_sha256'),
+        ('audio', 'audio_path', 'audio_sha256'),
+        ('webcam', 'webcam_recording_path', 'webcam_sha256'),
+        ('subtitle', 'subtitle_path', None),
+        ('subtitled', 'subtitled_video_path', None),
+    )
+    for kind, path_column, sha_column in columns:
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO media_assets (recording_id, kind, path, size, sha256)
+            SELECT r.id, ?, r.{path_column}, b.size, {f'r.{sha_column}' if sha_column else 'NULL'}
+            FROM recordings r
+            LEFT JOIN media_blobs b ON b.path = r.{path_column}
+            WHERE r.{path_column} IS NOT NULL
+        ''', (kind,))
+
+
+def _migration_4_recordings_keyset(cursor):
+    """
+    录制列表按 (created_at, id) 键集分页的复合索引
+
+    替代版本 2 中只有 created_at 的索引，按创建时间过滤和排序同样可以使用。
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recordings_created_at_id ON recordings (created_at, id)')
+    cursor.execute('DROP INDEX IF EXISTS idx_recordings_created_at')
+
+
+def _migration_5_probe_index(cursor):
+    """
+    ffprobe 探测结果索引
+
+    按文件绝对路径保存探测结果（JSON），size + mtime_ns 与磁盘上的文件不一致时视为失效。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS probe_index (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            result TEXT NOT NULL,
+            probed_at INTEGER NOT NULL
+        )
+    ''')
+
+
+
+def _migration_6_upload_chunk_pending(cursor):
+    """
+    upload_chunks.pending：正在写入的分块
+
+    写入分块前先登记一行 pending = 1 的记录（与检查会话状态在同一事务中），写完后回填长度；
+    完成上传时有正在写入的分块则拒绝，避免分块写入已经硬链接进内容寻址存储的文件。
+    """
+    _add_column_if_missing(cursor, 'upload_chunks', 'pending', 'INTEGER NOT NULL DEFAULT 0')
+
+
+
+def _migration_7_recordings_created_at(cursor):
+    """
+    回填 recordings.created_at 为 NULL 的旧记录
+
+    录制列表按 (created_at, id) 键集分页，游标中的 created_at 必须是整数。
+    优先使用同 ID 录制会话的创建时间，没有会话时记为 0（排在列表末尾）。
+    """
+    cursor.execute('''
+        UPDATE recordings
+        SET created_at = COALESCE(
+            (SELECT s.created_at FROM recording_sessions s WHERE s.session_id = recordings.session_id), 0
+        )
+        WHERE created_at IS NULL
+    ''')
+
+
+# 版本化迁移：(版本号, 迁移函数)，数据库当前版本记录在 PRAGMA user_version 中，只追加不修改
+MIGRATIONS = (
+    (1, _migration_1_columns),
+    (2, _migration_2_indexes),
+    (3, _migration_3_media_assets),
+    (4, _migration_4_recordings_keyset),
+    (5, _migration_5_probe_index),
+    (6, _migration_6_upload_chunk_pending),
+    (7, _migration_7_recordings_created_at),
+)
+
+
+def _apply_migrations(conn):
+    """
+    按版本号依次执行尚未应用的迁移，每个迁移在独立事务中完成
+    """
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        try:
+            migrate(cursor)
+            # PRAGMA 不支持参数绑定，version 为代码中的整数常量
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f'数据库迁移到版本 {version}: {migrate.__doc__.strip().splitlines()[0]}')
+
+
 def init_db():
     """
     初始化数据库
@@ -19,6 +255,9 @@ def init_db():
     conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
+    # WAL 模式下读写互不阻塞（设置会持久保存在数据库文件中）
+    cursor.execute('PRAGMA journal_mode = WAL')
+    
     # 创建 recordings 表
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS recordings (
@@ -34,6 +273,30 @@ def init_db():
     )
     ''')
     
+    # 创建 media_blobs 表（内容寻址的媒体文件，ref_count 为 recordings 中的引用次数）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS media_blobs (
+        sha256 TEXT PRIMARY KEY,
+        path TEXT,
+        size INTEGER,
+        ref_count INTEGER DEFAULT 0,
+        created_at INTEGER
+    )
+    ''')
+    
+    # 创建 derived_artifacts 表（派生产物缓存，cache_key 由输入内容哈希和变换参数生成）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS derived_artifacts (
+        cache_key TEXT PRIMARY KEY,
+        kind TEXT,  -- subtitle, merged, subtitled
+        path TEXT,
+        size INTEGER,
+        params TEXT,  -- JSON字符串，存储变换参数
+        created_at INTEGER,
+        last_used_at INTEGER
+    )
+    ''')
+    
     # 创建 recording_sessions 表（用于存储录制会话信息）
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS recording_sessions (
@@ -63,6 +326,52 @@ def init_db():
     )
     ''')
     
+    # 创建 processing_jobs 表（持久化的后台处理任务队列）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS processing_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recording_id TEXT,
+        status TEXT,  -- queued, running, completed, failed
+        subtitle_status TEXT,  -- pending, ready, failed（无音频时为 NULL）
+        merged_video_status TEXT,  -- pending, ready, failed（无音频时为 NULL）
+        attempts INTEGER DEFAULT 0,
+        error TEXT,
+        created_at INTEGER,
+        updated_at INTEGER,
+        FOREIGN KEY (recording_id) REFERENCES recordings(id)
+    )
+    ''')
+    
+    # 创建 upload_files 表（断点续传中的文件，所属会话 status 为 uploading）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS upload_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        field TEXT,  -- screen_recording, audio, webcam_recording
+        path TEXT,
+        total_size INTEGER,  -- 创建时未知则为 NULL，完成时由已接收范围确定
+        UNIQUE (session_id, field),
+        FOREIGN KEY (session_id) REFERENCES recording_sessions(session_id)
+    )
+    ''')
+    
+    # 创建 upload_chunks 表（每个已写入的分块，支持并行上传）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS upload_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        field TEXT,
+        offset INTEGER,
+        length INTEGER,
+        created_at INTEGER,
+        FOREIGN KEY (session_id) REFERENCES recording_sessions(session_id)
+    )
+    ''')
+    
     conn.commit()
+    
+    # 执行尚未应用的版本化迁移
+    _apply_migrations(conn)
+    
     conn.close()
     print('数据库已初始化')
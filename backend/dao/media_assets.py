@@ -0,0 +1,63 @@
+"""
+媒体资源表（media_assets）的读写
+
+每个录制的每种媒体（screen、audio、webcam、subtitle、subtitled）一行，与 recordings 中对应的路径列保持一致，
+额外保存大小、时长、编码和内容哈希。时长和编码由后台任务探测后写入，查询时不再访问文件系统。
+"""
+import time
+from dao.database import get_db_connection
+
+# recordings 路径列 -> media_assets.kind
+ASSET_KINDS = {
+    'screen_recording_path': 'screen',
+    'audio_path': 'audio',
+    'webcam_recording_path': 'webcam',
+    'subtitle_path': 'subtitle',
+    'subtitled_video_path': 'subtitled',
+}
+
+
+def upsert_media_asset(cursor, recording_id, kind, path, size=None, sha256=None):
+    """
+    写入或更新录制的一种媒体（路径变化时清空探测结果，等待重新探测）
+
+    Args:
+        cursor: 数据库游标（与更新 recordings 的语句在同一事务中）
+    """
+    cursor.execute(
+        '''INSERT INTO media_assets (recording_id, kind, path, size, sha256)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(recording_id, kind) DO UPDATE SET
+               path = excluded.path, size = excluded.size, sha256 = excluded.sha256,
+               duration = NULL, codec = NULL, probed_at = NULL''',
+        (recording_id, kind, path, size, sha256)
+    )
+
+
+def update_probe_result(asset_id, size, duration, codec):
+    """
+    保存探测结果
+    """
+    conn = get_db_connection()
+    conn.execute(
+        'UPDATE media_assets SET size = ?, duration = ?, codec = ?, probed_at = ? WHERE id = ?',
+        (size, duration, codec, int(time.time() * 1000), asset_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_media_assets(recording_id, unprobed_only=False):
+    """
+    获取录制的所有媒体资源
+
+    Returns:
+        {kind: 行数据 dict}
+    """
+    query = 'SELECT * FROM media_assets WHERE recording_id = ?'
+    if unprobed_only:
+        query += ' AND probed_at IS NULL'
+    conn = get_db_connection()
+    assets = conn.execute(query, (recording_id,)).fetchall()
+    conn.close()
+    return {asset['kind']: dict(asset) for asset in assets}
@@ -0,0 +1,108 @@
+"""
+录制元数据缓存
+
+媒体请求（音频、录屏、摄像头、字幕，包括浏览器的大量 Range 请求）只需要把 hashid 映射到文件路径，
+这里用有界 LRU 缓存 recordings 行（连同会话时长），命中时不访问 SQLite。
+修改 recordings / recording_sessions 的代码需调用 invalidate_recording 使缓存失效；
+多进程部署时各进程缓存独立，RECORDING_CACHE_TTL 限制其它进程修改后的最长不一致时间。
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from dao.database import get_db_connection
+
+# 最多缓存的录制数量
+RECORDING_CACHE_SIZE = int(os.environ.get('RECORDING_CACHE_SIZE', '1024'))
+
+# 缓存项的有效期（秒），0 表示不过期
+RECORDING_CACHE_TTL = float(os.environ.get('RECORDING_CACHE_TTL', '60'))
+
+# hashid -> (过期时间, 行数据 dict)
+_recordings = OrderedDict()
+_recordings_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+# 每次失效时递增；读取数据库期间发生过失效时不写入缓存，避免缓存旧数据
+_generation = 0
+
+
+def _load_recording(hash_id):
+    conn = get_db_connection()
+    recording = conn.execute('''
+        SELECT r.*, rs.total_duration
+        FROM recordings r
+        LEFT JOIN recording_sessions rs ON r.session_id = rs.session_id
+        WHERE r.id = ?
+    ''', (hash_id,)).fetchone()
+    conn.close()
+    return dict(recording) if recording else None
+
+
+def get_recording(hash_id):
+    """
+    获取录制元数据（recordings 行 + total_duration），优先从缓存读取
+
+    Returns:
+        行数据 dict 的副本，不存在时返回 None（不存在的结果不缓存）
+    """
+    now = time.monotonic()
+    with _recordings_lock:
+        entry = _recordings.get(hash_id)
+        if entry and (not RECORDING_CACHE_TTL or entry[0] > now):
+            _recordings.move_to_end(hash_id)
+            _cache_stats['hits'] += 1
+            return dict(entry[1])
+        _cache_stats['misses'] += 1
+        generation = _generation
+
+    recording = _load_recording(hash_id)
+    if recording is None:
+        return None
+
+    with _recordings_lock:
+        if generation != _generation:
+            return dict(recording)
+        _recordings[hash_id] = (now + RECORDING_CACHE_TTL, recording)
+        _recordings.move_to_end(hash_id)
+        while len(_recordings) > RECORDING_CACHE_SIZE:
+            _recordings.popitem(last=False)
+            _cache_stats['evictions'] += 1
+    return dict(recording)
+
+
+def invalidate_recording(*hash_ids):
+    """
+    使指定录制的缓存失效（插入、更新、删除 recordings 或其会话后调用）
+    """
+    global _generation
+    with _recordings_lock:
+        _generation += 1
+        for hash_id in hash_ids:
+            if _recordings.pop(hash_id, None) is not None:
+                _cache_stats['invalidations'] += 1
+
+
+def clear_recording_cache():
+    """
+    清空缓存（无法确定受影响的录制时使用）
+    """
+    global _generation
+    with _recordings_lock:
+        _generation += 1
+        _cache_stats['invalidations'] += len(_recordings)
+        _recordings.clear()
+
+
+def get_recording_cache_stats():
+    """
+    获取缓存的命中情况
+    """
+    with _recordings_lock:
+        lookups = _cache_stats['hits'] + _cache_stats['misses']
+        return {
+            **_cache_stats,
+            'hitRate': round(_cache_stats['hits'] / lookups, 4) if lookups else None,
+            'size': len(_recordings),
+            'capacity': RECORDING_CACHE_SIZE,
+        }
@@ -0,0 +1,23 @@
+"""
+gunicorn 配置（Linux / macOS 生产部署）
+
+    uv run gunicorn -c gunicorn.conf.py start:app
+
+媒体接口的单范围响应通过 wsgi.file_wrapper 交给 gunicorn，由 os.sendfile 直接从文件发送到 socket（utils.media_response）；
+Werkzeug 开发服务器（python start.py）没有零拷贝，逐块读取文件发送。
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:3001')
+
+# 后台任务线程和转录进程池在每个工作进程中各启动一份（转录进程各自加载 Whisper 模型），
+# 默认单个工作进程，用线程处理并发请求
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+
+# 长录制上传和大文件下载可能超过 gunicorn 默认的 30 秒
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '600'))
+
+# 使用 sendfile 发送 wsgi.file_wrapper 响应
+sendfile = True
@@ -1,5 +1,7 @@
 from flask import Blueprint
 from .recordings import bp as recordings_bp
+from .uploads import bp as uploads_bp
 
 api = Blueprint('api', __name__)
 api.register_blueprint(recordings_bp)
+api.register_blueprint(uploads_bp)
@@ -3,18 +3,32 @@
 
 核心功能：
 1. 接收前端上传的录屏文件（必须）、音频文件（可选）、摄像头文件（可选）
-2. 使用 Whisper 生成字幕
+2. 使用 Whisper 生成字幕（后台任务队列异步处理）
 3. 可选：将音频合并到视频中生成带字幕的视频
 """
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from dao.database import get_db_connection
-from utils.subtitle import generate_vtt
-from utils.combine_video import combine_video_with_subtitle, combine_video_with_audio
+from dao.recording_cache import get_recording as get_cached_recording, get_recording_cache_stats
+from dao.media_assets import get_media_assets
+from utils.job_queue import get_job_status
+from utils.processing import (
+    register_recording, delete_recording, submit_subtitled_video, get_subtitled_video_build, LAZY_BUILD_WAIT_SECONDS
+)
+from utils.media_response import send_media_file
+from utils.upload_stream import ingest_multipart, discard_ingested, UploadError
+from utils.media_store import content_id
+from utils.artifact_cache import touch_artifacts
+from utils.media_probe import probe_media
+from utils.trajectory_store import read_trajectory, iter_trajectory
+from utils.zip_stream import stream_zip, prefetch_files
 import os
-import hashlib
-import time
+import base64
+import sqlite3
 import json
+import zlib
+import time
 import ffmpeg
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # 创建蓝图
 bp = Blueprint('recordings', __name__)
@@ -22,10 +36,28 @@ bp = Blueprint('recordings', __name__)
 # 上传目录路径
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
 
+# 上传接口接收的文件字段（trajectory 为轨迹 JSON，不参与内容哈希）
+UPLOAD_FILE_FIELDS = {'screen_recording', 'audio', 'webcam_recording', 'trajectory'}
+
+# 录制列表的默认 / 最大分页大小
+LIST_DEFAULT_LIMIT = 20
+LIST_MAX_LIMIT = 100
+
+# 批量导出最多包含的录制数量
+EXPORT_MAX_RECORDINGS = int(os.environ.get('EXPORT_MAX_RECORDINGS', '500'))
+
+# 批量导出时同时读取的文件数、每次读取的块大小（MB）和每个文件预读的块数
+EXPORT_READ_WORKERS = int(os.environ.get('EXPORT_READ_WORKERS', '4'))
+EXPORT_READ_BUFFER_MB = int(os.environ.get('EXPORT_READ_BUFFER_MB', '4'))
+EXPORT_PREFETCH_CHUNKS = 2
+
+# 录制列表可返回的字段
+LIST_FIELDS = ['hashid', 'createdAt', 'duration', 'hasScreenRecording', 'hasWebcamRecording', 'hasSubtitle']
+
 
 def get_file_duration(file_path):
     """
-    获取媒体文件的持续时间（毫秒）- 使用 ffmpeg-python
+    获取媒体文件的持续时间（毫秒），探测结果会被缓存
     """
     if not os.path.exists(file_path):
         raise Exception(f'文件不存在: {file_path}')
@@ -34,19 +66,12 @@ def get_file_duration(file_path):
         raise Exception(f'文件为空: {file_path}')
     
     try:
-        probe = ffmpeg.probe(file_path)
-        duration_str = probe.get('format', {}).get('duration')
-        if duration_str:
-            return float(duration_str) * 1000
-        
-        # 备用：从 streams 中获取时长
-        for stream in probe.get('streams', []):
-            if 'duration' in stream:
-                return float(stream['duration']) * 1000
-        
-        raise Exception('无法获取文件时长')
+        duration = probe_media(file_path)['duration']
     except ffmpeg.Error as e:
         raise Exception(f'获取文件时长失败: {e}')
+    if duration is None:
+        raise Exception('无法获取文件时长')
+    return duration
 
 
 @bp.route('/recordings', methods=['POST'])
@@ -60,196 +85,387 @@ def upload_recording():
     可选参数：
     - audio: 音频文件 (webm)
     - webcam_recording: 摄像头录制文件 (webm)
+    - trajectory: 轨迹 JSON 文件（mouse、whiteboard 等），服务端转存为二进制轨迹格式
     - total_duration: 总时长（毫秒），如果不传则从录屏文件获取
+
+    字幕生成和音视频合并在后台任务中完成，接口保存文件后立即返回 hashid，
+    客户端可轮询 GET /api/recordings/<hashid> 的 processing 字段获取进度。
     """
-    # 1. 检查必须的录屏文件
-    if 'screen_recording' not in request.files:
+    # 1. 流式接收上传数据，文件直接写入上传目录
+    try:
+        form, files, ingest_stats = ingest_multipart(request, UPLOAD_FOLDER, UPLOAD_FILE_FIELDS)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except ValueError as e:
+        return jsonify({'error': f'上传数据格式错误: {e}'}), 400
+
+    print(f"[INFO] 接收上传数据 {ingest_stats['bytes'] / 1024 / 1024:.1f}MB，"
+          f"耗时 {ingest_stats['seconds']}s，吞吐 {ingest_stats['mbps']}MB/s")
+
+    # 轨迹文件读取后即删除，只保存转换后的二进制格式
+    trajectory_data = {}
+    trajectory_file = files.pop('trajectory', None)
+    if trajectory_file:
+        try:
+            with open(trajectory_file['path'], 'r', encoding='utf-8') as f:
+                trajectory_data = json.load(f)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            discard_ingested(files)
+            return jsonify({'error': '轨迹文件不是有效的 JSON'}), 400
+        finally:
+            os.unlink(trajectory_file['path'])
+        if not isinstance(trajectory_data, dict):
+            discard_ingested(files)
+            return jsonify({'error': '轨迹文件不是有效的 JSON'}), 400
+
+    # 检查必须的录屏文件
+    if 'screen_recording' not in files:
+        discard_ingested(files)
         return jsonify({'error': '缺少录屏文件'}), 400
 
-    screen_recording_file = request.files['screen_recording']
+    # 2. 保存元数据（状态变化记录，仅用于前端参考）
+    if 'audio_state_changes' in form:
+        try:
+            trajectory_data['audioStateChanges'] = json.loads(form['audio_state_changes'])
+        except json.JSONDecodeError:
+            pass
     
-    # 2. 生成唯一ID（使用录屏文件前4KB + 时间戳）
-    chunk = screen_recording_file.read(4096)
-    screen_recording_file.seek(0)
-    hash_content = chunk + str(time.time()).encode('utf-8')
-    hash_id = hashlib.sha256(hash_content).hexdigest()[:12]
+    if 'camera_state_changes' in form:
+        try:
+            trajectory_data['cameraStateChanges'] = json.loads(form['camera_state_changes'])
+        except json.JSONDecodeError:
+            pass
 
-    # 3. 检查是否已存在
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    existing = cursor.execute('SELECT * FROM recordings WHERE id = ?', (hash_id,)).fetchone()
-    
-    if existing:
-        conn.close()
-        return jsonify({'hashid': hash_id, 'message': '录音已存在'})
+    # 3. 根据各文件和轨迹数据的完整内容哈希生成 ID，相同内容的重复上传得到相同的 ID
+    hash_id = content_id({field: info['sha256'] for field, info in files.items()}, trajectory_data)
 
-    # 4. 保存录屏文件
-    screen_recording_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_screen.webm')
-    screen_recording_file.save(screen_recording_path)
-    print(f"[INFO] 录屏文件已保存: {screen_recording_path}")
+    # 4. 检查是否已存在
+    if get_cached_recording(hash_id):
+        discard_ingested(files)
+        return jsonify({'hashid': hash_id, 'message': '录音已存在', 'processing': get_job_status(hash_id)})
 
     # 5. 获取总时长
     total_duration = 0
-    if 'total_duration' in request.form:
+    if 'total_duration' in form:
         try:
-            total_duration = float(request.form['total_duration'])
+            total_duration = float(form['total_duration'])
         except ValueError:
             pass
     
     # 如果没有传递总时长，从录屏文件获取
     if total_duration <= 0:
         try:
-            total_duration = get_file_duration(screen_recording_path)
+            total_duration = get_file_duration(files['screen_recording']['path'])
             print(f"[INFO] 从录屏文件获取时长: {total_duration}ms")
         except Exception as e:
             print(f"[WARN] 获取录屏时长失败: {e}")
             total_duration = 0
 
-    # 6. 处理音频文件（可选）
-    audio_path = None
-    if 'audio' in request.files:
-        audio_file = request.files['audio']
-        if audio_file.filename and audio_file.filename != '':
-            audio_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}.webm')
-            audio_file.save(audio_path)
-            print(f"[INFO] 音频文件已保存: {audio_path}")
-
-    # 7. 处理摄像头文件（可选）
-    webcam_recording_path = None
-    if 'webcam_recording' in request.files:
-        webcam_file = request.files['webcam_recording']
-        if webcam_file.filename and webcam_file.filename != '':
-            webcam_recording_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_webcam.webm')
-            webcam_file.save(webcam_recording_path)
-            print(f"[INFO] 摄像头文件已保存: {webcam_recording_path}")
-
-    # 8. 生成字幕（如果有音频）
-    subtitle_path = None
-    if audio_path:
-        subtitle_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_subtitle.vtt')
-        try:
-            generate_vtt(audio_path, subtitle_path)
-            print(f"[INFO] 字幕文件已生成: {subtitle_path}")
-        except Exception as e:
-            print(f"[WARN] 生成字幕失败: {e}")
-            subtitle_path = None
+    # 6. 文件存入内容寻址存储，保存到数据库并入队后台处理任务（生成字幕 + 合并音频），立即返回
+    try:
+        blobs = register_recording(hash_id, files, trajectory_data, total_duration)
+    except sqlite3.IntegrityError:
+        # 相同内容的并发上传已经先一步注册
+        discard_ingested(files)
+        return jsonify({'hashid': hash_id, 'message': '录音已存在', 'processing': get_job_status(hash_id)})
 
-    # 9. 合并音频到录屏视频（如果有音频）
-    final_video_path = screen_recording_path  # 默认使用原始录屏
-    if audio_path:
-        merged_video_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_merged.webm')
-        try:
-            success = combine_video_with_audio(screen_recording_path, audio_path, merged_video_path)
-            if success and os.path.exists(merged_video_path):
-                final_video_path = merged_video_path
-                print(f"[INFO] 音频已合并到视频: {final_video_path}")
-            else:
-                print(f"[WARN] 合并音频失败，使用原始录屏")
-        except Exception as e:
-            print(f"[WARN] 合并音频失败: {e}，使用原始录屏")
+    print(f"[INFO] 上传完成, hashid: {hash_id}，已加入处理队列")
+    return jsonify({
+        'hashid': hash_id,
+        'message': '上传成功',
+        'processing': get_job_status(hash_id),
+        'ingest': ingest_stats,
+        'deduplicated': [field for field, blob in blobs.items() if blob['deduplicated']]
+    })
 
-    # 10. 保存元数据（状态变化记录，仅用于前端参考）
-    trajectory_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}.json')
-    trajectory_data = {}
-    
-    if 'audio_state_changes' in request.form:
-        try:
-            trajectory_data['audioStateChanges'] = json.loads(request.form['audio_state_changes'])
-        except json.JSONDecodeError:
-            pass
-    
-    if 'camera_state_changes' in request.form:
-        try:
-            trajectory_data['cameraStateChanges'] = json.loads(request.form['camera_state_changes'])
-        except json.JSONDecodeError:
-            pass
-    
-    with open(trajectory_path, 'w', encoding='utf-8') as f:
-        json.dump(trajectory_data, f, ensure_ascii=False, indent=2)
-
-    # 11. 保存到数据库（使用合并后的视频路径）
-    cursor.execute(
-        '''INSERT INTO recordings 
-           (id, trajectory_path, audio_path, screen_recording_path, webcam_recording_path, subtitle_path, created_at) 
-           VALUES (?, ?, ?, ?, ?, ?, ?)''',
-        (hash_id, trajectory_path, audio_path, final_video_path, webcam_recording_path, subtitle_path, int(time.time() * 1000))
-    )
-    
-    # 同时创建 recording_sessions 记录（用于存储时长）
-    cursor.execute(
-        '''INSERT INTO recording_sessions 
-           (session_id, created_at, status, total_duration) 
-           VALUES (?, ?, ?, ?)''',
-        (hash_id, int(time.time() * 1000), 'completed', total_duration)
-    )
-    
-    # 更新 recordings 表的 session_id
-    cursor.execute(
-        'UPDATE recordings SET session_id = ? WHERE id = ?',
-        (hash_id, hash_id)
-    )
 
-    conn.commit()
-    conn.close()
+def _parse_flag(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} 必须为 true 或 false')
 
-    print(f"[INFO] 上传完成, hashid: {hash_id}")
-    return jsonify({'hashid': hash_id, 'message': '上传成功'})
 
+def _parse_number(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} 必须为数字')
 
-@bp.route('/recordings/<hashid>', methods=['GET'])
-def get_recording(hashid):
+
+def _parse_int(name, minimum):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise ValueError(f'{name} 必须为不小于 {minimum} 的整数')
+    return number
+
+
+def _encode_cursor(created_at, hash_id):
+    return base64.urlsafe_b64encode(f'{created_at}:{hash_id}'.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, hash_id = base64.urlsafe_b64decode(padded).decode('utf-8').split(':', 1)
+        return int(created_at), hash_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('cursor 不合法')
+
+
+def _filter_conditions():
     """
-    获取录制详情
+    根据查询参数生成录制过滤条件（录制列表和批量导出共用）
+
+    Returns:
+        (SQL 条件列表, 参数列表)，表别名 r 为 recordings、rs 为 recording_sessions
+
+    Raises:
+        ValueError: 参数不合法
+    """
+    conditions = []
+    params = []
+
+    has_subtitle = _parse_flag('has_subtitle')
+    if has_subtitle is not None:
+        conditions.append('r.subtitle_path IS NOT NULL' if has_subtitle else 'r.subtitle_path IS NULL')
+
+    has_webcam = _parse_flag('has_webcam')
+    if has_webcam is not None:
+        conditions.append('r.webcam_recording_path IS NOT NULL' if has_webcam else 'r.webcam_recording_path IS NULL')
+
+    for name, condition in (
+        ('min_duration', 'rs.total_duration >= ?'),
+        ('max_duration', 'rs.total_duration <= ?'),
+    ):
+        value = _parse_number(name)
+        if value is not None:
+            conditions.append(condition)
+            params.append(value * 1000)
+
+    for name, condition in (
+        ('created_after', 'r.created_at >= ?'),
+        ('created_before', 'r.created_at <= ?'),
+    ):
+        value = _parse_number(name)
+        if value is not None:
+            conditions.append(condition)
+            params.append(int(value))
+    return conditions, params
+
+
+@bp.route('/recordings', methods=['GET'])
+def list_recordings():
+    """
+    分页获取录制列表（按创建时间倒序）
+
+    查询参数（均可选）：
+    - limit: 每页数量，默认 20，最大 100
+    - cursor: 上一页返回的 nextCursor
+    - has_subtitle / has_webcam: true / false
+    - min_duration / max_duration: 时长范围（秒）
+    - created_after / created_before: 创建时间范围（毫秒时间戳，闭区间）
+    - fields: 逗号分隔的返回字段，默认返回全部
+
+    使用 (created_at, id) 键集分页，翻页开销与页码无关。响应带 ETag，内容未变化时返回 304。
     """
+    try:
+        limit = min(max(int(request.args.get('limit', LIST_DEFAULT_LIMIT)), 1), LIST_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit 必须为整数'}), 400
+
+    fields = LIST_FIELDS
+    if request.args.get('fields'):
+        fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+        unknown_fields = set(fields) - set(LIST_FIELDS)
+        if unknown_fields:
+            return jsonify({'error': f'不支持的字段: {", ".join(sorted(unknown_fields))}'}), 400
+
+    try:
+        conditions, params = _filter_conditions()
+        if request.args.get('cursor'):
+            conditions.append('(r.created_at, r.id) < (?, ?)')
+            params.extend(_decode_cursor(request.args['cursor']))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
     conn = get_db_connection()
-    recording = conn.execute('''
-        SELECT r.*, rs.total_duration
+    rows = conn.execute(f'''
+        SELECT r.id, r.created_at, r.screen_recording_path, r.webcam_recording_path, r.subtitle_path,
+               rs.total_duration
         FROM recordings r
         LEFT JOIN recording_sessions rs ON r.session_id = rs.session_id
-        WHERE r.id = ?
-    ''', (hashid,)).fetchone()
+        {where}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT ?
+    ''', (*params, limit + 1)).fetchall()
     conn.close()
 
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+    items = []
+    for row in rows:
+        item = {
+            'hashid': row['id'],
+            'createdAt': row['created_at'],
+            'duration': row['total_duration'] / 1000 if row['total_duration'] else 0,
+            'hasScreenRecording': row['screen_recording_path'] is not None,
+            'hasWebcamRecording': row['webcam_recording_path'] is not None,
+            'hasSubtitle': row['subtitle_path'] is not None,
+        }
+        items.append({field: item[field] for field in fields})
+
+    response = jsonify({'items': items, 'nextCursor': next_cursor})
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@bp.route('/recordings/cache-stats', methods=['GET'])
+def get_cache_stats():
+    """
+    获取录制元数据缓存的命中率（当前进程）
+    """
+    return jsonify(get_recording_cache_stats())
+
+
+@bp.route('/recordings/<hashid>', methods=['GET'])
+def get_recording(hashid):
+    """
+    获取录制详情
+
+    查询参数：
+    - trajectory: false 时不内嵌轨迹数据，播放端改为通过 trajectoryUrl 按时间窗口读取
+    """
+    try:
+        include_trajectory = _parse_flag('trajectory') is not False
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    recording = get_cached_recording(hashid)
+
     if not recording:
         return jsonify({'error': '未找到录音'}), 404
 
     # 读取轨迹文件内容
     trajectory_content = {}
-    if recording['trajectory_path'] and os.path.exists(recording['trajectory_path']):
+    if include_trajectory and recording['trajectory_path'] and os.path.exists(recording['trajectory_path']):
         try:
-            with open(recording['trajectory_path'], 'r', encoding='utf-8') as f:
-                trajectory_content = json.load(f)
-        except:
-            pass
+            trajectory_content = read_trajectory(recording['trajectory_path'])
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"[WARN] 读取轨迹文件失败: {recording['trajectory_path']}: {e}")
 
-    # 安全获取可能不存在的字段
-    subtitled_video_path = None
-    try:
-        subtitled_video_path = recording['subtitled_video_path']
-    except (KeyError, IndexError):
-        pass
+    subtitled_video_path = recording['subtitled_video_path']
+
+    # 被访问的派生产物刷新最近使用时间，避免被缓存淘汰
+    touch_artifacts([recording['subtitle_path'], recording['screen_recording_path'], subtitled_video_path])
 
     return jsonify({
         'hashid': recording['id'],
         'trajectory': trajectory_content,
+        'trajectoryUrl': f'/api/recordings/{hashid}/trajectory' if recording['trajectory_path'] else None,
         'audioUrl': f'/api/recordings/{hashid}/audio' if recording['audio_path'] else None,
         'screenRecordingUrl': f'/api/recordings/{hashid}/screen' if recording['screen_recording_path'] else None,
         'webcamRecordingUrl': f'/api/recordings/{hashid}/webcam' if recording['webcam_recording_path'] else None,
         'subtitleUrl': f'/api/recordings/{hashid}/subtitle' if recording['subtitle_path'] else None,
         'subtitledVideoUrl': f'/api/recordings/{hashid}/subtitled-video' if subtitled_video_path else None,
         'createdAt': recording['created_at'],
-        'duration': recording['total_duration'] / 1000 if recording['total_duration'] else 0
+        'duration': recording['total_duration'] / 1000 if recording['total_duration'] else 0,
+        'media': {
+            kind: {'size': asset['size'], 'duration': asset['duration'], 'codec': asset['codec']}
+            for kind, asset in get_media_assets(hashid).items()
+        },
+        'processing': get_job_status(hashid)
     })
 
 
+@bp.route('/recordings/<hashid>', methods=['DELETE'])
+def remove_recording(hashid):
+    """
+    删除录制，原始媒体文件不再被任何录制引用时一并删除
+    """
+    if not delete_recording(hashid):
+        return jsonify({'error': '未找到录制数据'}), 404
+    return jsonify({'message': '录制数据已删除'})
+
+
+@bp.route('/recordings/<hashid>/trajectory', methods=['GET'])
+def get_trajectory(hashid):
+    """
+    按时间窗口获取轨迹数据
+
+    查询参数（均可选）：
+    - from / to: 时间窗口（毫秒，与轨迹中的 timestamp 相同的时间基准，含端点）
+    - series: 逗号分隔的字段名，如 mouse,whiteboard
+    - format: json（默认）或 ndjson
+    - level: 鼠标点的简化层级，0（默认）为原始数据，数字越大越稀疏
+    - max_points: 每个鼠标点序列最多返回的点数，自动选择合适的层级（优先于 level），用于缩略图和拖动预览
+
+    只解压与窗口重叠的数据块（块的时间索引随文件保存并缓存在内存中，按二分查找定位）。
+    ndjson 模式按时间顺序逐行输出 {"series": 名称, "event": 事件}，不带时间戳的字段输出为
+    {"series": 名称, "value": 值} 并排在最前，客户端可以边接收边播放。
+    """
+    try:
+        start = _parse_number('from')
+        end = _parse_number('to')
+        level = _parse_int('level', minimum=0) or 0
+        max_points = _parse_int('max_points', minimum=1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    output_format = request.args.get('format', 'json')
+    if output_format not in ('json', 'ndjson'):
+        return jsonify({'error': 'format 必须为 json 或 ndjson'}), 400
+    series = request.args.get('series')
+    series = {name.strip() for name in series.split(',') if name.strip()} if series else None
+
+    recording = get_cached_recording(hashid)
+    if not recording or not recording['trajectory_path']:
+        return jsonify({'error': '未找到轨迹文件'}), 404
+    path = recording['trajectory_path']
+    if not os.path.exists(path):
+        return jsonify({'error': '轨迹文件不存在'}), 404
+
+    try:
+        if output_format == 'json':
+            response = jsonify(read_trajectory(path, start, end, series, level, max_points))
+            response.add_etag()
+            return response.make_conditional(request)
+        extra, events = iter_trajectory(path, start, end, series, level, max_points)
+    except (ValueError, zlib.error) as e:
+        print(f"[WARN] 读取轨迹文件失败: {path}: {e}")
+        return jsonify({'error': '轨迹文件已损坏'}), 500
+
+    def generate():
+        for name, value in extra.items():
+            yield json.dumps({'series': name, 'value': value}, ensure_ascii=False) + '\n'
+        for name, event in events:
+            yield json.dumps({'series': name, 'event': event}, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @bp.route('/recordings/<hashid>/audio', methods=['GET'])
 def get_audio(hashid):
     """
     获取音频文件
     """
-    conn = get_db_connection()
-    recording = conn.execute('SELECT audio_path FROM recordings WHERE id = ?', (hashid,)).fetchone()
-    conn.close()
+    recording = get_cached_recording(hashid)
 
     if not recording or not recording['audio_path']:
         return jsonify({'error': '未找到音频文件'}), 404
@@ -257,7 +473,7 @@ def get_audio(hashid):
     if not os.path.exists(recording['audio_path']):
         return jsonify({'error': '音频文件丢失'}), 404
 
-    return send_file(recording['audio_path'], mimetype='audio/webm')
+    return send_media_file(recording['audio_path'], 'audio/webm')
 
 
 @bp.route('/recordings/<hashid>/screen', methods=['GET'])
@@ -265,9 +481,7 @@ def get_screen_recording(hashid):
     """
     获取录屏文件
     """
-    conn = get_db_connection()
-    recording = conn.execute('SELECT screen_recording_path FROM recordings WHERE id = ?', (hashid,)).fetchone()
-    conn.close()
+    recording = get_cached_recording(hashid)
 
     if not recording or not recording['screen_recording_path']:
         return jsonify({'error': '未找到录屏文件'}), 404
@@ -275,7 +489,7 @@ def get_screen_recording(hashid):
     if not os.path.exists(recording['screen_recording_path']):
         return jsonify({'error': '录屏文件丢失'}), 404
 
-    return send_file(recording['screen_recording_path'], mimetype='video/webm')
+    return send_media_file(recording['screen_recording_path'], 'video/webm')
 
 
 @bp.route('/recordings/<hashid>/webcam', methods=['GET'])
@@ -283,9 +497,7 @@ def get_webcam_recording(hashid):
     """
     获取摄像头录制文件
     """
-    conn = get_db_connection()
-    recording = conn.execute('SELECT webcam_recording_path FROM recordings WHERE id = ?', (hashid,)).fetchone()
-    conn.close()
+    recording = get_cached_recording(hashid)
 
     if not recording or not recording['webcam_recording_path']:
         return jsonify({'error': '未找到摄像头录制文件'}), 404
@@ -293,7 +505,7 @@ def get_webcam_recording(hashid):
     if not os.path.exists(recording['webcam_recording_path']):
         return jsonify({'error': '摄像头录制文件丢失'}), 404
 
-    return send_file(recording['webcam_recording_path'], mimetype='video/webm')
+    return send_media_file(recording['webcam_recording_path'], 'video/webm')
 
 
 @bp.route('/recordings/<hashid>/subtitle', methods=['GET'])
@@ -301,9 +513,7 @@ def get_subtitle(hashid):
     """
     获取字幕文件
     """
-    conn = get_db_connection()
-    recording = conn.execute('SELECT subtitle_path FROM recordings WHERE id = ?', (hashid,)).fetchone()
-    conn.close()
+    recording = get_cached_recording(hashid)
 
     if not recording or not recording['subtitle_path']:
         return jsonify({'error': '未找到字幕文件'}), 404
@@ -311,105 +521,215 @@ def get_subtitle(hashid):
     if not os.path.exists(recording['subtitle_path']):
         return jsonify({'error': '字幕文件丢失'}), 404
 
-    return send_file(recording['subtitle_path'], mimetype='text/vtt')
+    return send_media_file(recording['subtitle_path'], 'text/vtt')
 
 
 @bp.route('/recordings/<hashid>/subtitled-video', methods=['GET'])
 def get_subtitled_video(hashid):
     """
     获取带字幕的视频（懒生成）
+
+    同一录制的并发请求共享同一个生成任务。生成在 LAZY_BUILD_WAIT_SECONDS 内完成时直接返回视频，
+    否则返回 202 和状态查询地址，客户端稍后重新请求即可。
     """
-    conn = get_db_connection()
-    recording = conn.execute('SELECT * FROM recordings WHERE id = ?', (hashid,)).fetchone()
+    recording = get_cached_recording(hashid)
     
     if not recording:
-        conn.close()
         return jsonify({'error': '未找到录音'}), 404
 
     # 如果已经有带字幕的视频，直接返回
     if recording['subtitled_video_path'] and os.path.exists(recording['subtitled_video_path']):
-        conn.close()
-        return send_file(recording['subtitled_video_path'], mimetype='video/webm')
+        return send_media_file(recording['subtitled_video_path'], 'video/webm')
 
-    # 检查是否有字幕文件
-    if not recording['subtitle_path'] or not os.path.exists(recording['subtitle_path']):
-        conn.close()
-        return jsonify({'error': '没有字幕文件，无法生成带字幕的视频'}), 400
+    # 没有字幕文件时需要有音频才能生成
+    subtitle_path = recording['subtitle_path']
+    if not subtitle_path or not os.path.exists(subtitle_path):
+        if not recording['audio_path'] or not os.path.exists(recording['audio_path']):
+            return jsonify({'error': '没有字幕文件，无法生成带字幕的视频'}), 400
 
     # 检查是否有录屏文件
     if not recording['screen_recording_path'] or not os.path.exists(recording['screen_recording_path']):
-        conn.close()
         return jsonify({'error': '没有录屏文件'}), 400
 
-    # 生成带字幕的视频
-    subtitled_video_path = os.path.join(UPLOAD_FOLDER, f'{hashid}_subtitled.webm')
-    
+    build = submit_subtitled_video(hashid)
     try:
-        # 如果有音频，先合并音频
-        if recording['audio_path'] and os.path.exists(recording['audio_path']):
-            temp_with_audio = os.path.join(UPLOAD_FOLDER, f'{hashid}_temp_with_audio.webm')
-            combine_video_with_audio(recording['screen_recording_path'], recording['audio_path'], temp_with_audio)
-            
-            # 再添加字幕
-            combine_video_with_subtitle(temp_with_audio, recording['subtitle_path'], subtitled_video_path)
-            
-            # 删除临时文件
-            if os.path.exists(temp_with_audio):
-                os.unlink(temp_with_audio)
-        else:
-            # 直接添加字幕
-            combine_video_with_subtitle(recording['screen_recording_path'], recording['subtitle_path'], subtitled_video_path)
-        
-        # 更新数据库
-        cursor = conn.cursor()
-        cursor.execute('UPDATE recordings SET subtitled_video_path = ? WHERE id = ?', (subtitled_video_path, hashid))
-        conn.commit()
-        conn.close()
-        
-        return send_file(subtitled_video_path, mimetype='video/webm')
+        subtitled_video_path = build['future'].result(timeout=LAZY_BUILD_WAIT_SECONDS)
+    except FutureTimeoutError:
+        status_url = f'/api/recordings/{hashid}/subtitled-video/status'
+        response = jsonify({
+            'hashid': hashid,
+            'status': 'building',
+            'startedAt': build['startedAt'],
+            'statusUrl': status_url,
+        })
+        response.status_code = 202
+        response.headers['Location'] = status_url
+        response.headers['Retry-After'] = '5'
+        return response
     except Exception as e:
-        conn.close()
-        return jsonify({'error': f'生成带字幕视频失败: {str(e)}'}), 500
+        return jsonify({'error': str(e)}), 500
+
+    return send_media_file(subtitled_video_path, 'video/webm')
+
+
+@bp.route('/recordings/<hashid>/subtitled-video/status', methods=['GET'])
+def get_subtitled_video_status(hashid):
+    """
+    查询带字幕视频的生成状态：ready / building / failed / none
+    """
+    recording = get_cached_recording(hashid)
+
+    if not recording:
+        return jsonify({'error': '未找到录音'}), 404
+
+    if recording['subtitled_video_path'] and os.path.exists(recording['subtitled_video_path']):
+        return jsonify({'hashid': hashid, 'status': 'ready', 'url': f'/api/recordings/{hashid}/subtitled-video'})
+
+    build = get_subtitled_video_build(hashid)
+    if build is None:
+        return jsonify({'hashid': hashid, 'status': 'none'})
+    return jsonify({'hashid': hashid, **build})
 
 
 @bp.route('/recordings/<hashid>/download', methods=['GET'])
 def download_recording(hashid):
     """
-    下载录制文件（打包成zip）
+    下载录制文件（流式打包成zip，边读边发送，不生成临时文件）
     """
-    import zipfile
-    import tempfile
-    
-    conn = get_db_connection()
-    recording = conn.execute('SELECT * FROM recordings WHERE id = ?', (hashid,)).fetchone()
-    conn.close()
+    recording = get_cached_recording(hashid)
 
     if not recording:
         return jsonify({'error': '未找到录音'}), 404
 
-    # 创建临时zip文件
-    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-    
-    with zipfile.ZipFile(temp_zip.name, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 添加录屏文件
-        if recording['screen_recording_path'] and os.path.exists(recording['screen_recording_path']):
-            zf.write(recording['screen_recording_path'], f'{hashid}_screen.webm')
-        
-        # 添加音频文件
-        if recording['audio_path'] and os.path.exists(recording['audio_path']):
-            zf.write(recording['audio_path'], f'{hashid}_audio.webm')
-        
-        # 添加摄像头文件
-        if recording['webcam_recording_path'] and os.path.exists(recording['webcam_recording_path']):
-            zf.write(recording['webcam_recording_path'], f'{hashid}_webcam.webm')
-        
-        # 添加字幕文件
-        if recording['subtitle_path'] and os.path.exists(recording['subtitle_path']):
-            zf.write(recording['subtitle_path'], f'{hashid}_subtitle.vtt')
-
-    return send_file(
-        temp_zip.name,
+    return Response(
+        stream_with_context(stream_zip(_recording_zip_entries(hashid, recording))),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=recording_{hashid}.zip'}
+    )
+
+
+def _recording_zip_entries(hashid, recording, folder=''):
+    """
+    一个录制在 zip 中的条目：录屏、音频、摄像头、字幕
+
+    Args:
+        folder: 条目所在的目录（批量导出时为 hashid/）
+    """
+    files = [
+        ('screen_recording_path', f'{hashid}_screen.webm'),
+        ('audio_path', f'{hashid}_audio.webm'),
+        ('webcam_recording_path', f'{hashid}_webcam.webm'),
+        ('subtitle_path', f'{hashid}_subtitle.vtt'),
+    ]
+    return [
+        {'name': folder + name, 'path': recording[column]}
+        for column, name in files
+        if recording[column] and os.path.exists(recording[column])
+    ]
+
+
+def _manifest_file(entry, assets):
+    """
+    导出清单中的一个文件，大小、时长、编码和 sha256 取自 media_assets
+    """
+    asset = assets.get(entry['path'], {})
+    return {
+        'name': entry['name'],
+        'kind': asset.get('kind'),
+        'size': asset.get('size') or os.path.getsize(entry['path']),
+        'duration': asset.get('duration'),
+        'codec': asset.get('codec'),
+        'sha256': asset.get('sha256'),
+    }
+
+
+@bp.route('/recordings/export', methods=['POST'])
+def export_recordings():
+    """
+    批量导出录制（流式打包成一个 zip）
+
+    请求体（JSON，可选）：
+    - hashids: 要导出的录制 ID 列表
+    - manifest: 是否包含 manifest.json（各文件的大小、时长、编码和 sha256），默认 true
+
+    查询参数：与 GET /api/recordings 相同的过滤条件（has_subtitle、has_webcam、min_duration、
+    max_duration、created_after、created_before）。hashids 与过滤条件至少指定一个，同时指定时取交集。
+
+    每个录制的文件放在以 hashid 命名的目录下。文件按大块顺序读取，后续录制的文件在后台线程中
+    提前读取，读盘与打包发送重叠进行。
+    """
+    body = request.get_json(silent=True) or {}
+    hashids = body.get('hashids')
+    if hashids is not None and (
+        not isinstance(hashids, list) or not hashids or not all(isinstance(hash_id, str) for hash_id in hashids)
+    ):
+        return jsonify({'error': 'hashids 必须为非空的字符串列表'}), 400
+    include_manifest = body.get('manifest', True) is not False
+
+    try:
+        conditions, params = _filter_conditions()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if hashids is None and not conditions:
+        return jsonify({'error': '请指定 hashids 或过滤条件'}), 400
+
+    filtered = bool(conditions)
+    if hashids is not None:
+        hashids = list(dict.fromkeys(hashids))
+        if len(hashids) > EXPORT_MAX_RECORDINGS:
+            return jsonify({'error': f'一次最多导出 {EXPORT_MAX_RECORDINGS} 个录制'}), 400
+        conditions.append(f"r.id IN ({', '.join('?' * len(hashids))})")
+        params.extend(hashids)
+
+    conn = get_db_connection()
+    recordings = conn.execute(f'''
+        SELECT r.*, rs.total_duration
+        FROM recordings r
+        LEFT JOIN recording_sessions rs ON r.session_id = rs.session_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY r.created_at, r.id
+        LIMIT ?
+    ''', (*params, EXPORT_MAX_RECORDINGS + 1)).fetchall()
+    conn.close()
+
+    if len(recordings) > EXPORT_MAX_RECORDINGS:
+        return jsonify({'error': f'符合条件的录制超过 {EXPORT_MAX_RECORDINGS} 个，请缩小范围'}), 400
+    if hashids is not None and not filtered:
+        missing = set(hashids) - {recording['id'] for recording in recordings}
+        if missing:
+            return jsonify({'error': '部分录制不存在', 'missing': sorted(missing)}), 404
+    if not recordings:
+        return jsonify({'error': '没有符合条件的录制'}), 404
+
+    entries = []
+    manifest = []
+    for recording in recordings:
+        hash_id = recording['id']
+        recording_entries = _recording_zip_entries(hash_id, recording, folder=f'{hash_id}/')
+        entries.extend(recording_entries)
+        if include_manifest:
+            assets = {asset['path']: asset for asset in get_media_assets(hash_id).values()}
+            manifest.append({
+                'hashid': hash_id,
+                'createdAt': recording['created_at'],
+                'duration': recording['total_duration'] / 1000 if recording['total_duration'] else 0,
+                'files': [_manifest_file(entry, assets) for entry in recording_entries],
+            })
+
+    if include_manifest:
+        entries.insert(0, {
+            'name': 'manifest.json',
+            'data': json.dumps({'exportedAt': int(time.time() * 1000), 'recordings': manifest},
+                               ensure_ascii=False, indent=2).encode('utf-8'),
+        })
+
+    chunk_size = EXPORT_READ_BUFFER_MB * 1024 * 1024
+    files = prefetch_files(entries, EXPORT_READ_WORKERS, chunk_size, EXPORT_PREFETCH_CHUNKS)
+    return Response(
+        stream_with_context(stream_zip(files, chunk_size)),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name=f'recording_{hashid}.zip'
+        headers={
+            'Content-Disposition': f'attachment; filename=recordings_export_{time.strftime("%Y%m%d_%H%M%S")}.zip',
+            'X-Export-Count': str(len(recordings)),
+        }
     )
@@ -1,14 +1,18 @@
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, send_file
 from dao.database import get_db_connection
 from utils.subtitle import generate_vtt
-from utils.combine_video import combine_video_with_subtitle, combine_video_with_audio
+from utils.media_response import send_media_file
+from utils.media_probe import probe_media
+from utils.track_assembly import TRACKS, assemble_session
+from utils.live_assembly import append_segment, finalize_track
+from utils.smart_cut import cut_track
+from utils.filler_cache import compose_filler
 import os
 import hashlib
 import time
 import json
 import zipfile
 import tempfile
-import subprocess
 import ffmpeg
 
 # 创建蓝图
@@ -21,52 +25,36 @@ bp = Blueprint('recordings', __name__)
 # 所以 uploads 目录在 backend/uploads
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
 
-# 确保FFmpeg可用
-FFMPEG_PATH = 'ffmpeg'  # 假设FFmpeg已经安装并在PATH中
-
 def get_file_duration(file_path):
     """
     获取媒体文件的持续时间（毫秒）- 使用 ffmpeg-python
     """
-    print(f"[DEBUG] get_file_duration: 尝试获取文件时长: {file_path}")
-    
     # 检查文件是否存在
     if not os.path.exists(file_path):
         raise Exception(f'文件不存在: {file_path}')
     
     # 检查文件大小
     file_size = os.path.getsize(file_path)
-    print(f"[DEBUG] get_file_duration: 文件大小: {file_size} bytes")
     
     if file_size == 0:
         raise Exception(f'文件为空: {file_path}')
     
     try:
-        # 使用 ffmpeg-python 获取文件信息
-        probe = ffmpeg.probe(file_path)
-        print(f"[DEBUG] get_file_duration: probe结果: {json.dumps(probe.get('format', {}), indent=2)}")
-        
-        # 从 format 中获取时长
-        duration_str = probe.get('format', {}).get('duration')
-        if duration_str:
-            duration_seconds = float(duration_str)
-            print(f"[DEBUG] get_file_duration: 成功获取时长: {duration_seconds}秒 ({duration_seconds * 1000}毫秒)")
-            return duration_seconds * 1000
-        
-        # 备用：从 streams 中获取时长
-        streams = probe.get('streams', [])
-        for stream in streams:
-            if 'duration' in stream:
-                duration_seconds = float(stream['duration'])
-                print(f"[DEBUG] get_file_duration: 从stream获取时长: {duration_seconds}秒")
-                return duration_seconds * 1000
-        
-        raise Exception('无法从probe结果中获取时长')
-        
+        # 探测结果按文件缓存，同一文件重复获取时长不会再次调用 ffprobe
+        duration = probe_media(file_path)['duration']
     except ffmpeg.Error as e:
-        print(f"[DEBUG] get_file_duration: ffmpeg-python错误: {e.stderr.decode() if e.stderr else str(e)}")
         raise Exception(f'获取文件时长失败: {e}')
 
+    if duration is None:
+        raise Exception('无法从probe结果中获取时长')
+    return duration
+
+def get_track_output_path(session_id, track):
+    """
+    获取会话轨道最终输出文件的路径
+    """
+    return os.path.join(UPLOAD_FOLDER, session_id, 'output', f'{session_id}_final_{track}.webm')
+
 def process_recording(session_id):
     """
     处理录制会话的所有分段数据，合成为完整的视频和音频文件
@@ -85,180 +73,38 @@ def process_recording(session_id):
         conn.close()
         raise Exception('没有找到任何分段数据')
     
-    # 分离不同类型的分段
-    screen_segments = []
-    camera_segments = []
-    audio_segments = []
-    
-    for segment in segments:
-        segment_type, start_time, end_time, file_path = segment
-        if segment_type == 'screen':
-            screen_segments.append({'start': start_time, 'end': end_time, 'path': file_path})
-        elif segment_type == 'camera':
-            camera_segments.append({'start': start_time, 'end': end_time, 'path': file_path})
-        elif segment_type == 'audio':
-            audio_segments.append({'start': start_time, 'end': end_time, 'path': file_path})
+    # 按轨道分组
+    track_segments = {}
+    for segment_type, start_time, end_time, file_path in segments:
+        if segment_type in TRACKS:
+            track_segments.setdefault(segment_type, []).append({'start': start_time, 'end': end_time, 'path': file_path})
     
     # 计算总时长（以最长的结束时间为准）
-    total_duration = max(
-        max(seg['end'] for seg in screen_segments) if screen_segments else 0,
-        max(seg['end'] for seg in camera_segments) if camera_segments else 0,
-        max(seg['end'] for seg in audio_segments) if audio_segments else 0
-    )
+    total_duration = max((seg['end'] for track in track_segments.values() for seg in track), default=0)
     
     if total_duration == 0:
         conn.close()
         raise Exception('总时长为0，无法合成')
     
     # 创建输出目录
-    output_folder = os.path.join(UPLOAD_FOLDER, session_id, 'output')
-    os.makedirs(output_folder, exist_ok=True)
-    
-    # 合成屏幕视频
-    final_screen_path = os.path.join(output_folder, f'{session_id}_final_screen.webm')
-    if screen_segments:
-        # 为屏幕视频创建 concat 文件
-        screen_concat_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-        
-        # 添加第一段
-        prev_end = 0
-        for i, seg in enumerate(screen_segments):
-            # 如果当前分段和上一段之间有间隙，添加黑屏填充
-            if i > 0 and seg['start'] > prev_end:
-                # 添加黑屏视频，持续时间为间隙时长
-                gap_duration = (seg['start'] - prev_end) / 1000  # 转换为秒
-                # 使用FFmpeg生成黑屏视频
-                black_screen_file = os.path.join(output_folder, f'black_screen_{i}.webm')
-                cmd = [
-                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=black:s=1280x720:r=30',
-                    '-t', str(gap_duration), '-c:v', 'libvpx-vp9', '-b:v', '2M', '-y', black_screen_file
-                ]
-                subprocess.run(cmd, check=True, capture_output=True)
-                
-                # 添加到concat文件
-                screen_concat_file.write(f"file '{black_screen_file}'\n")
-            
-            # 添加当前分段
-            screen_concat_file.write(f"file '{seg['path']}'\n")
-            prev_end = seg['end']
-        
-        screen_concat_file.close()
-        
-        # 使用FFmpeg合并所有屏幕分段
-        cmd = [
-            FFMPEG_PATH, '-f', 'concat', '-safe', '0', '-i', screen_concat_file.name,
-            '-c', 'copy', '-y', final_screen_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
-        
-        # 删除临时文件
-        os.unlink(screen_concat_file.name)
-    else:
-        # 如果没有屏幕视频，生成完整的黑屏视频
-        cmd = [
-            FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=black:s=1280x720:r=30',
-            '-t', str(total_duration / 1000), '-c:v', 'libvpx-vp9', '-b:v', '2M', '-y', final_screen_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
+    output_paths = {track: get_track_output_path(session_id, track) for track in TRACKS}
+    os.makedirs(os.path.dirname(output_paths['screen']), exist_ok=True)
     
-    # 合成摄像头视频
-    final_camera_path = os.path.join(output_folder, f'{session_id}_final_camera.webm')
-    if camera_segments:
-        # 为摄像头视频创建 concat 文件
-        camera_concat_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-        
-        # 添加第一段
-        prev_end = 0
-        for i, seg in enumerate(camera_segments):
-            # 如果当前分段和上一段之间有间隙，添加黑屏填充
-            if i > 0 and seg['start'] > prev_end:
-                # 添加黑屏视频，持续时间为间隙时长
-                gap_duration = (seg['start'] - prev_end) / 1000  # 转换为秒
-                # 使用FFmpeg生成黑屏视频
-                black_camera_file = os.path.join(output_folder, f'black_camera_{i}.webm')
-                cmd = [
-                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=black:s=320x240:r=30',
-                    '-t', str(gap_duration), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', black_camera_file
-                ]
-                subprocess.run(cmd, check=True, capture_output=True)
-                
-                # 添加到concat文件
-                camera_concat_file.write(f"file '{black_camera_file}'\n")
-            
-            # 添加当前分段
-            camera_concat_file.write(f"file '{seg['path']}'\n")
-            prev_end = seg['end']
-        
-        camera_concat_file.close()
-        
-        # 使用FFmpeg合并所有摄像头分段
-        cmd = [
-            FFMPEG_PATH, '-f', 'concat', '-safe', '0', '-i', camera_concat_file.name,
-            '-c', 'copy', '-y', final_camera_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
-        
-        # 删除临时文件
-        os.unlink(camera_concat_file.name)
-    else:
-        # 如果没有摄像头视频，生成完整的黑屏视频
-        cmd = [
-            FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=black:s=320x240:r=30',
-            '-t', str(total_duration / 1000), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', final_camera_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
+    # 上传时已增量合成的轨道只需写入索引
+    assembled = {}
+    for track in TRACKS:
+        result = finalize_track(track, track_segments.get(track, []), output_paths[track])
+        if result:
+            assembled[track] = result
     
-    # 合成音频
-    final_audio_path = os.path.join(output_folder, f'{session_id}_final_audio.webm')
-    if audio_segments:
-        # 为音频创建 concat 文件
-        audio_concat_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-        
-        # 添加第一段
-        prev_end = 0
-        for i, seg in enumerate(audio_segments):
-            # 如果当前分段和上一段之间有间隙，添加静音填充
-            if i > 0 and seg['start'] > prev_end:
-                # 添加静音音频，持续时间为间隙时长
-                gap_duration = (seg['start'] - prev_end) / 1000  # 转换为秒
-                # 使用FFmpeg生成静音音频
-                silent_audio_file = os.path.join(output_folder, f'silent_audio_{i}.webm')
-                cmd = [
-                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-                    '-t', str(gap_duration), '-c:a', 'libopus', '-b:a', '128k', '-y', silent_audio_file
-                ]
-                subprocess.run(cmd, check=True, capture_output=True)
-                
-                # 添加到concat文件
-                audio_concat_file.write(f"file '{silent_audio_file}'\n")
-            
-            # 添加当前分段
-            audio_concat_file.write(f"file '{seg['path']}'\n")
-            prev_end = seg['end']
-        
-        audio_concat_file.close()
-        
-        # 使用FFmpeg合并所有音频分段
-        cmd = [
-            FFMPEG_PATH, '-f', 'concat', '-safe', '0', '-i', audio_concat_file.name,
-            '-c', 'copy', '-y', final_audio_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
-        
-        # 删除临时文件
-        os.unlink(audio_concat_file.name)
-    else:
-        # 如果没有音频，生成完整的静音音频
-        cmd = [
-            FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-            '-t', str(total_duration / 1000), '-c:a', 'libopus', '-b:a', '128k', '-y', final_audio_path
-        ]
-        subprocess.run(cmd, check=True, capture_output=True)
+    # 其余轨道并发合成，没有分段的轨道整条用黑屏 / 静音填充
+    remaining = [track for track in TRACKS if track not in assembled]
+    assembled.update(assemble_session(track_segments, total_duration, output_paths, remaining))
     
     # 更新会话记录
     cursor.execute(
         'UPDATE recording_sessions SET status = ?, total_duration = ?, final_screen_path = ?, final_camera_path = ?, final_audio_path = ? WHERE session_id = ?',
-        ('completed', total_duration, final_screen_path, final_camera_path, final_audio_path, session_id)
+        ('completed', total_duration, output_paths['screen'], output_paths['camera'], output_paths['audio'], session_id)
     )
     
     conn.commit()
@@ -267,9 +113,10 @@ def process_recording(session_id):
     return {
         'session_id': session_id,
         'total_duration': total_duration,
-        'final_screen_path': final_screen_path,
-        'final_camera_path': final_camera_path,
-        'final_audio_path': final_audio_path
+        'final_screen_path': output_paths['screen'],
+        'final_camera_path': output_paths['camera'],
+        'final_audio_path': output_paths['audio'],
+        'track_timings': {track: result['seconds'] for track, result in assembled.items()}
     }
 
 @bp.route('/recordings/sessions', methods=['POST'])
@@ -355,6 +202,12 @@ def upload_segment(session_id):
     conn.commit()
     conn.close()
     
+    # 追加到轨道的输出文件，完成录制时只需写入索引
+    if segment_type in TRACKS:
+        output_path = get_track_output_path(session_id, segment_type)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        append_segment(segment_type, {'start': start_time, 'end': end_time, 'path': segment_path}, output_path)
+    
     return jsonify({'message': '分段上传成功', 'segment_id': cursor.lastrowid})
 
 @bp.route('/recordings/sessions/<session_id>/complete', methods=['POST'])
@@ -463,22 +316,6 @@ def upload_recording():
         except Exception as e:
             print(f"获取屏幕录制时长失败: {str(e)}")
     
-    # 创建缓存目录（如果不存在）
-    CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
-    os.makedirs(CACHE_FOLDER, exist_ok=True)
-    
-    # 获取预生成静音音频缓存文件路径
-    def get_silent_audio_cache(duration_ms):
-        duration_rounded = round(duration_ms / 1000)  # 按秒取整
-        cache_filename = f'silent_{duration_rounded}s.webm'
-        return os.path.join(CACHE_FOLDER, cache_filename)
-    
-    # 获取预生成黑屏视频缓存文件路径
-    def get_black_video_cache(duration_ms):
-        duration_rounded = round(duration_ms / 1000)  # 按秒取整
-        cache_filename = f'black_{duration_rounded}s.webm'
-        return os.path.join(CACHE_FOLDER, cache_filename)
-    
     # 处理音频状态变化记录
     audio_state_changes = []
     if 'audio_state_changes' in request.form:
@@ -509,239 +346,34 @@ def upload_recording():
             audio_path = os.path.join(UPLOAD_FOLDER, audio_filename)
             audio_file.save(audio_path)
             
-            print(f"[DEBUG] 音频文件已保存: {audio_path}")
-            print(f"[DEBUG] 音频文件大小: {os.path.getsize(audio_path)} bytes")
-            
             try:
-                # 检查是否有音频状态变化记录
                 if audio_state_changes:
                     print(f"处理音频状态变化: {len(audio_state_changes)} 个变化点")
-                    print(f"[DEBUG] 音频状态变化详情: {audio_state_changes}")
-                    
-                    # 预加载原始音频时长
-                    try:
-                        original_audio_duration = get_file_duration(audio_path)
-                        print(f"[DEBUG] 原始音频时长: {original_audio_duration} ms")
-                    except Exception as duration_err:
-                        print(f"[DEBUG] 获取音频时长失败，使用total_duration: {duration_err}")
-                        original_audio_duration = total_duration
-                    
-                    # 生成完整的状态变化序列（包括开始和结束）
-                    audio_segments = []
-                    if audio_state_changes:
-                        # 设置初始状态（录制开始时的状态）
-                        initial_state = audio_state_changes[0]['isEnabled']
-                        initial_timestamp = audio_state_changes[0]['timestamp']
-                        
-                        # 如果初始状态不是从0开始，添加从0到初始状态的时间段
-                        if initial_timestamp > 0:
-                            audio_segments.append({
-                                'isEnabled': initial_state,
-                                'start': 0,
-                                'end': initial_timestamp
-                            })
-                        
-                        # 处理所有状态变化
-                        for i, change in enumerate(audio_state_changes):
-                            current_state = change['isEnabled']
-                            start_time = change['timestamp']
-                            end_time = audio_state_changes[i+1]['timestamp'] if i+1 < len(audio_state_changes) else total_duration
-                            
-                            audio_segments.append({
-                                'isEnabled': current_state,
-                                'start': start_time,
-                                'end': end_time
-                            })
-                    else:
-                        # 如果没有状态变化记录，默认使用关闭状态
-                        audio_segments.append({
-                            'isEnabled': False,
-                            'start': 0,
-                            'end': total_duration
-                        })
-                    
-                    # 生成每个片段
-                    temp_files = []
-                    for i, segment in enumerate(audio_segments):
-                        segment_duration = (segment['end'] - segment['start']) / 1000
-                        
-                        if segment_duration <= 0:
-                            continue
-                        
-                        if segment['isEnabled'] and original_audio_duration > segment['start']:
-                            # 需要从原始音频中截取片段
-                            temp_file = os.path.join(UPLOAD_FOLDER, f'{hash_id}_audio_segment_{i}.webm')
-                            
-                            # 计算在原始音频中的开始和结束位置（秒）
-                            original_start = max(0, segment['start']) / 1000
-                            original_end = min(original_audio_duration, segment['end']) / 1000
-                            
-                            if original_end > original_start:
-                                # 截取原始音频片段
-                                cmd = [
-                                    FFMPEG_PATH,
-                                    '-i', audio_path,
-                                    '-ss', str(original_start),
-                                    '-to', str(original_end),
-                                    '-c:a', 'copy',
-                                    '-y', temp_file
-                                ]
-                                subprocess.run(cmd, check=True, capture_output=True)
-                                
-                                # 检查截取的音频是否达到了所需的时长
-                                actual_duration = get_file_duration(temp_file)
-                                if actual_duration < (segment['end'] - segment['start']):
-                                    # 生成补充的静音片段
-                                    supplement_duration = (segment['end'] - segment['start'] - actual_duration) / 1000
-                                    supplement_file = get_silent_audio_cache(supplement_duration * 1000)
-                                    if not os.path.exists(supplement_file):
-                                        cmd = [
-                                            FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-                                            '-t', str(supplement_duration), '-c:a', 'libopus', '-b:a', '128k', '-y', supplement_file
-                                        ]
-                                        subprocess.run(cmd, check=True, capture_output=True)
-                                    
-                                    # 合并原始片段和补充片段
-                                    merged_segment_file = os.path.join(UPLOAD_FOLDER, f'{hash_id}_audio_segment_{i}_merged.webm')
-                                    merge_list = os.path.join(UPLOAD_FOLDER, f'{hash_id}_audio_segment_{i}_merge.txt')
-                                    with open(merge_list, 'w') as f:
-                                        f.write(f"file '{temp_file}'\n")
-                                        f.write(f"file '{supplement_file}'\n")
-                                    
-                                    cmd = [
-                                        FFMPEG_PATH,
-                                        '-f', 'concat', '-safe', '0', '-i', merge_list,
-                                        '-c:a', 'libopus', '-b:a', '128k', '-y', merged_segment_file
-                                    ]
-                                    subprocess.run(cmd, check=True, capture_output=True)
-                                    
-                                    # 清理临时文件
-                                    os.unlink(merge_list)
-                                    os.unlink(temp_file)
-                                    
-                                    # 使用合并后的片段
-                                    temp_files.append(merged_segment_file)
-                                else:
-                                    temp_files.append(temp_file)
-                            else:
-                                # 生成静音片段
-                                silent_file = get_silent_audio_cache(segment['end'] - segment['start'])
-                                if not os.path.exists(silent_file):
-                                    cmd = [
-                                        FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-                                        '-t', str(segment_duration), '-c:a', 'libopus', '-b:a', '128k', '-y', silent_file
-                                    ]
-                                    subprocess.run(cmd, check=True, capture_output=True)
-                                temp_files.append(silent_file)
-                        else:
-                            # 生成静音片段
-                            silent_file = get_silent_audio_cache(segment['end'] - segment['start'])
-                            if not os.path.exists(silent_file):
-                                cmd = [
-                                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-                                    '-t', str(segment_duration), '-c:a', 'libopus', '-b:a', '128k', '-y', silent_file
-                                ]
-                                subprocess.run(cmd, check=True, capture_output=True)
-                            temp_files.append(silent_file)
-                    
-                    # 合并所有片段
-                    if temp_files:
-                        # 创建合并列表文件
-                        merge_list = os.path.join(UPLOAD_FOLDER, f'{hash_id}_audio_merge.txt')
-                        with open(merge_list, 'w') as f:
-                            for file in temp_files:
-                                f.write(f"file '{file}'\n")
-                        
-                        # 使用FFmpeg合并
-                        merged_audio_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_merged.webm')
-                        cmd = [
-                            FFMPEG_PATH,
-                            '-f', 'concat', '-safe', '0', '-i', merge_list,
-                            '-c:a', 'libopus', '-b:a', '128k', '-y', merged_audio_path
-                        ]
-                        subprocess.run(cmd, check=True, capture_output=True)
-                        
-                        # 清理临时文件
-                        os.unlink(merge_list)
-                        for file in temp_files:
-                            if os.path.exists(file) and file != audio_path:
-                                os.unlink(file)
-                        
-                        # 更新音频文件路径
-                        os.unlink(audio_path)
-                        audio_path = merged_audio_path
-                        print("音频状态变化处理完成")
+                    needs_fill = True
                 else:
-                    # 没有状态变化记录，使用原有的时长检查逻辑
-                    print("[DEBUG] 没有音频状态变化记录，检查音频时长")
+                    # 没有状态变化记录，只在音频短于总时长时补齐
                     try:
                         audio_duration = get_file_duration(audio_path)
-                        print(f"[DEBUG] 音频文件时长: {audio_duration} ms")
-                    except Exception as duration_err:
-                        print(f"[DEBUG] 获取音频时长失败，跳过时长检查: {duration_err}")
+                    except Exception:
                         audio_duration = total_duration  # 跳过时长检查
+                    needs_fill = audio_duration < total_duration
+                
+                if needs_fill:
+                    # 开启时段流复制，关闭时段和结尾使用静音填充（编码不支持时整条重新编码）
+                    merged_audio_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_merged.webm')
+                    cut_track('audio', audio_path, audio_state_changes, total_duration, merged_audio_path)
                     
-                    if audio_duration < total_duration:
-                        # 需要生成与总时长相同的音频
-                        print(f"音频时长({audio_duration})小于总时长({total_duration})，需要合成")
-                        
-                        # 计算需要添加的静音时长
-                        silent_duration = (total_duration - audio_duration) / 1000
-                        if silent_duration > 0:
-                            # 尝试使用缓存的静音音频
-                            silent_audio_file = get_silent_audio_cache((total_duration - audio_duration))
-                            
-                            # 如果缓存不存在，生成并缓存
-                            if not os.path.exists(silent_audio_file):
-                                cmd = [
-                                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-                                    '-t', str(silent_duration), '-c:a', 'libopus', '-b:a', '128k', '-y', silent_audio_file
-                                ]
-                                subprocess.run(cmd, check=True, capture_output=True)
-                                print(f"已生成并缓存静音音频: {silent_audio_file}")
-                            
-                            # 使用FFmpeg直接合并，无需临时文件列表
-                            merged_audio_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_merged.webm')
-                            cmd = [
-                                FFMPEG_PATH,
-                                '-i', audio_path,  # 原始音频
-                                '-i', silent_audio_file,  # 静音音频
-                                '-filter_complex', '[0:a][1:a]concat=n=2:v=0:a=1',  # 仅合并音频
-                                '-c:a', 'libopus', '-b:a', '128k', '-y', merged_audio_path
-                            ]
-                            subprocess.run(cmd, check=True, capture_output=True)
-                            
-                            # 删除原始文件
-                            os.unlink(audio_path)
-                            
-                            # 更新音频文件路径
-                            audio_path = merged_audio_path
+                    # 删除原始文件，更新音频文件路径
+                    os.unlink(audio_path)
+                    audio_path = merged_audio_path
+                    print("音频轨道补齐完成")
             except Exception as e:
                 print(f"处理音频文件失败: {str(e)}")
     else:
         # 没有上传音频文件，生成与总时长相同的静音音频
         audio_filename = f'{hash_id}.webm'
         audio_path = os.path.join(UPLOAD_FOLDER, audio_filename)
-        
-        # 尝试使用缓存的静音音频
-        cache_silent_audio = get_silent_audio_cache(total_duration)
-        if os.path.exists(cache_silent_audio):
-            # 直接复制缓存文件
-            import shutil
-            shutil.copy2(cache_silent_audio, audio_path)
-            print(f"使用缓存的静音音频: {cache_silent_audio}")
-        else:
-            # 生成新的静音音频
-            cmd = [
-                FFMPEG_PATH, '-f', 'lavfi', '-i', 'anullsrc=r=44100:cl=stereo',
-                '-t', str(total_duration / 1000), '-c:a', 'libopus', '-b:a', '128k', '-y', audio_path
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            
-            # 缓存生成的静音音频
-            import shutil
-            shutil.copy2(audio_path, cache_silent_audio)
-            print(f"已生成并缓存静音音频: {cache_silent_audio}")
+        compose_filler('audio', total_duration, audio_path)
 
     # 处理摄像头录制文件
     webcam_recording_path = None
@@ -753,239 +385,34 @@ def upload_recording():
             webcam_recording_path = os.path.join(UPLOAD_FOLDER, webcam_recording_filename)
             webcam_recording_file.save(webcam_recording_path)
             
-            print(f"[DEBUG] 摄像头文件已保存: {webcam_recording_path}")
-            print(f"[DEBUG] 摄像头文件大小: {os.path.getsize(webcam_recording_path)} bytes")
-            
             try:
-                # 检查是否有摄像头状态变化记录
                 if camera_state_changes:
                     print(f"处理摄像头状态变化: {len(camera_state_changes)} 个变化点")
-                    print(f"[DEBUG] 摄像头状态变化详情: {camera_state_changes}")
-                    
-                    # 预加载原始摄像头视频时长
-                    try:
-                        original_video_duration = get_file_duration(webcam_recording_path)
-                        print(f"[DEBUG] 原始摄像头视频时长: {original_video_duration} ms")
-                    except Exception as duration_err:
-                        print(f"[DEBUG] 获取摄像头视频时长失败，使用total_duration: {duration_err}")
-                        original_video_duration = total_duration
-                    
-                    # 生成完整的状态变化序列（包括开始和结束）
-                    video_segments = []
-                    if camera_state_changes:
-                        # 设置初始状态（录制开始时的状态）
-                        initial_state = camera_state_changes[0]['isEnabled']
-                        initial_timestamp = camera_state_changes[0]['timestamp']
-                        
-                        # 如果初始状态不是从0开始，添加从0到初始状态的时间段
-                        if initial_timestamp > 0:
-                            video_segments.append({
-                                'isEnabled': initial_state,
-                                'start': 0,
-                                'end': initial_timestamp
-                            })
-                        
-                        # 处理所有状态变化
-                        for i, change in enumerate(camera_state_changes):
-                            current_state = change['isEnabled']
-                            start_time = change['timestamp']
-                            end_time = camera_state_changes[i+1]['timestamp'] if i+1 < len(camera_state_changes) else total_duration
-                            
-                            video_segments.append({
-                                'isEnabled': current_state,
-                                'start': start_time,
-                                'end': end_time
-                            })
-                    else:
-                        # 如果没有状态变化记录，默认使用关闭状态
-                        video_segments.append({
-                            'isEnabled': False,
-                            'start': 0,
-                            'end': total_duration
-                        })
-                    
-                    # 生成每个片段
-                    temp_files = []
-                    for i, segment in enumerate(video_segments):
-                        segment_duration = (segment['end'] - segment['start']) / 1000
-                        
-                        if segment_duration <= 0:
-                            continue
-                        
-                        if segment['isEnabled'] and original_video_duration > segment['start']:
-                            # 需要从原始视频中截取片段
-                            temp_file = os.path.join(UPLOAD_FOLDER, f'{hash_id}_video_segment_{i}.webm')
-                            
-                            # 计算在原始视频中的开始和结束位置（秒）
-                            original_start = max(0, segment['start']) / 1000
-                            original_end = min(original_video_duration, segment['end']) / 1000
-                            
-                            if original_end > original_start:
-                                # 截取原始视频片段
-                                cmd = [
-                                    FFMPEG_PATH,
-                                    '-i', webcam_recording_path,
-                                    '-ss', str(original_start),
-                                    '-to', str(original_end),
-                                    '-c:v', 'copy',
-                                    '-y', temp_file
-                                ]
-                                subprocess.run(cmd, check=True, capture_output=True)
-                                
-                                # 检查截取的视频是否达到了所需的时长
-                                actual_duration = get_file_duration(temp_file)
-                                if actual_duration < (segment['end'] - segment['start']):
-                                    # 生成补充的黑屏片段
-                                    supplement_duration = (segment['end'] - segment['start'] - actual_duration) / 1000
-                                    supplement_file = get_black_video_cache(supplement_duration * 1000)
-                                    if not os.path.exists(supplement_file):
-                                        cmd = [
-                                            FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=c=black:s=640x480:r=30',
-                                            '-t', str(supplement_duration), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', supplement_file
-                                        ]
-                                        subprocess.run(cmd, check=True, capture_output=True)
-                                    
-                                    # 合并原始片段和补充片段
-                                    merged_segment_file = os.path.join(UPLOAD_FOLDER, f'{hash_id}_video_segment_{i}_merged.webm')
-                                    merge_list = os.path.join(UPLOAD_FOLDER, f'{hash_id}_video_segment_{i}_merge.txt')
-                                    with open(merge_list, 'w') as f:
-                                        f.write(f"file '{temp_file}'\n")
-                                        f.write(f"file '{supplement_file}'\n")
-                                    
-                                    cmd = [
-                                        FFMPEG_PATH,
-                                        '-f', 'concat', '-safe', '0', '-i', merge_list,
-                                        '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', merged_segment_file
-                                    ]
-                                    subprocess.run(cmd, check=True, capture_output=True)
-                                    
-                                    # 清理临时文件
-                                    os.unlink(merge_list)
-                                    os.unlink(temp_file)
-                                    
-                                    # 使用合并后的片段
-                                    temp_files.append(merged_segment_file)
-                                else:
-                                    temp_files.append(temp_file)
-                            else:
-                                # 生成黑屏片段
-                                black_file = get_black_video_cache(segment['end'] - segment['start'])
-                                if not os.path.exists(black_file):
-                                    cmd = [
-                                        FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=c=black:s=640x480:r=30',
-                                        '-t', str(segment_duration), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', black_file
-                                    ]
-                                    subprocess.run(cmd, check=True, capture_output=True)
-                                temp_files.append(black_file)
-                        else:
-                            # 生成黑屏片段
-                            black_file = get_black_video_cache(segment['end'] - segment['start'])
-                            if not os.path.exists(black_file):
-                                cmd = [
-                                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=c=black:s=640x480:r=30',
-                                    '-t', str(segment_duration), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', black_file
-                                ]
-                                subprocess.run(cmd, check=True, capture_output=True)
-                            temp_files.append(black_file)
-                    
-                    # 合并所有片段
-                    if temp_files:
-                        # 创建合并列表文件
-                        merge_list = os.path.join(UPLOAD_FOLDER, f'{hash_id}_video_merge.txt')
-                        with open(merge_list, 'w') as f:
-                            for file in temp_files:
-                                f.write(f"file '{file}'\n")
-                        
-                        # 使用FFmpeg合并
-                        merged_webcam_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_webcam_merged.webm')
-                        cmd = [
-                            FFMPEG_PATH,
-                            '-f', 'concat', '-safe', '0', '-i', merge_list,
-                            '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', merged_webcam_path
-                        ]
-                        subprocess.run(cmd, check=True, capture_output=True)
-                        
-                        # 清理临时文件
-                        os.unlink(merge_list)
-                        for file in temp_files:
-                            if os.path.exists(file) and file != webcam_recording_path:
-                                os.unlink(file)
-                        
-                        # 更新摄像头文件路径
-                        os.unlink(webcam_recording_path)
-                        webcam_recording_path = merged_webcam_path
-                        print("摄像头状态变化处理完成")
+                    needs_fill = True
                 else:
-                    # 没有状态变化记录，使用原有的时长检查逻辑
-                    print("[DEBUG] 没有摄像头状态变化记录，检查摄像头视频时长")
+                    # 没有状态变化记录，只在视频短于总时长时补齐
                     try:
                         webcam_duration = get_file_duration(webcam_recording_path)
-                        print(f"[DEBUG] 摄像头视频时长: {webcam_duration} ms")
-                    except Exception as duration_err:
-                        print(f"[DEBUG] 获取摄像头视频时长失败，跳过时长检查: {duration_err}")
+                    except Exception:
                         webcam_duration = total_duration  # 跳过时长检查
+                    needs_fill = webcam_duration < total_duration
+                
+                if needs_fill:
+                    # 完整的 GOP 流复制，只重新编码时段首尾，关闭时段和结尾使用黑屏填充
+                    merged_webcam_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_webcam_merged.webm')
+                    cut_track('camera', webcam_recording_path, camera_state_changes, total_duration, merged_webcam_path)
                     
-                    if webcam_duration < total_duration:
-                        # 需要生成与总时长相同的摄像头视频
-                        print(f"摄像头视频时长({webcam_duration})小于总时长({total_duration})，需要合成")
-                        
-                        # 计算需要添加的黑屏时长
-                        black_duration = (total_duration - webcam_duration) / 1000
-                        if black_duration > 0:
-                            # 尝试使用缓存的黑屏视频
-                            black_video_file = get_black_video_cache((total_duration - webcam_duration))
-                            
-                            # 如果缓存不存在，生成并缓存
-                            if not os.path.exists(black_video_file):
-                                cmd = [
-                                    FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=c=black:s=640x480:r=30',
-                                    '-t', str(black_duration), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', black_video_file
-                                ]
-                                subprocess.run(cmd, check=True, capture_output=True)
-                                print(f"已生成并缓存黑屏视频: {black_video_file}")
-                            
-                            # 使用FFmpeg直接合并，无需临时文件列表
-                            merged_webcam_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}_webcam_merged.webm')
-                            cmd = [
-                                FFMPEG_PATH,
-                                '-i', webcam_recording_path,  # 原始摄像头视频
-                                '-i', black_video_file,  # 黑屏视频
-                                '-filter_complex', '[0:v][1:v]concat=n=2:v=1:a=0',  # 仅合并视频
-                                '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', merged_webcam_path
-                            ]
-                            subprocess.run(cmd, check=True, capture_output=True)
-                            
-                            # 删除原始文件
-                            os.unlink(webcam_recording_path)
-                            
-                            # 更新摄像头文件路径
-                            webcam_recording_path = merged_webcam_path
+                    # 删除原始文件，更新摄像头文件路径
+                    os.unlink(webcam_recording_path)
+                    webcam_recording_path = merged_webcam_path
+                    print("摄像头轨道补齐完成")
             except Exception as e:
                 print(f"处理摄像头文件失败: {str(e)}")
     else:
         # 没有上传摄像头文件，生成与总时长相同的黑屏视频
         webcam_recording_filename = f'{hash_id}_webcam.webm'
         webcam_recording_path = os.path.join(UPLOAD_FOLDER, webcam_recording_filename)
-        
-        # 尝试使用缓存的黑屏视频
-        cache_black_video = get_black_video_cache(total_duration)
-        if os.path.exists(cache_black_video):
-            # 直接复制缓存文件
-            import shutil
-            shutil.copy2(cache_black_video, webcam_recording_path)
-            print(f"使用缓存的黑屏视频: {cache_black_video}")
-        else:
-            # 生成新的黑屏视频
-            cmd = [
-                FFMPEG_PATH, '-f', 'lavfi', '-i', 'color=c=black:s=640x480:r=30',
-                '-t', str(total_duration / 1000), '-c:v', 'libvpx-vp9', '-b:v', '500k', '-y', webcam_recording_path
-            ]
-            subprocess.run(cmd, check=True, capture_output=True)
-            
-            # 缓存生成的黑屏视频
-            import shutil
-            shutil.copy2(webcam_recording_path, cache_black_video)
-            print(f"已生成并缓存黑屏视频: {cache_black_video}")
+        compose_filler('webcam', total_duration, webcam_recording_path)
 
     # 保存轨迹文件（现在仅包含状态变化信息）
     trajectory_filename = f'{hash_id}.json'
@@ -1080,7 +507,7 @@ def get_recording(hashid):
 @bp.route('/recordings/<hashid>/audio', methods=['GET'])
 def get_audio(hashid):
     """
-    获取音频文件（支持流式传输）
+    获取音频文件（支持 Range 请求）
     """
     conn = get_db_connection()
     recording = conn.execute('SELECT * FROM recordings WHERE id = ?', (hashid,)).fetchone()
@@ -1092,31 +519,12 @@ def get_audio(hashid):
     if not os.path.exists(recording['audio_path']):
         return jsonify({'error': '音频文件丢失'}), 404
 
-    # 获取文件大小用于Content-Length头
-    file_size = os.path.getsize(recording['audio_path'])
-    mimetype = 'audio/webm'
-
-    # 实现流式传输
-    def generate():
-        with open(recording['audio_path'], 'rb') as f:
-            chunk = f.read(8192)  # 8KB chunks
-            while chunk:
-                yield chunk
-                chunk = f.read(8192)
-
-    # 设置响应头支持流式传输
-    headers = {
-        'Content-Length': str(file_size),
-        'Content-Type': mimetype,
-        'Accept-Ranges': 'bytes',
-    }
-
-    return current_app.response_class(generate(), mimetype=mimetype, headers=headers)
+    return send_media_file(recording['audio_path'], 'audio/webm')
 
 @bp.route('/recordings/<hashid>/screen', methods=['GET'])
 def get_screen_recording(hashid):
     """
-    获取录屏文件（支持流式传输）
+    获取录屏文件（支持 Range 请求）
     """
     conn = get_db_connection()
     recording = conn.execute('SELECT screen_recording_path FROM recordings WHERE id = ?', (hashid,)).fetchone()
@@ -1128,31 +536,12 @@ def get_screen_recording(hashid):
     if not os.path.exists(recording['screen_recording_path']):
         return jsonify({'error': '录屏文件丢失'}), 404
 
-    # 获取文件大小用于Content-Length头
-    file_size = os.path.getsize(recording['screen_recording_path'])
-    mimetype = 'video/webm'
-
-    # 实现流式传输
-    def generate():
-        with open(recording['screen_recording_path'], 'rb') as f:
-            chunk = f.read(8192)  # 8KB chunks
-            while chunk:
-                yield chunk
-                chunk = f.read(8192)
-
-    # 设置响应头支持流式传输
-    headers = {
-        'Content-Length': str(file_size),
-        'Content-Type': mimetype,
-        'Accept-Ranges': 'bytes',
-    }
-
-    return current_app.response_class(generate(), mimetype=mimetype, headers=headers)
+    return send_media_file(recording['screen_recording_path'], 'video/webm')
 
 @bp.route('/recordings/<hashid>/webcam', methods=['GET'])
 def get_webcam_recording(hashid):
     """
-    获取摄像头录制文件（支持流式传输）
+    获取摄像头录制文件（支持 Range 请求）
     """
     conn = get_db_connection()
     recording = conn.execute('SELECT webcam_recording_path FROM recordings WHERE id = ?', (hashid,)).fetchone()
@@ -1164,26 +553,7 @@ def get_webcam_recording(hashid):
     if not os.path.exists(recording['webcam_recording_path']):
         return jsonify({'error': '摄像头录制文件丢失'}), 404
 
-    # 获取文件大小用于Content-Length头
-    file_size = os.path.getsize(recording['webcam_recording_path'])
-    mimetype = 'video/webm'
-
-    # 实现流式传输
-    def generate():
-        with open(recording['webcam_recording_path'], 'rb') as f:
-            chunk = f.read(8192)  # 8KB chunks
-            while chunk:
-                yield chunk
-                chunk = f.read(8192)
-
-    # 设置响应头支持流式传输
-    headers = {
-        'Content-Length': str(file_size),
-        'Content-Type': mimetype,
-        'Accept-Ranges': 'bytes',
-    }
-
-    return current_app.response_class(generate(), mimetype=mimetype, headers=headers)
+    return send_media_file(recording['webcam_recording_path'], 'video/webm')
 
 @bp.route('/recordings/<hashid>/subtitle', methods=['GET'])
 def get_subtitle(hashid):
@@ -1200,7 +570,7 @@ def get_subtitle(hashid):
     if not os.path.exists(recording['subtitle_path']):
         return jsonify({'error': '字幕文件丢失'}), 404
 
-    return send_file(recording['subtitle_path'], mimetype='text/vtt')
+    return send_media_file(recording['subtitle_path'], 'text/vtt')
 
 @bp.route('/recordings/<hashid>/subtitled-video', methods=['GET'])
 def get_subtitled_video(hashid):
@@ -1217,7 +587,7 @@ def get_subtitled_video(hashid):
     if not os.path.exists(recording['subtitled_video_path']):
         return jsonify({'error': '带字幕的视频文件丢失'}), 404
 
-    return send_file(recording['subtitled_video_path'], mimetype='video/mp4')
+    return send_media_file(recording['subtitled_video_path'], 'video/mp4')
 
 @bp.route('/recordings/<hashid>/trajectory', methods=['GET'])
 def get_trajectory(hashid):
@@ -1433,7 +803,7 @@ def get_session_playback_data(session_id):
 @bp.route('/recordings/sessions/<session_id>/media/<media_type>', methods=['GET'])
 def get_session_media(session_id, media_type):
     """
-    获取会话的媒体文件（支持流式传输）
+    获取会话的媒体文件（支持 Range 请求）
     """
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -1470,4 +840,4 @@ def get_session_media(session_id, media_type):
     if media_type == 'audio':
         mime_type = 'audio/webm'
     
-    return send_file(media_path, mimetype=mime_type)
+    return send_media_file(media_path, mime_type)
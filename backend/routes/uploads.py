@@ -0,0 +1,480 @@
+"""
+断点续传上传模块
+
+长录制不再依赖一次性的大 multipart POST，而是：
+1. POST   /uploads                      创建上传会话（recording_sessions，status = uploading）
+2. PUT    /uploads/<upload_id>/<field>  按偏移写入分块（Content-Range 或 ?offset=），可并行、可重传
+3. GET    /uploads/<upload_id>          查询每个文件已接收 / 缺失的字节范围
+4. POST   /uploads/<upload_id>/complete 校验完整性后注册录制并进入后台处理流程
+
+分块直接写入上传文件的对应位置，完成时无需再拼接，校验后硬链接进内容寻址存储。
+上传 ID 即最终的录制 hashid。
+
+写入分块前先在事务中确认会话仍为 uploading 并登记正在写入的分块，完成上传在同一把写锁下检查
+没有正在写入的分块再修改状态，已完成的会话不会再被写入。
+超过 UPLOAD_SESSION_TTL_HOURS 没有写入的会话由 expire_uploads 清理（服务启动和创建新会话时执行）。
+"""
+from flask import Blueprint, request, jsonify
+from dao.database import get_db_connection
+from utils.job_queue import get_job_status
+from utils.processing import register_recording
+from utils.upload_stream import INGEST_CHUNK_SIZE, MAX_UPLOAD_PART_MB
+from .recordings import UPLOAD_FOLDER, get_file_duration
+import os
+import re
+import json
+import time
+import hashlib
+
+# 创建蓝图
+bp = Blueprint('uploads', __name__)
+
+# 可上传的文件字段及其最终文件名
+UPLOAD_FILE_NAMES = {
+    'screen_recording': '{}_screen.webm',
+    'audio': '{}.webm',
+    'webcam_recording': '{}_webcam.webm',
+}
+
+# Content-Range: bytes 0-1023/4096 或 bytes 0-1023/*
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+# 未完成的上传会话在最后一次写入后保留的时长（小时），超过后删除上传文件和分块记录，设为 0 不清理
+UPLOAD_SESSION_TTL_HOURS = float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', '24'))
+
+# 登记为正在写入的分块在多长时间（秒）后视为已中断（写入进程崩溃时不会回填），不再阻止完成上传
+UPLOAD_WRITE_LEASE_SECONDS = int(os.environ.get('UPLOAD_WRITE_LEASE_SECONDS', '3600'))
+
+
+def _invalid_duration(data):
+    """
+    total_duration 可以省略或为 null，否则必须是不小于 0 的数字（毫秒）
+    """
+    value = data.get('total_duration')
+    if value is None:
+        return False
+    return isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0
+
+
+def _merge_ranges(chunks):
+    """
+    合并已接收分块为不重叠的半开区间 [[start, end), ...]
+    """
+    merged = []
+    for offset, length in sorted(chunks):
+        end = offset + length
+        if merged and offset <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([offset, end])
+    return merged
+
+
+def _missing_ranges(received, total_size):
+    missing = []
+    cursor = 0
+    for start, end in received:
+        if start > cursor:
+            missing.append([cursor, start])
+        cursor = max(cursor, end)
+    if total_size is not None and cursor < total_size:
+        missing.append([cursor, total_size])
+    return missing
+
+
+def _get_upload(conn, upload_id):
+    return conn.execute(
+        'SELECT * FROM recording_sessions WHERE session_id = ?',
+        (upload_id,)
+    ).fetchone()
+
+
+def _describe_upload(conn, upload_id):
+    """
+    汇总每个文件的接收进度
+    """
+    upload_files = conn.execute(
+        'SELECT field, total_size FROM upload_files WHERE session_id = ?',
+        (upload_id,)
+    ).fetchall()
+    chunks = conn.execute(
+        'SELECT field, offset, length FROM upload_chunks WHERE session_id = ? AND pending = 0',
+        (upload_id,)
+    ).fetchall()
+
+    files = {}
+    for upload_file in upload_files:
+        field = upload_file['field']
+        total_size = upload_file['total_size']
+        received = _merge_ranges(
+            (chunk['offset'], chunk['length']) for chunk in chunks if chunk['field'] == field
+        )
+        received_bytes = sum(end - start for start, end in received)
+        missing = _missing_ranges(received, total_size)
+        files[field] = {
+            'size': total_size,
+            'receivedBytes': received_bytes,
+            'received': received,
+            'missing': missing,
+            # 大小未知时，只要从 0 开始连续即可完成
+            'complete': not missing and (total_size is not None or (len(received) == 1 and received[0][0] == 0)),
+        }
+    return files
+
+
+def _begin_chunk(upload_id, field, offset):
+    """
+    在会话仍为 uploading 时登记一个正在写入的分块
+
+    Returns:
+        分块记录 ID，会话已完成或已过期时返回 None
+    """
+    conn = get_db_connection()
+    try:
+        # 与完成上传修改状态互斥：登记后完成上传会看到正在写入的分块
+        conn.execute('BEGIN IMMEDIATE')
+        upload = _get_upload(conn, upload_id)
+        if not upload or upload['status'] != 'uploading':
+            conn.rollback()
+            return None
+        cursor = conn.execute(
+            'INSERT INTO upload_chunks (session_id, field, offset, length, created_at, pending) VALUES (?, ?, ?, 0, ?, 1)',
+            (upload_id, field, offset, int(time.time() * 1000))
+        )
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def _finish_chunk(chunk_id, written):
+    """
+    回填分块实际写入的长度，没有写入任何数据时删除登记
+    """
+    conn = get_db_connection()
+    if written:
+        conn.execute(
+            'UPDATE upload_chunks SET length = ?, pending = 0, created_at = ? WHERE id = ?',
+            (written, int(time.time() * 1000), chunk_id)
+        )
+    else:
+        conn.execute('DELETE FROM upload_chunks WHERE id = ?', (chunk_id,))
+    conn.commit()
+    conn.close()
+
+
+def expire_uploads():
+    """
+    删除超过 UPLOAD_SESSION_TTL_HOURS 没有写入的上传会话：预分配的上传文件、分块和文件记录以及会话本身
+
+    Returns:
+        删除的会话数量
+    """
+    if UPLOAD_SESSION_TTL_HOURS <= 0:
+        return 0
+
+    cutoff = int((time.time() - UPLOAD_SESSION_TTL_HOURS * 3600) * 1000)
+    conn = get_db_connection()
+    try:
+        # 与完成上传互斥，正在完成的会话已经不是 uploading
+        conn.execute('BEGIN IMMEDIATE')
+        session_ids = [row['session_id'] for row in conn.execute(
+            '''SELECT s.session_id FROM recording_sessions s
+               WHERE s.status = 'uploading' AND s.created_at < ?
+                 AND NOT EXISTS (SELECT 1 FROM upload_chunks c WHERE c.session_id = s.session_id AND c.created_at >= ?)''',
+            (cutoff, cutoff)
+        ).fetchall()]
+        if not session_ids:
+            conn.rollback()
+            return 0
+        placeholders = ', '.join('?' * len(session_ids))
+        paths = [row['path'] for row in conn.execute(
+            f'SELECT path FROM upload_files WHERE session_id IN ({placeholders})', session_ids
+        ).fetchall()]
+        for table in ('upload_chunks', 'upload_files', 'recording_sessions'):
+            conn.execute(f'DELETE FROM {table} WHERE session_id IN ({placeholders})', session_ids)
+        conn.commit()
+    finally:
+        conn.close()
+
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+    print(f"[INFO] 清理了 {len(session_ids)} 个过期的上传会话")
+    return len(session_ids)
+
+
+@bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    创建断点续传上传会话
+
+    JSON 参数：
+    - files: {字段名: 文件大小或 null}，字段名为 screen_recording（必须）、audio、webcam_recording，
+      录制中边录边传时大小可以为 null
+    - total_duration: 总时长（毫秒），可选
+    - audio_state_changes / camera_state_changes: 设备状态变化记录，可选
+    """
+    data = request.get_json(silent=True) or {}
+    files = data.get('files') or {}
+
+    if 'screen_recording' not in files:
+        return jsonify({'error': '缺少录屏文件'}), 400
+
+    if _invalid_duration(data):
+        return jsonify({'error': 'total_duration 必须为不小于 0 的数字'}), 400
+
+    unknown_fields = set(files) - set(UPLOAD_FILE_NAMES)
+    if unknown_fields:
+        return jsonify({'error': f'不支持的文件字段: {", ".join(sorted(unknown_fields))}'}), 400
+
+    for field, size in files.items():
+        if size is not None and (not isinstance(size, int) or size < 0):
+            return jsonify({'error': f'{field} 的文件大小不合法'}), 400
+        if size and MAX_UPLOAD_PART_MB and size > MAX_UPLOAD_PART_MB * 1024 * 1024:
+            return jsonify({'error': f'{field} 超过大小限制 {MAX_UPLOAD_PART_MB}MB'}), 413
+
+    expire_uploads()
+
+    # 上传 ID 同时作为最终的录制 hashid
+    upload_id = hashlib.sha256(os.urandom(16) + str(time.time()).encode('utf-8')).hexdigest()[:12]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''INSERT INTO recording_sessions
+           (session_id, created_at, status, total_duration, audio_state_changes, camera_state_changes)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (
+            upload_id,
+            int(time.time() * 1000),
+            'uploading',
+            data.get('total_duration'),
+            json.dumps(data['audio_state_changes']) if 'audio_state_changes' in data else None,
+            json.dumps(data['camera_state_changes']) if 'camera_state_changes' in data else None,
+        )
+    )
+
+    for field, size in files.items():
+        path = os.path.join(UPLOAD_FOLDER, UPLOAD_FILE_NAMES[field].format(upload_id))
+        # 预先创建最终文件，大小已知时直接扩展到目标大小，分块按偏移写入
+        with open(path, 'wb') as f:
+            if size:
+                f.truncate(size)
+        cursor.execute(
+            'INSERT INTO upload_files (session_id, field, path, total_size) VALUES (?, ?, ?, ?)',
+            (upload_id, field, path, size)
+        )
+
+    conn.commit()
+    upload_files = _describe_upload(conn, upload_id)
+    conn.close()
+
+    print(f"[INFO] 创建断点续传会话: {upload_id}")
+    return jsonify({'uploadId': upload_id, 'files': upload_files}), 201
+
+
+@bp.route('/uploads/<upload_id>/<field>', methods=['PUT'])
+def upload_chunk(upload_id, field):
+    """
+    写入一个分块
+
+    偏移通过 Content-Range 请求头（bytes start-end/total）或 ?offset= 参数指定，
+    请求体为原始字节。连接中断时已写入的部分同样会被记录，重传时只需补齐缺失范围。
+    """
+    conn = get_db_connection()
+    upload = _get_upload(conn, upload_id)
+    upload_file = conn.execute(
+        'SELECT * FROM upload_files WHERE session_id = ? AND field = ?',
+        (upload_id, field)
+    ).fetchone()
+    conn.close()
+
+    if not upload or not upload_file:
+        return jsonify({'error': '上传会话或文件不存在'}), 404
+
+    if upload['status'] != 'uploading':
+        return jsonify({'error': '上传会话已完成'}), 409
+
+    expected_length = None
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = CONTENT_RANGE_PATTERN.match(content_range.strip())
+        if not match:
+            return jsonify({'error': 'Content-Range 格式错误'}), 400
+        offset = int(match.group(1))
+        expected_length = int(match.group(2)) - offset + 1
+        if expected_length <= 0:
+            return jsonify({'error': 'Content-Range 格式错误'}), 400
+    else:
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({'error': '缺少 Content-Range 请求头或 offset 参数'}), 400
+        if offset < 0:
+            return jsonify({'error': 'offset 不合法'}), 400
+
+    if expected_length is None:
+        expected_length = request.content_length
+
+    total_size = upload_file['total_size']
+    limit = total_size if total_size is not None else (MAX_UPLOAD_PART_MB * 1024 * 1024 or None)
+    if limit is not None and expected_length is not None and offset + expected_length > limit:
+        return jsonify({'error': '分块超出文件大小'}), 416
+
+    # 登记正在写入的分块，会话在检查之后被完成时不再写入
+    chunk_id = _begin_chunk(upload_id, field, offset)
+    if chunk_id is None:
+        return jsonify({'error': '上传会话已完成'}), 409
+
+    # 流式写入最终文件的对应位置
+    written = 0
+    stream = request.stream
+    try:
+        with open(upload_file['path'], 'r+b') as f:
+            f.seek(offset)
+            while expected_length is None or written < expected_length:
+                size = INGEST_CHUNK_SIZE if expected_length is None else min(INGEST_CHUNK_SIZE, expected_length - written)
+                chunk = stream.read(size)
+                if not chunk:
+                    break
+                if limit is not None and offset + written + len(chunk) > limit:
+                    chunk = chunk[:limit - offset - written]
+                    f.write(chunk)
+                    written += len(chunk)
+                    break
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        # 即使连接中断，也记录已经写入的部分
+        _finish_chunk(chunk_id, written)
+
+    conn = get_db_connection()
+    progress = _describe_upload(conn, upload_id)[field]
+    conn.close()
+
+    if expected_length is not None and written < expected_length:
+        return jsonify({'error': '分块数据不完整', 'written': written, 'file': progress}), 400
+
+    return jsonify({'written': written, 'file': progress})
+
+
+@bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """
+    查询上传进度（每个文件已接收和缺失的字节范围）
+    """
+    conn = get_db_connection()
+    upload = _get_upload(conn, upload_id)
+    if not upload:
+        conn.close()
+        return jsonify({'error': '上传会话不存在'}), 404
+
+    upload_files = _describe_upload(conn, upload_id)
+    conn.close()
+
+    return jsonify({
+        'uploadId': upload_id,
+        'status': upload['status'],
+        'files': upload_files,
+        'processing': get_job_status(upload_id) if upload['status'] != 'uploading' else None,
+    })
+
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """
+    完成上传：校验所有文件已完整接收，注册录制并触发后台处理
+
+    JSON 参数（可选，覆盖创建时的值）：
+    - total_duration、audio_state_changes、camera_state_changes
+    """
+    data = request.get_json(silent=True) or {}
+    if _invalid_duration(data):
+        return jsonify({'error': 'total_duration 必须为不小于 0 的数字'}), 400
+
+    conn = get_db_connection()
+    # 检查完整性、正在写入的分块和修改状态在同一把写锁下完成，与登记分块写入互斥
+    conn.execute('BEGIN IMMEDIATE')
+    upload = _get_upload(conn, upload_id)
+    if not upload:
+        conn.close()
+        return jsonify({'error': '上传会话不存在'}), 404
+
+    if upload['status'] != 'uploading':
+        conn.close()
+        return jsonify({'hashid': upload_id, 'message': '上传已完成', 'processing': get_job_status(upload_id)})
+
+    upload_files = _describe_upload(conn, upload_id)
+    incomplete = {field: info['missing'] for field, info in upload_files.items() if not info['complete']}
+    if incomplete:
+        conn.close()
+        return jsonify({'error': '文件尚未接收完整', 'missing': incomplete}), 409
+
+    lease_start = int((time.time() - UPLOAD_WRITE_LEASE_SECONDS) * 1000)
+    writing = conn.execute(
+        'SELECT COUNT(*) FROM upload_chunks WHERE session_id = ? AND pending = 1 AND created_at >= ?',
+        (upload_id, lease_start)
+    ).fetchone()[0]
+    if writing:
+        conn.close()
+        return jsonify({'error': '仍有分块正在写入，请稍后重试'}), 409
+
+    # 标记会话为处理中，防止重复完成和后续写入
+    conn.execute("UPDATE recording_sessions SET status = 'processing' WHERE session_id = ?", (upload_id,))
+    paths = {
+        row['field']: row['path']
+        for row in conn.execute('SELECT field, path FROM upload_files WHERE session_id = ?', (upload_id,)).fetchall()
+    }
+    conn.commit()
+    conn.close()
+
+    # 大小未知的文件以接收到的连续范围为准
+    for field, info in upload_files.items():
+        if info['size'] is None:
+            with open(paths[field], 'r+b') as f:
+                f.truncate(info['received'][0][1])
+
+    trajectory_data = {}
+    audio_state_changes = data.get('audio_state_changes')
+    if audio_state_changes is None and upload['audio_state_changes']:
+        audio_state_changes = json.loads(upload['audio_state_changes'])
+    if audio_state_changes is not None:
+        trajectory_data['audioStateChanges'] = audio_state_changes
+
+    camera_state_changes = data.get('camera_state_changes')
+    if camera_state_changes is None and upload['camera_state_changes']:
+        camera_state_changes = json.loads(upload['camera_state_changes'])
+    if camera_state_changes is not None:
+        trajectory_data['cameraStateChanges'] = camera_state_changes
+
+    total_duration = data.get('total_duration') or upload['total_duration'] or 0
+    if total_duration <= 0:
+        try:
+            total_duration = get_file_duration(paths['screen_recording'])
+        except Exception as e:
+            print(f"[WARN] 获取录屏时长失败: {e}")
+            total_duration = 0
+
+    try:
+        blobs = register_recording(
+            upload_id,
+            {field: {'path': path} for field, path in paths.items()},
+            trajectory_data,
+            total_duration
+        )
+    except Exception as e:
+        # 注册失败时恢复上传状态，允许客户端重试完成
+        conn = get_db_connection()
+        conn.execute("UPDATE recording_sessions SET status = 'uploading' WHERE session_id = ?", (upload_id,))
+        conn.commit()
+        conn.close()
+        return jsonify({'error': f'完成上传失败: {str(e)}'}), 500
+
+    print(f"[INFO] 断点续传完成, hashid: {upload_id}，已加入处理队列")
+    return jsonify({
+        'hashid': upload_id,
+        'message': '上传成功',
+        'processing': get_job_status(upload_id),
+        'deduplicated': [field for field, blob in blobs.items() if blob['deduplicated']]
+    })
@@ -0,0 +1,49 @@
+"""
+测试公共夹具
+
+测试从 backend 目录运行（python -m pytest），数据库和上传目录都指向临时目录。
+"""
+import pytest
+from flask import Flask
+from dao import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    在临时目录中初始化的数据库（前后清空连接池，避免复用指向其它数据库的连接）
+    """
+    database.close_pool()
+    monkeypatch.setattr(database, 'DATABASE_PATH', str(tmp_path / 'test.db'))
+    database.init_db()
+    yield database
+    database.close_pool()
+
+
+@pytest.fixture
+def app():
+    """
+    只用于提供请求上下文的最小 Flask 应用
+    """
+    return Flask(__name__)
+
+
+@pytest.fixture
+def media_file(tmp_path):
+    """
+    内容为 0..255 循环的 1000 字节文件
+    """
+    path = tmp_path / 'media.bin'
+    path.write_bytes(bytes(i % 256 for i in range(1000)))
+    return str(path)
+
+
+@pytest.fixture
+def client(db):
+    """
+    注册了 /api 路由的测试客户端
+    """
+    from routes import api
+    api_app = Flask(__name__)
+    api_app.register_blueprint(api, url_prefix='/api')
+    return api_app.test_client()
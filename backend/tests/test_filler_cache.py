@@ -0,0 +1,119 @@
+import shutil
+import subprocess
+import pytest
+from utils import filler_cache
+from utils.filler_cache import block_sizes, compose_filler, ensure_block, plan_blocks
+from utils.track_assembly import plan_track
+
+
+@pytest.fixture
+def filler_folder(tmp_path, monkeypatch):
+    folder = tmp_path / 'fillers'
+    monkeypatch.setattr(filler_cache, 'FILLER_FOLDER', str(folder))
+    return folder
+
+
+def test_block_sizes_are_powers_of_two():
+    sizes = block_sizes()
+    assert sizes[0] == filler_cache.FILLER_MIN_BLOCK_MS
+    assert sizes[-1] <= filler_cache.FILLER_MAX_BLOCK_MS < sizes[-1] * 2
+    assert all(b == a * 2 for a, b in zip(sizes, sizes[1:]))
+
+
+@pytest.mark.parametrize('duration_ms, expected', [
+    (1, [250]),
+    (250, [250]),
+    (251, [500]),
+    (1000, [1000]),
+    (1001, [1000, 250]),
+    (3700, [2000, 1000, 500, 250]),
+    (16000, [16000]),
+    (40000, [16000, 16000, 8000]),
+    (40001, [16000, 16000, 8000, 250]),
+])
+def test_plan_blocks(duration_ms, expected):
+    assert plan_blocks(duration_ms) == expected
+
+
+@pytest.mark.parametrize('duration_ms', [1, 17, 249.5, 999, 12345, 31999, 100000.25])
+def test_plan_blocks_covers_duration_by_less_than_one_block(duration_ms):
+    blocks = plan_blocks(duration_ms)
+    assert blocks == sorted(blocks, reverse=True)
+    assert set(blocks) <= set(block_sizes())
+    assert 0 <= sum(blocks) - duration_ms < filler_cache.FILLER_MIN_BLOCK_MS
+    # 除最长的素材块外，每种素材块最多用一次
+    assert all(blocks.count(size) <= 1 for size in block_sizes()[:-1])
+
+
+def test_compose_filler_concatenates_planned_blocks(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        concat_list = cmd[cmd.index('-i') + 1]
+        with open(concat_list, encoding='utf-8') as f:
+            calls.append((cmd, f.read()))
+
+    monkeypatch.setattr(filler_cache, 'ensure_block', lambda profile, block_ms: f'/blocks/{profile}_{block_ms}.webm')
+    monkeypatch.setattr(filler_cache.subprocess, 'run', fake_run)
+    output_path = str(tmp_path / 'gap.webm')
+
+    assert compose_filler('audio', 1234, output_path) == output_path
+    cmd, concat = calls[0]
+    assert concat == "file '/blocks/audio_1000.webm'\nfile '/blocks/audio_250.webm'\n"
+    # 截取到精确时长，流复制不重新编码
+    assert cmd[cmd.index('-t') + 1] == '1.234'
+    assert cmd[cmd.index('-c') + 1] == 'copy'
+    assert not (tmp_path / 'gap.webm.txt').exists()
+
+
+@pytest.mark.parametrize('duration_ms', [0, -5])
+def test_compose_filler_rejects_empty_duration(tmp_path, duration_ms):
+    with pytest.raises(ValueError):
+        compose_filler('audio', duration_ms, str(tmp_path / 'gap.webm'))
+
+
+def test_block_path_changes_with_profile(monkeypatch):
+    monkeypatch.setitem(filler_cache.FILLER_PROFILES, 'test', {'source': 'anullsrc', 'codec': ['-c:a', 'libopus']})
+    before = filler_cache._block_path('test', 250)
+    monkeypatch.setitem(filler_cache.FILLER_PROFILES, 'test', {'source': 'anullsrc', 'codec': ['-c:a', 'flac']})
+    assert filler_cache._block_path('test', 250) != before
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要 FFmpeg')
+def test_blocks_are_generated_once(tmp_path, filler_folder, monkeypatch):
+    monkeypatch.setitem(filler_cache.FILLER_PROFILES, 'test', {'source': 'anullsrc=r=8000:cl=mono', 'codec': ['-c:a', 'libopus']})
+    runs = []
+    real_run = subprocess.run
+
+    def counting_run(cmd, **kwargs):
+        runs.append(cmd)
+        return real_run(cmd, **kwargs)
+
+    monkeypatch.setattr(filler_cache.subprocess, 'run', counting_run)
+    first = ensure_block('test', 250)
+    assert ensure_block('test', 250) == first
+    assert len(runs) == 1
+
+    compose_filler('test', 600, str(tmp_path / 'gap.webm'))
+    # 500ms 和 250ms 两个素材块，其中 250ms 已存在；再加一次拼接
+    assert len(runs) == 3
+    assert (tmp_path / 'gap.webm').stat().st_size > 0
+    assert len(list(filler_folder.glob('test_*ms.webm'))) == 2
+
+
+def test_plan_track_fills_every_gap_exactly():
+    segments = [
+        {'start': 0, 'end': 1000, 'path': 'a'},
+        {'start': 1000.4, 'end': 2000, 'path': 'b'},
+        {'start': 2100, 'end': 3000, 'path': 'c'},
+        {'start': 2990, 'end': 4000, 'path': 'd'},
+    ]
+    assert plan_track(segments, 5000) == [
+        {'type': 'segment', 'path': 'a'},
+        {'type': 'gap', 'duration': pytest.approx(0.4)},
+        {'type': 'segment', 'path': 'b'},
+        {'type': 'gap', 'duration': 100},
+        {'type': 'segment', 'path': 'c'},
+        {'type': 'segment', 'path': 'd'},
+    ]
+    assert plan_track([], 5000) == [{'type': 'gap', 'duration': 5000}]
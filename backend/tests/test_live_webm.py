@@ -0,0 +1,184 @@
+import json
+import shutil
+import struct
+import subprocess
+import pytest
+from utils.live_webm import (
+    BLOCK, BLOCK_GROUP, CLUSTER, CUE_CLUSTER_POSITION, CUE_TIME, CUE_TRACK_POSITIONS, CUES, DURATION,
+    EBML, INFO, REFERENCE_BLOCK, SEEK, SEEK_HEAD, SEEK_ID, SEEK_POSITION, SEGMENT, SIMPLE_BLOCK, TIMECODE, TRACKS,
+    VOID, WebmFormatError, _element, _elements, _id_bytes, _uint, append_piece, finalize, read_piece,
+)
+
+TIMECODE_SCALE = 0x2AD7B1
+MUXING_APP = 0x4D80
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+DOC_TYPE = 0x4282
+
+EBML_HEADER = _element(EBML, _element(DOC_TYPE, b'webm'))
+
+
+def _simple_block(relative, key):
+    return _element(SIMPLE_BLOCK, b'\x81' + struct.pack('>hB', relative, 0x80 if key else 0) + b'frame')
+
+
+def _cluster(timecode, blocks):
+    return _element(CLUSTER, _uint(TIMECODE, timecode) + b''.join(blocks))
+
+
+def _piece(clusters, duration=1000.0):
+    """
+    与 FFmpeg -live 1 输出结构相同的单轨 WebM：未知大小的 Segment，Info 带 Duration
+    """
+    info = _element(INFO, _uint(TIMECODE_SCALE, 1000000) + _element(MUXING_APP, b'test')
+                    + _element(DURATION, struct.pack('>d', duration)))
+    tracks = _element(TRACKS, _element(TRACK_ENTRY, _uint(TRACK_NUMBER, 1)))
+    return (EBML_HEADER
+            + _id_bytes(SEGMENT) + b'\x01\xff\xff\xff\xff\xff\xff\xff'
+            + info + tracks + b''.join(clusters))
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _children(data, start, end):
+    return [(element_id, data[data_start:data_end], element_start) for element_id, element_start, data_start, data_end in
+            _elements(data, start, end)]
+
+
+def test_read_piece():
+    clusters = [
+        _cluster(0, [_simple_block(0, True), _simple_block(33, False)]),
+        _cluster(66, [_simple_block(0, False), _simple_block(33, False)]),
+        _cluster(132, [_simple_block(0, True), _simple_block(40, False)]),
+    ]
+    piece = read_piece(_piece(clusters))
+
+    assert piece['ebml'] == EBML_HEADER
+    # Duration 由 finalize 重新写入
+    assert piece['info'] == _uint(TIMECODE_SCALE, 1000000) + _element(MUXING_APP, b'test')
+    assert piece['clusters'] == b''.join(clusters)
+    # 只有以关键帧开头的 Cluster 进入索引，偏移相对第一个 Cluster
+    assert piece['cues'] == [[0, 0], [132, len(clusters[0]) + len(clusters[1])]]
+    assert piece['lastTimestamp'] == 172
+
+
+def test_read_piece_block_groups():
+    key = _element(BLOCK_GROUP, _element(BLOCK, b'\x81' + struct.pack('>hB', 5, 0) + b'frame'))
+    delta = _element(BLOCK_GROUP, _element(BLOCK, b'\x81' + struct.pack('>hB', 0, 0) + b'frame')
+                     + _uint(REFERENCE_BLOCK, 1))
+    piece = read_piece(_piece([_cluster(1000, [key]), _cluster(2000, [delta])]))
+    assert piece['cues'] == [[1000, 0]]
+    assert piece['lastTimestamp'] == 2000
+
+
+def test_read_piece_rejects_other_files():
+    with pytest.raises(WebmFormatError):
+        read_piece(_element(SEGMENT, b''))
+    with pytest.raises(WebmFormatError):
+        read_piece(_element(EBML, b'') + _element(SEGMENT, _element(INFO, b'')))
+
+
+def _parse_output(data):
+    """
+    解析 finalize 之后的文件，返回 (Segment 数据起点, {顶层元素 ID: [(元素开始位置, 数据)]})
+    """
+    top = _children(data, 0, len(data))
+    assert [element_id for element_id, _, _ in top] == [EBML, SEGMENT]
+    _, _, data_start, data_end = list(_elements(data, 0, len(data)))[1]
+    assert data_end == len(data)
+    elements = {}
+    for element_id, payload, element_start in _children(data, data_start, data_end):
+        elements.setdefault(element_id, []).append((element_start, payload))
+    return data_start, elements
+
+
+def _seek_entries(seek_head):
+    entries = {}
+    for element_id, payload, _ in _children(seek_head, 0, len(seek_head)):
+        if element_id == SEEK:
+            fields = {child_id: value for child_id, value, _ in _children(payload, 0, len(payload))}
+            entries[int.from_bytes(fields[SEEK_ID], 'big')] = int.from_bytes(fields[SEEK_POSITION], 'big')
+    return entries
+
+
+def test_append_and_finalize(tmp_path):
+    first = _piece([
+        _cluster(0, [_simple_block(0, True), _simple_block(500, False)]),
+        _cluster(1000, [_simple_block(0, False)]),
+    ])
+    second = _piece([_cluster(3000, [_simple_block(0, True), _simple_block(900, False)])])
+    output = str(tmp_path / 'track.webm')
+
+    state = append_piece(output, None, _write(tmp_path, 'a.webm', first))
+    # 状态在请求之间以 JSON 保存
+    state = json.loads(json.dumps(state))
+    state = append_piece(output, state, _write(tmp_path, 'b.webm', second))
+    assert state['lastTimestamp'] == 3900
+    finalize(output, state, 4000)
+
+    data = open(output, 'rb').read()
+    data_start, elements = _parse_output(data)
+    assert len(elements[CLUSTER]) == 3
+
+    seeks = _seek_entries(elements[SEEK_HEAD][0][1])
+    for element_id in (INFO, TRACKS, CUES):
+        assert seeks[element_id] == elements[element_id][0][0] - data_start
+
+    info = {element_id: value for element_id, value, _ in _children(elements[INFO][0][1], 0, len(elements[INFO][0][1]))}
+    assert struct.unpack('>d', info[DURATION])[0] == 4000.0
+
+    cues = elements[CUES][0][1]
+    points = []
+    for _, point, _ in _children(cues, 0, len(cues)):
+        fields = {element_id: value for element_id, value, _ in _children(point, 0, len(point))}
+        positions = {element_id: value for element_id, value, _ in
+                     _children(fields[CUE_TRACK_POSITIONS], 0, len(fields[CUE_TRACK_POSITIONS]))}
+        points.append((int.from_bytes(fields[CUE_TIME], 'big'), int.from_bytes(positions[CUE_CLUSTER_POSITION], 'big')))
+    cluster_positions = [start - data_start for start, _ in elements[CLUSTER]]
+    assert points == [(0, cluster_positions[0]), (3000, cluster_positions[2])]
+
+
+def test_finalize_without_cues_voids_the_seek_entry(tmp_path):
+    piece = _piece([_cluster(0, [_simple_block(0, False)])])
+    output = str(tmp_path / 'track.webm')
+    state = append_piece(output, None, _write(tmp_path, 'a.webm', piece))
+    assert state['cues'] == []
+    finalize(output, state, 500)
+
+    data = open(output, 'rb').read()
+    _, elements = _parse_output(data)
+    assert CUES not in elements
+    seek_head = elements[SEEK_HEAD][0][1]
+    assert set(_seek_entries(seek_head)) == {INFO, TRACKS}
+    assert [element_id for element_id, _, _ in _children(seek_head, 0, len(seek_head))] == [SEEK, SEEK, VOID]
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要 FFmpeg')
+def test_ffmpeg_pieces_decode_after_finalize(tmp_path):
+    source = str(tmp_path / 'source.webm')
+    subprocess.run(
+        ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=s=160x120:r=30', '-t', '2', '-c:v', 'libvpx', '-g', '15', '-y', source],
+        check=True, capture_output=True
+    )
+    output = str(tmp_path / 'track.webm')
+    state = None
+    for i in range(3):
+        piece = str(tmp_path / f'piece{i}.webm')
+        subprocess.run(
+            ['ffmpeg', '-itsoffset', str(i * 2), '-i', source, '-map', '0:v:0', '-c', 'copy', '-live', '1',
+             '-f', 'webm', '-y', piece],
+            check=True, capture_output=True
+        )
+        state = append_piece(output, state, piece)
+    finalize(output, state, 6000)
+
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', output, '-f', 'null', '-'], capture_output=True, text=True
+    )
+    assert result.returncode == 0 and result.stderr == ''
+    assert state['lastTimestamp'] >= 5900
+    assert len(state['cues']) >= 6
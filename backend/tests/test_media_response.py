@@ -0,0 +1,101 @@
+import pytest
+from utils.media_response import MAX_RANGES, parse_range_header, send_media_file
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 99)]),
+    ('bytes=900-', [(900, 999)]),
+    ('bytes=-100', [(900, 999)]),
+    ('bytes=-5000', [(0, 999)]),
+    ('bytes=990-2000', [(990, 999)]),
+    ('bytes=0-0', [(0, 0)]),
+])
+def test_single_range(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+def test_ranges_are_sorted_and_merged():
+    # 重叠和相邻的范围合并，不相交的保留
+    assert parse_range_header('bytes=500-599, 0-99,100-199, 550-650', 1000) == [(0, 199), (500, 650)]
+
+
+@pytest.mark.parametrize('header', [
+    None,
+    '',
+    'items=0-99',
+    'bytes=abc',
+    'bytes=10-5',
+    'bytes=a-10',
+    'bytes=0-b',
+    'bytes=-x',
+])
+def test_invalid_header_serves_full_file(header):
+    assert parse_range_header(header, 1000) is None
+
+
+@pytest.mark.parametrize('header, file_size', [
+    ('bytes=1000-', 1000),
+    ('bytes=2000-3000', 1000),
+    ('bytes=-0', 1000),
+    ('bytes=-100', 0),
+])
+def test_unsatisfiable_ranges(header, file_size):
+    assert parse_range_header(header, file_size) == []
+
+
+def test_too_many_ranges_are_ignored():
+    header = 'bytes=' + ','.join(f'{i * 10}-{i * 10}' for i in range(MAX_RANGES + 1))
+    assert parse_range_header(header, 1000) is None
+
+
+def _send(app, media_file, headers=None):
+    with app.test_request_context(headers=headers or {}):
+        response = send_media_file(media_file, 'video/webm')
+        body = b''.join(response.response) if response.status_code not in (304, 416) else b''
+        return response, body
+
+
+def test_send_full_file(app, media_file):
+    response, body = _send(app, media_file)
+    assert response.status_code == 200
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert body == open(media_file, 'rb').read()
+
+
+def test_send_single_range(app, media_file):
+    response, body = _send(app, media_file, {'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 10-19/1000'
+    assert response.headers['Content-Length'] == '10'
+    assert body == bytes(range(10, 20))
+
+
+def test_send_multiple_ranges(app, media_file):
+    response, body = _send(app, media_file, {'Range': 'bytes=0-1,998-'})
+    assert response.status_code == 206
+    assert response.content_type.startswith('multipart/byteranges')
+    assert int(response.headers['Content-Length']) == len(body)
+    assert b'Content-Range: bytes 0-1/1000\r\n\r\n\x00\x01\r\n' in body
+    assert b'Content-Range: bytes 998-999/1000\r\n\r\n' + bytes([998 % 256, 999 % 256]) + b'\r\n' in body
+
+
+def test_send_unsatisfiable_range(app, media_file):
+    response, _ = _send(app, media_file, {'Range': 'bytes=5000-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */1000'
+
+
+def test_conditional_requests(app, media_file):
+    response, _ = _send(app, media_file)
+    etag = response.headers['ETag']
+
+    response, _ = _send(app, media_file, {'If-None-Match': etag})
+    assert response.status_code == 304
+
+    # If-Range 与当前 ETag 不符时忽略 Range
+    response, body = _send(app, media_file, {'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert len(body) == 1000
+
+    response, _ = _send(app, media_file, {'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
@@ -0,0 +1,82 @@
+import base64
+import pytest
+from routes.recordings import _decode_cursor, _encode_cursor
+
+
+@pytest.mark.parametrize('created_at, hash_id', [
+    (0, 'a'),
+    (1760000000000, 'f' * 64),
+    (-1, 'id:with:colons'),
+])
+def test_cursor_round_trip(created_at, hash_id):
+    cursor = _encode_cursor(created_at, hash_id)
+    assert '=' not in cursor
+    assert _decode_cursor(cursor) == (created_at, hash_id)
+
+
+@pytest.mark.parametrize('cursor', [
+    '!!!',
+    base64.urlsafe_b64encode(b'no-separator').decode(),
+    base64.urlsafe_b64encode(b'abc:id').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe:id').decode(),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        _decode_cursor(cursor)
+
+
+@pytest.fixture
+def recordings(db):
+    """
+    25 条录制，其中几条创建时间相同，只能靠 id 区分先后
+    """
+    conn = db.get_db_connection()
+    rows = []
+    for i in range(25):
+        hash_id = f'{i:02d}' + 'a' * 62
+        created_at = 1000 + (i // 3)
+        conn.execute('INSERT INTO recording_sessions (session_id, total_duration) VALUES (?, ?)', (f's{i}', i * 1000))
+        conn.execute(
+            'INSERT INTO recordings (id, session_id, subtitle_path, created_at) VALUES (?, ?, ?, ?)',
+            (hash_id, f's{i}', 'sub.vtt' if i % 2 else None, created_at)
+        )
+        rows.append((created_at, hash_id))
+    conn.commit()
+    conn.close()
+    return [hash_id for _, hash_id in sorted(rows, reverse=True)]
+
+
+def _pages(client, query=''):
+    pages = []
+    cursor = None
+    while True:
+        url = f'/api/recordings?limit=10{query}' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get(url).get_json()
+        pages.append([item['hashid'] for item in body['items']])
+        cursor = body['nextCursor']
+        if not cursor:
+            return pages
+
+
+def test_pages_follow_keyset_order(client, recordings):
+    pages = _pages(client)
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [hash_id for page in pages for hash_id in page] == recordings
+
+
+def test_pages_with_filters(client, recordings):
+    pages = _pages(client, '&has_subtitle=true&min_duration=3')
+    expected = [hash_id for hash_id in recordings if int(hash_id[:2]) % 2 and int(hash_id[:2]) >= 3]
+    assert [hash_id for page in pages for hash_id in page] == expected
+
+
+def test_list_fields_and_etag(client, recordings):
+    response = client.get('/api/recordings?limit=1&fields=hashid,hasSubtitle')
+    assert response.get_json()['items'] == [{'hashid': recordings[0], 'hasSubtitle': False}]
+    etag = response.headers['ETag']
+    assert client.get('/api/recordings?limit=1&fields=hashid,hasSubtitle', headers={'If-None-Match': etag}).status_code == 304
+
+
+@pytest.mark.parametrize('query', ['cursor=!!!', 'fields=hashid,secret', 'limit=abc', 'has_subtitle=maybe'])
+def test_invalid_query(client, query):
+    assert client.get(f'/api/recordings?{query}').status_code == 400
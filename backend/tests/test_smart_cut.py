@@ -0,0 +1,105 @@
+import shutil
+import subprocess
+import pytest
+from utils import filler_cache
+from utils.smart_cut import _MIN_ENCODE_MS, cut_track, plan_cuts, plan_timeline, source_profile
+
+
+def _changes(*entries):
+    return [{'timestamp': timestamp, 'isEnabled': enabled} for timestamp, enabled in entries]
+
+
+def test_plan_cuts_for_audio_copies_everything():
+    assert plan_cuts(120, 5000, None) == [('copy', 120, 5000)]
+
+
+def test_plan_cuts_copies_whole_gops_and_encodes_edges():
+    keyframes = [0, 1000, 2000, 3000, 4000]
+    assert plan_cuts(500, 3500, keyframes) == [
+        ('encode', 500, 1000),
+        ('copy', 1000, 3000),
+        ('encode', 3000, 3500),
+    ]
+    # 起止正好在关键帧上时不需要重新编码
+    assert plan_cuts(1000, 4000, keyframes) == [('copy', 1000, 4000)]
+
+
+def test_plan_cuts_drops_edges_shorter_than_a_frame():
+    keyframes = [0, 1000, 2000, 3000]
+    start, end = 1000 - _MIN_ENCODE_MS + 1, 2000 + _MIN_ENCODE_MS - 1
+    assert plan_cuts(start, end, keyframes) == [('copy', 1000, 2000)]
+
+
+def test_plan_cuts_without_a_whole_gop():
+    keyframes = [0, 1000, 2000]
+    assert plan_cuts(1200, 1800, keyframes) == [('encode', 1200, 1800)]
+    # 只包含一个关键帧，也没有完整的 GOP
+    assert plan_cuts(900, 1100, keyframes) == [('encode', 900, 1100)]
+    assert plan_cuts(1200, 1200 + _MIN_ENCODE_MS - 1, keyframes) == []
+
+
+def test_plan_timeline_without_state_changes():
+    assert plan_timeline([], 5000, 5000) == [('source', 0, 5000)]
+    # 源文件比录制短，不足的部分填充
+    assert plan_timeline([], 5000, 3200) == [('source', 0, 3200), ('filler', 3200, 5000)]
+
+
+def test_plan_timeline_follows_state_changes():
+    changes = _changes((1000, True), (2000, False), (3000, True))
+    # 第一次状态变化之前沿用第一条记录的状态
+    assert plan_timeline(changes, 5000, 10000) == [
+        ('source', 0, 2000),
+        ('filler', 2000, 3000),
+        ('source', 3000, 5000),
+    ]
+
+
+def test_plan_timeline_merges_adjacent_fillers():
+    changes = _changes((0, True), (2000, False), (3000, True))
+    assert plan_timeline(changes, 5000, 1500) == [('source', 0, 1500), ('filler', 1500, 5000)]
+    assert plan_timeline(_changes((0, False)), 5000, 5000) == [('filler', 0, 5000)]
+
+
+def test_source_profile(monkeypatch):
+    monkeypatch.setattr(filler_cache, 'FILLER_PROFILES', dict(filler_cache.FILLER_PROFILES))
+
+    codec, profile = source_profile('camera', {'codec': 'vp8', 'width': 320, 'height': 240})
+    assert codec[:2] == ['-c:v', 'libvpx']
+    assert filler_cache.FILLER_PROFILES[profile] == {'source': 'color=c=black:s=320x240:r=30', 'codec': codec}
+
+    codec, profile = source_profile('audio', {'codec': 'opus', 'channels': 1, 'sampleRate': 48000})
+    assert codec[:2] == ['-c:a', 'libopus']
+    assert filler_cache.FILLER_PROFILES[profile]['source'] == 'anullsrc=r=48000:cl=mono'
+
+    # 没有对应编码器的源文件整条重新编码
+    assert source_profile('camera', {'codec': 'h264', 'width': 320, 'height': 240}) is None
+    assert source_profile('audio', {'codec': 'aac', 'channels': 2, 'sampleRate': 44100}) is None
+    assert source_profile('audio', {'codec': 'opus', 'channels': 6, 'sampleRate': 48000}) is None
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None, reason='需要 FFmpeg 和 ffprobe')
+@pytest.mark.parametrize('codec, extension, mode', [
+    (['-c:v', 'libvpx', '-g', '30'], 'webm', 'smart-cut'),
+    (['-c:v', 'mpeg4'], 'mkv', 're-encode'),
+])
+def test_cut_track(db, tmp_path, monkeypatch, codec, extension, mode):
+    from utils.media_probe import probe_media
+
+    monkeypatch.setattr(filler_cache, 'FILLER_FOLDER', str(tmp_path / 'fillers'))
+    monkeypatch.setattr(filler_cache, 'FILLER_PROFILES', dict(filler_cache.FILLER_PROFILES))
+    source = str(tmp_path / f'camera.{extension}')
+    subprocess.run(
+        ['ffmpeg', '-f', 'lavfi', '-i', 'testsrc=s=160x120:r=30', '-t', '3', *codec, '-y', source],
+        check=True, capture_output=True
+    )
+    output = str(tmp_path / 'out.webm')
+
+    stats = cut_track('camera', source, _changes((0, True), (1200, False), (2000, True)), 4000, output)
+
+    assert stats['mode'] == mode
+    if mode == 'smart-cut':
+        assert stats['copiedMs'] > 0
+        assert stats['copiedMs'] + stats['encodedMs'] + stats['fillerMs'] <= 4000
+    assert probe_media(output)['duration'] == pytest.approx(4000, abs=100)
+    # 临时片段和拼接列表都已删除
+    assert not list(tmp_path.glob('out.webm.*'))
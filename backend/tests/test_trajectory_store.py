@@ -0,0 +1,210 @@
+import json
+import pytest
+from utils import trajectory_store
+from utils.trajectory_store import (
+    TrajectoryFormatError, encode_trajectory, iter_trajectory, load_index, read_trajectory, write_trajectory,
+)
+
+
+def _mouse(count, start=0):
+    return [{'x': (i * 7) % 1920, 'y': (i * 13) % 1080, 'timestamp': start + i * 16} for i in range(count)]
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(trajectory_store, 'TRAJECTORY_BLOCK_POINTS', 10)
+    monkeypatch.setattr(trajectory_store, 'TRAJECTORY_BLOCK_EVENTS', 4)
+
+
+@pytest.fixture
+def trajectory():
+    return {
+        'mouse': _mouse(95),
+        'whiteboard': [
+            {'timestamp': 40, 'type': 'draw', 'points': [[1, 2], [3, 4]]},
+            {'timestamp': 10, 'type': 'clear'},
+            {'timestamp': 900, 'type': 'text', 'text': '你好'},
+            {'timestamp': 10, 'type': 'undo'},
+            {'timestamp': 1200, 'type': 'clear'},
+        ],
+        'screen': {'width': 1920, 'height': 1080},
+        'empty': [],
+    }
+
+
+def test_round_trip(tmp_path, small_blocks, trajectory):
+    path = write_trajectory(trajectory, str(tmp_path / 'a.traj'))
+    result = read_trajectory(path)
+
+    assert result['mouse'] == trajectory['mouse']
+    # 事件按时间稳定排序，相同时间戳保持原顺序
+    assert result['whiteboard'] == sorted(trajectory['whiteboard'], key=lambda item: item['timestamp'])
+    assert result['screen'] == trajectory['screen']
+    assert result['empty'] == []
+
+
+def test_round_trip_float_and_negative_values(tmp_path):
+    points = [
+        {'x': -5, 'y': 2.5, 'timestamp': 0},
+        {'x': 100000, 'y': -0.125, 'timestamp': 1.5},
+        {'x': -70000, 'y': 3, 'timestamp': 2 ** 40},
+    ]
+    path = write_trajectory({'mouse': points}, str(tmp_path / 'a.traj'))
+    assert read_trajectory(path)['mouse'] == points
+
+
+def test_window_reads_only_overlapping_blocks(tmp_path, small_blocks, trajectory):
+    path = write_trajectory(trajectory, str(tmp_path / 'a.traj'))
+    assert len(load_index(path)['series']['mouse']['blocks']) == 10
+
+    result = read_trajectory(path, start=160, end=480)
+    assert result['mouse'] == [item for item in trajectory['mouse'] if 160 <= item['timestamp'] <= 480]
+    assert [item['timestamp'] for item in result['whiteboard']] == []
+    assert result['screen'] == trajectory['screen']
+
+    result = read_trajectory(path, start=900, series={'whiteboard'})
+    assert list(result) == ['whiteboard']
+    assert [item['timestamp'] for item in result['whiteboard']] == [900, 1200]
+
+
+def test_iter_trajectory_merges_series_by_time(tmp_path, small_blocks, trajectory):
+    path = write_trajectory(trajectory, str(tmp_path / 'a.traj'))
+    extra, events = iter_trajectory(path, end=100)
+    events = list(events)
+
+    assert extra['screen'] == trajectory['screen']
+    timestamps = [item['timestamp'] for _, item in events]
+    assert timestamps == sorted(timestamps)
+    assert [item['type'] for name, item in events if name == 'whiteboard'] == ['clear', 'undo', 'draw']
+    assert sum(1 for name, _ in events if name == 'mouse') == 7
+
+
+def test_json_trajectory_is_filtered_the_same_way(tmp_path, trajectory):
+    path = tmp_path / 'a.json'
+    path.write_text(json.dumps(trajectory), encoding='utf-8')
+    binary = write_trajectory(trajectory, str(tmp_path / 'a.traj'))
+
+    for window in ({}, {'start': 160, 'end': 480}, {'start': 900}):
+        from_json = read_trajectory(str(path), **window)
+        from_binary = read_trajectory(binary, **window)
+        assert from_json['mouse'] == from_binary['mouse']
+        assert sorted(from_json['whiteboard'], key=lambda item: item['timestamp']) == from_binary['whiteboard']
+
+
+def test_invalid_file_is_rejected(tmp_path, trajectory):
+    path = tmp_path / 'bad.traj'
+    path.write_bytes(b'JUNK' + encode_trajectory(trajectory)[4:])
+    with pytest.raises(TrajectoryFormatError):
+        read_trajectory(str(path))
+
+    path.write_bytes(b'SR')
+    with pytest.raises(TrajectoryFormatError):
+        load_index(str(path))
+
+
+def test_rewritten_file_refreshes_cached_index(tmp_path):
+    path = str(tmp_path / 'a.traj')
+    write_trajectory({'mouse': _mouse(5)}, path)
+    assert len(read_trajectory(path)['mouse']) == 5
+
+    write_trajectory({'mouse': _mouse(50)}, path)
+    assert len(read_trajectory(path)['mouse']) == 50
+
+
+def _segment_distance(point, a, b):
+    dx, dy = b['x'] - a['x'], b['y'] - a['y']
+    px, py = point['x'] - a['x'], point['y'] - a['y']
+    norm = (dx * dx + dy * dy) ** 0.5
+    if norm == 0:
+        return (px * px + py * py) ** 0.5
+    return abs(dy * px - dx * py) / norm
+
+
+def _wave(count):
+    # 锯齿状的轨迹，振幅 6 像素，叠加缓慢的大幅移动
+    return [
+        {'x': i, 'y': (i % 20) * 0.6 + (i // 200) * 50, 'timestamp': i * 10}
+        for i in range(count)
+    ]
+
+
+def test_simplify_points_respects_tolerance():
+    points = _wave(1000)
+    for tolerance in (1, 4, 16):
+        kept = trajectory_store.simplify_points(points, tolerance)
+        assert kept[0] is points[0] and kept[-1] is points[-1]
+        assert len(kept) < len(points)
+
+        # 每个被丢弃的点到相邻保留点连线的距离不超过容差
+        positions = [points.index(item) for item in kept]
+        for first, last in zip(positions, positions[1:]):
+            for point in points[first + 1:last]:
+                assert _segment_distance(point, points[first], points[last]) <= tolerance + 1e-9
+
+
+def test_simplify_straight_line_keeps_endpoints_only():
+    points = [{'x': i, 'y': 2 * i, 'timestamp': i} for i in range(100)]
+    assert trajectory_store.simplify_points(points, 0.5) == [points[0], points[-1]]
+    assert trajectory_store.simplify_points(points[:2], 0.5) == points[:2]
+
+
+def test_simplify_keeps_chunk_boundaries(monkeypatch):
+    monkeypatch.setattr(trajectory_store, '_SIMPLIFY_CHUNK', 10)
+    points = [{'x': i, 'y': 0, 'timestamp': i} for i in range(35)]
+    kept = trajectory_store.simplify_points(points, 1)
+    assert [item['x'] for item in kept] == [0, 10, 20, 30, 34]
+
+
+def test_decimate():
+    items = list(range(101))
+    assert trajectory_store.decimate(items, 200) is items
+    assert trajectory_store.decimate(items, 5) == [0, 25, 50, 75, 100]
+    assert trajectory_store.decimate(items, 1) == [0]
+
+
+def test_levels_are_stored_coarsest_last(tmp_path, small_blocks):
+    points = _wave(1000)
+    path = write_trajectory({'mouse': points}, str(tmp_path / 'a.traj'))
+    levels = load_index(path)['series']['mouse']['levels']
+
+    # 点数减少不明显的层级不保存，保存的层级按容差从细到粗
+    tolerances = [level['tolerance'] for level in levels]
+    assert levels and tolerances == sorted(tolerances)
+    assert set(tolerances) <= set(trajectory_store.TRAJECTORY_LEVEL_TOLERANCES)
+    counts = [level['count'] for level in levels]
+    assert counts == sorted(counts, reverse=True) and counts[0] < len(points)
+
+    for number, level in enumerate(levels, start=1):
+        simplified = read_trajectory(path, level=number)['mouse']
+        assert len(simplified) == level['count']
+        assert simplified[0] == points[0] and simplified[-1] == points[-1]
+    # 超过已有层级时取最粗的一层
+    assert read_trajectory(path, level=99)['mouse'] == read_trajectory(path, level=len(levels))['mouse']
+
+
+def test_level_without_enough_reduction_is_skipped(tmp_path):
+    # 点之间相距很远，简化几乎去不掉点
+    points = [{'x': (i % 2) * 1000, 'y': i * 1000, 'timestamp': i} for i in range(50)]
+    path = write_trajectory({'mouse': points}, str(tmp_path / 'a.traj'))
+    assert load_index(path)['series']['mouse']['levels'] == []
+    assert read_trajectory(path, level=2)['mouse'] == points
+
+
+def test_max_points_picks_level_and_caps_count(tmp_path, small_blocks):
+    points = _wave(1000)
+    whiteboard = [{'timestamp': i * 10, 'type': 'draw'} for i in range(300)]
+    path = write_trajectory({'mouse': points, 'whiteboard': whiteboard}, str(tmp_path / 'a.traj'))
+    levels = load_index(path)['series']['mouse']['levels']
+
+    result = read_trajectory(path, max_points=levels[0]['count'])
+    assert result['mouse'] == read_trajectory(path, level=1)['mouse']
+    # 事件序列不做简化
+    assert result['whiteboard'] == whiteboard
+
+    result = read_trajectory(path, max_points=10)
+    assert len(result['mouse']) == 10
+    assert result['mouse'][0] == points[0] and result['mouse'][-1] == points[-1]
+
+    _, events = iter_trajectory(path, start=0, end=4990, series={'mouse'}, max_points=10)
+    timestamps = [item['timestamp'] for _, item in events]
+    assert 0 < len(timestamps) <= 10 and timestamps[-1] <= 4990
@@ -0,0 +1,139 @@
+import time
+import pytest
+from routes import uploads
+from routes.uploads import _merge_ranges, _missing_ranges, expire_uploads
+
+
+@pytest.fixture
+def upload_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, 'UPLOAD_FOLDER', str(tmp_path))
+    return tmp_path
+
+
+def _create(client, **files):
+    response = client.post('/api/uploads', json={'files': files, 'total_duration': 1000})
+    assert response.status_code == 201
+    return response.get_json()['uploadId']
+
+
+def _put(client, upload_id, data, offset, field='screen_recording', total='*'):
+    headers = {'Content-Range': f'bytes {offset}-{offset + len(data) - 1}/{total}'}
+    return client.put(f'/api/uploads/{upload_id}/{field}', data=data, headers=headers)
+
+
+def test_merge_ranges():
+    assert _merge_ranges([]) == []
+    assert _merge_ranges([(100, 50), (0, 100), (300, 10), (120, 100)]) == [[0, 220], [300, 310]]
+    # 重复和被包含的分块
+    assert _merge_ranges([(0, 100), (0, 100), (10, 5)]) == [[0, 100]]
+
+
+def test_missing_ranges():
+    assert _missing_ranges([], 100) == [[0, 100]]
+    assert _missing_ranges([[0, 100]], 100) == []
+    assert _missing_ranges([[10, 20], [50, 60]], 100) == [[0, 10], [20, 50], [60, 100]]
+    # 大小未知时只报告中间的空洞
+    assert _missing_ranges([[10, 20], [50, 60]], None) == [[0, 10], [20, 50]]
+
+
+def test_out_of_order_chunks_and_resume(client, upload_folder):
+    data = bytes(range(256)) * 4
+    upload_id = _create(client, screen_recording=len(data))
+
+    assert _put(client, upload_id, data[512:768], 512).status_code == 200
+    progress = client.get(f'/api/uploads/{upload_id}').get_json()['files']['screen_recording']
+    assert progress['received'] == [[512, 768]]
+    assert progress['missing'] == [[0, 512], [768, 1024]]
+    assert progress['complete'] is False
+
+    # 客户端按 missing 补齐缺失的范围，?offset= 与 Content-Range 等价
+    assert client.put(f'/api/uploads/{upload_id}/screen_recording?offset=0', data=data[:512]).status_code == 200
+    response = _put(client, upload_id, data[768:], 768)
+    assert response.get_json()['file']['complete'] is True
+    assert response.get_json()['file']['receivedBytes'] == len(data)
+    assert (upload_folder / f'{upload_id}_screen.webm').read_bytes() == data
+
+
+def test_chunk_beyond_file_size_is_rejected(client, upload_folder):
+    upload_id = _create(client, screen_recording=100)
+    assert _put(client, upload_id, b'x' * 20, 90).status_code == 416
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['files']['screen_recording']['received'] == []
+
+
+def test_unknown_size_completes_when_contiguous(client, upload_folder):
+    upload_id = _create(client, screen_recording=None)
+    _put(client, upload_id, b'a' * 10, 0)
+    _put(client, upload_id, b'c' * 10, 20)
+    progress = client.get(f'/api/uploads/{upload_id}').get_json()['files']['screen_recording']
+    assert progress['missing'] == [[10, 20]] and progress['complete'] is False
+
+    _put(client, upload_id, b'b' * 10, 10)
+    progress = client.get(f'/api/uploads/{upload_id}').get_json()['files']['screen_recording']
+    assert progress['received'] == [[0, 30]] and progress['complete'] is True
+
+
+def test_incomplete_upload_cannot_complete(client, upload_folder):
+    upload_id = _create(client, screen_recording=100, audio=50)
+    _put(client, upload_id, b'x' * 100, 0)
+    response = client.post(f'/api/uploads/{upload_id}/complete')
+    assert response.status_code == 409
+    assert response.get_json()['missing'] == {'audio': [[0, 50]]}
+
+
+def test_pending_write_blocks_complete(client, db, upload_folder, monkeypatch):
+    upload_id = _create(client, screen_recording=10)
+    _put(client, upload_id, b'x' * 10, 0)
+
+    # 另一个请求登记了分块但还没有写完
+    chunk_id = uploads._begin_chunk(upload_id, 'screen_recording', 0)
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['files']['screen_recording']['receivedBytes'] == 10
+    response = client.post(f'/api/uploads/{upload_id}/complete')
+    assert response.status_code == 409 and '正在写入' in response.get_json()['error']
+
+    # 超过租约的登记视为已中断（写入进程崩溃），不再阻止完成；注册失败时恢复为 uploading 允许重试
+    def fail(*args, **kwargs):
+        raise RuntimeError('注册失败')
+
+    monkeypatch.setattr(uploads, 'UPLOAD_WRITE_LEASE_SECONDS', -60)
+    monkeypatch.setattr(uploads, 'register_recording', fail)
+    response = client.post(f'/api/uploads/{upload_id}/complete')
+    assert response.status_code == 500
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['status'] == 'uploading'
+    uploads._finish_chunk(chunk_id, 0)
+
+
+def test_writes_after_complete_are_rejected(client, db, upload_folder):
+    upload_id = _create(client, screen_recording=10)
+    conn = db.get_db_connection()
+    conn.execute("UPDATE recording_sessions SET status = 'processing' WHERE session_id = ?", (upload_id,))
+    conn.commit()
+    conn.close()
+
+    assert _put(client, upload_id, b'x' * 10, 0).status_code == 409
+    # 检查之后才完成的会话在登记分块时被拒绝
+    assert uploads._begin_chunk(upload_id, 'screen_recording', 0) is None
+
+
+def test_expire_uploads(client, db, upload_folder, monkeypatch):
+    stale = _create(client, screen_recording=10)
+    fresh = _create(client, screen_recording=10)
+    _put(client, fresh, b'x' * 5, 0)
+
+    conn = db.get_db_connection()
+    old = int((time.time() - 48 * 3600) * 1000)
+    conn.execute('UPDATE recording_sessions SET created_at = ?', (old,))
+    conn.commit()
+    conn.close()
+
+    assert expire_uploads() == 1
+    assert client.get(f'/api/uploads/{stale}').status_code == 404
+    assert not (upload_folder / f'{stale}_screen.webm').exists()
+    # 最近仍有写入的会话保留
+    assert client.get(f'/api/uploads/{fresh}').status_code == 200
+
+    monkeypatch.setattr(uploads, 'UPLOAD_SESSION_TTL_HOURS', 0)
+    conn = db.get_db_connection()
+    conn.execute('UPDATE upload_chunks SET created_at = ?', (old,))
+    conn.commit()
+    conn.close()
+    assert expire_uploads() == 0
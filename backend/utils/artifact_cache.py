@@ -0,0 +1,250 @@
+"""
+派生产物缓存
+
+字幕（VTT）、合并音频后的视频、烧录字幕的视频等派生产物按「输入内容哈希 + 变换参数」
+生成缓存键，存放在 UPLOAD_FOLDER/cache/<kind>/ 下。生成前先查缓存，命中时不再运行
+FFmpeg / Whisper；同一产物的并发生成请求会合并为一次。缓存总大小超过
+DERIVED_CACHE_QUOTA_MB 时按最久未使用淘汰。
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import Future
+from dao.database import get_db_connection
+from dao.recording_cache import clear_recording_cache
+
+# 上传目录路径
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+
+# 派生产物存放目录
+CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
+
+# 派生产物缓存的磁盘配额（MB），0 表示不限制
+DERIVED_CACHE_QUOTA_MB = int(os.environ.get('DERIVED_CACHE_QUOTA_MB', '20480'))
+
+# 正在生成的产物：cache_key -> Future（结果为产物路径）
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def artifact_key(kind, inputs, params):
+    """
+    生成派生产物的缓存键
+
+    Args:
+        kind: 产物类型（subtitle、merged、subtitled 等）
+        inputs: 输入内容哈希列表，顺序有意义，缺少的输入用 None 占位
+        params: 变换参数（模型大小、编码器、码率等），必须可 JSON 序列化
+    """
+    key = json.dumps([kind, list(inputs), params], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def lookup_artifact(key):
+    """
+    查找缓存的产物，命中时刷新最近使用时间
+
+    Returns:
+        产物路径，未命中（或文件已丢失）时返回 None
+    """
+    conn = get_db_connection()
+    artifact = conn.execute('SELECT path FROM derived_artifacts WHERE cache_key = ?', (key,)).fetchone()
+    if not artifact:
+        conn.close()
+        return None
+
+    if not os.path.exists(artifact['path']):
+        conn.execute('DELETE FROM derived_artifacts WHERE cache_key = ?', (key,))
+        conn.commit()
+        conn.close()
+        return None
+
+    conn.execute('UPDATE derived_artifacts SET last_used_at = ? WHERE cache_key = ?', (_now_ms(), key))
+    conn.commit()
+    conn.close()
+    return artifact['path']
+
+
+def touch_artifacts(paths):
+    """
+    刷新一组产物的最近使用时间（例如录制详情被访问时）
+    """
+    paths = [path for path in paths if path]
+    if not paths:
+        return
+    conn = get_db_connection()
+    conn.executemany(
+        'UPDATE derived_artifacts SET last_used_at = ? WHERE path = ?',
+        [(_now_ms(), path) for path in paths]
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_or_build(kind, inputs, params, build, ext):
+    """
+    获取派生产物，未命中时调用 build 生成并写入缓存
+
+    同一缓存键同时只会生成一次：并发请求等待正在进行的生成结果，不会重复运行 FFmpeg / Whisper。
+
+    Args:
+        kind: 产物类型
+        inputs: 输入内容哈希列表
+        params: 变换参数
+        build: build(output_path) -> bool，生成产物到指定路径（路径以 ext 结尾，便于 FFmpeg 推断格式）
+        ext: 产物扩展名，如 '.vtt'、'.webm'
+
+    Returns:
+        (产物路径, 是否命中缓存)，生成失败时路径为 None
+    """
+    key = artifact_key(kind, inputs, params)
+    path = lookup_artifact(key)
+    if path:
+        return path, True
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        # 其它请求正在生成同一产物，等待其结果（视为命中）
+        path = future.result()
+        return path, path is not None
+
+    try:
+        path = _build_artifact(key, kind, params, build, ext)
+        future.set_result(path)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+    return path, False
+
+
+def _build_artifact(key, kind, params, build, ext):
+    # 查缓存与登记生成之间，其它线程可能刚好生成完毕
+    path = lookup_artifact(key)
+    if path:
+        return path
+
+    folder = os.path.join(CACHE_FOLDER, kind)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{key}{ext}')
+    # 先写入临时文件再原子重命名，读取方不会看到写了一半的产物
+    temp_path = os.path.join(folder, f'.{key}-{uuid.uuid4().hex[:8]}{ext}')
+
+    try:
+        success = build(temp_path)
+        if not success or not os.path.exists(temp_path):
+            return None
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    now = _now_ms()
+    conn = get_db_connection()
+    conn.execute(
+        '''INSERT INTO derived_artifacts (cache_key, kind, path, size, params, created_at, last_used_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(cache_key) DO UPDATE SET path = excluded.path, size = excluded.size, last_used_at = excluded.last_used_at''',
+        (key, kind, path, os.path.getsize(path), json.dumps(params), now, now)
+    )
+    conn.commit()
+    conn.close()
+
+    evict_artifacts(keep=key)
+    return path
+
+
+def _release_references(cursor, path):
+    """
+    清除 recordings 中指向被淘汰产物的引用，之后访问时会重新生成
+
+    同一事务中把处理任务里对应产物的状态从 ready 改为 evicted，避免进度接口报告已不存在的产物
+    """
+    cursor.execute(
+        '''UPDATE processing_jobs SET subtitle_status = 'evicted'
+           WHERE subtitle_status = 'ready' AND recording_id IN (SELECT id FROM recordings WHERE subtitle_path = ?)''',
+        (path,)
+    )
+    cursor.execute(
+        '''UPDATE processing_jobs SET merged_video_status = 'evicted'
+           WHERE merged_video_status = 'ready' AND recording_id IN (SELECT id FROM recordings WHERE screen_recording_path = ?)''',
+        (path,)
+    )
+    cursor.execute('UPDATE recordings SET subtitle_path = NULL WHERE subtitle_path = ?', (path,))
+    cursor.execute('UPDATE recordings SET subtitled_video_path = NULL WHERE subtitled_video_path = ?', (path,))
+    # 合并视频被淘汰后回退到原始录屏
+    cursor.execute(
+        '''UPDATE recordings
+           SET screen_recording_path = (SELECT b.path FROM media_blobs b WHERE b.sha256 = recordings.screen_sha256)
+           WHERE screen_recording_path = ? AND screen_sha256 IS NOT NULL''',
+        (path,)
+    )
+    cursor.execute('DELETE FROM media_assets WHERE path = ?', (path,))
+    # 回退到原始录屏的录制重新登记录屏资源
+    cursor.execute(
+        '''INSERT OR IGNORE INTO media_assets (recording_id, kind, path, size, sha256)
+           SELECT r.id, 'screen', r.screen_recording_path, b.size, r.screen_sha256
+           FROM recordings r JOIN media_blobs b ON b.path = r.screen_recording_path'''
+    )
+
+
+def evict_artifacts(keep=None):
+    """
+    缓存总大小超过配额时，按最久未使用淘汰产物
+
+    Args:
+        keep: 不参与淘汰的缓存键（刚生成的产物）
+
+    Returns:
+        淘汰的产物数量
+    """
+    if not DERIVED_CACHE_QUOTA_MB:
+        return 0
+    quota = DERIVED_CACHE_QUOTA_MB * 1024 * 1024
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    total = cursor.execute('SELECT COALESCE(SUM(size), 0) FROM derived_artifacts').fetchone()[0]
+    if total <= quota:
+        conn.close()
+        return 0
+
+    evicted = []
+    for artifact in cursor.execute(
+        'SELECT cache_key, path, size FROM derived_artifacts ORDER BY last_used_at'
+    ).fetchall():
+        if total <= quota:
+            break
+        if artifact['cache_key'] == keep:
+            continue
+        cursor.execute('DELETE FROM derived_artifacts WHERE cache_key = ?', (artifact['cache_key'],))
+        _release_references(cursor, artifact['path'])
+        total -= artifact['size']
+        evicted.append(artifact['path'])
+    conn.commit()
+    conn.close()
+
+    if evicted:
+        # 被淘汰产物的引用可能分布在任意录制中
+        clear_recording_cache()
+
+    for path in evicted:
+        if os.path.exists(path):
+            os.unlink(path)
+    if evicted:
+        print(f"[INFO] 派生产物缓存超出配额，淘汰了 {len(evicted)} 个产物")
+    return len(evicted)
@@ -1,6 +1,18 @@
 import ffmpeg
 import os
 
+
+def _filter_path(path):
+    """
+    将文件路径转换为 FFmpeg filter 参数可用的形式
+
+    Windows 路径处理：将 \\ 替换为 /，并将 : 转义为 \\:
+    这是为了满足 FFmpeg filter 语法的要求
+    例如 C:\\Users\\Lu... -> C\\:/Users/Lu...
+    """
+    return path.replace('\\', '/').replace(':', '\\:')
+
+
 def combine_video_with_subtitle(video_path, subtitle_path, output_path):
     """
     将字幕烧录到视频中
@@ -16,10 +28,7 @@ def combine_video_with_subtitle(video_path, subtitle_path, output_path):
         subtitle_path = os.path.abspath(subtitle_path)
         output_path = os.path.abspath(output_path)
 
-        # Windows 路径处理：将 \ 替换为 /，并将 : 转义为 \:
-        # 这是为了满足 FFmpeg filter 语法的要求
-        # 例如 C:\Users\Lu... -> C\:/Users/Lu...
-        filter_subtitle_path = subtitle_path.replace('\\', '/').replace(':', '\\:')
+        filter_subtitle_path = _filter_path(subtitle_path)
 
         print(f"正在合并视频和字幕...")
         print(f"视频源: {video_path}")
@@ -87,6 +96,52 @@ def combine_video_with_audio(video_path, audio_path, output_path):
         print("视频音频合并完成")
         return True
 
+    except ffmpeg.Error as e:
+        print(f"FFmpeg 错误: {e.stderr.decode('utf8')}")
+        return False
+    except Exception as e:
+        print(f"合并视频出错: {str(e)}")
+        return False
+
+
+def combine_video_audio_subtitle(video_path, audio_path, subtitle_path, output_path):
+    """
+    一次 FFmpeg 调用完成音频合并和字幕烧录
+
+    视频流经过 subtitles 滤镜重新编码，音频流直接复制，不产生中间文件，
+    相比先合并音频再烧录字幕少一次完整的读写和音频重新编码。
+
+    Args:
+        video_path: 原始录屏视频路径
+        audio_path: 音频文件路径
+        subtitle_path: 字幕文件路径 (.vtt 或 .srt)
+        output_path: 输出视频路径
+    """
+    try:
+        # 转换为绝对路径
+        video_path = os.path.abspath(video_path)
+        audio_path = os.path.abspath(audio_path)
+        subtitle_path = os.path.abspath(subtitle_path)
+        output_path = os.path.abspath(output_path)
+
+        print("正在合并视频、音频和字幕...")
+        print(f"视频源: {video_path}")
+        print(f"音频源: {audio_path}")
+        print(f"字幕源: {subtitle_path}")
+
+        # 视频: [0:v] -> subtitles -> 编码；音频: [1:a] 直接复制
+        video = ffmpeg.input(video_path).video.filter('subtitles', _filter_path(subtitle_path))
+        audio = ffmpeg.input(audio_path).audio
+        (
+            ffmpeg
+            .output(video, audio, output_path, acodec='copy')
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+
+        print("视频音频字幕合并完成")
+        return True
+
     except ffmpeg.Error as e:
         print(f"FFmpeg 错误: {e.stderr.decode('utf8')}")
         return False
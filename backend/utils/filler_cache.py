@@ -0,0 +1,207 @@
+"""
+静音 / 黑屏填充素材库
+
+每种填充规格（信号源、分辨率、编码、码率）使用一组时长为 2 的幂的素材块
+（FILLER_MIN_BLOCK_MS × 2^k，不超过 FILLER_MAX_BLOCK_MS），第一次用到时生成，存放在 UPLOAD_FOLDER/cache/fillers/，重启后继续复用。
+任意时长的填充由若干素材块流复制拼接，再用 -t 截取到所需时长：新的时长不需要重新编码，
+也不会像按整秒取整的缓存那样让时间线偏移（误差不超过一帧 / 一个音频包）。
+
+素材目录由多个进程共享：生成素材块时持有文件锁，先写临时文件再原子重命名，
+同一素材块只会被生成一次，读取方不会看到写了一半的文件。
+"""
+import os
+import json
+import math
+import uuid
+import hashlib
+import threading
+import subprocess
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+FFMPEG_PATH = 'ffmpeg'
+
+# 上传目录路径
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+
+# 填充素材存放目录
+FILLER_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache', 'fillers')
+
+# 最短与最长的素材块时长（毫秒），更长的填充重复使用最长的素材块
+FILLER_MIN_BLOCK_MS = int(os.environ.get('FILLER_MIN_BLOCK_MS', '250'))
+FILLER_MAX_BLOCK_MS = int(os.environ.get('FILLER_MAX_BLOCK_MS', '16000'))
+
+# 填充规格：信号源和编码参数
+FILLER_PROFILES = {
+    # 分段录制会话的录屏、摄像头轨道
+    'screen': {'source': 'color=black:s=1280x720:r=30', 'codec': ['-c:v', 'libvpx-vp9', '-b:v', '2M']},
+    'camera': {'source': 'color=black:s=320x240:r=30', 'codec': ['-c:v', 'libvpx-vp9', '-b:v', '500k']},
+    # 上传接口没有摄像头文件时的黑屏
+    'webcam': {'source': 'color=c=black:s=640x480:r=30', 'codec': ['-c:v', 'libvpx-vp9', '-b:v', '500k']},
+    'audio': {'source': 'anullsrc=r=44100:cl=stereo', 'codec': ['-c:a', 'libopus', '-b:a', '128k']},
+}
+
+_stats = {'blocksGenerated': 0, 'composed': 0}
+_stats_lock = threading.Lock()
+
+
+def register_profile(name, source, codec):
+    """
+    注册一个填充规格（例如与某个上传文件编码参数一致的规格），已存在同名规格时覆盖
+
+    Args:
+        source: lavfi 信号源
+        codec: 编码参数列表
+    """
+    FILLER_PROFILES[name] = {'source': source, 'codec': list(codec)}
+    return name
+
+
+def block_sizes():
+    """
+    所有素材块的时长（毫秒），从短到长
+    """
+    sizes = [FILLER_MIN_BLOCK_MS]
+    while sizes[-1] * 2 <= FILLER_MAX_BLOCK_MS:
+        sizes.append(sizes[-1] * 2)
+    return sizes
+
+
+def plan_blocks(duration_ms):
+    """
+    拼出指定时长需要的素材块（毫秒），从长到短
+
+    时长向上取整到最短素材块的整数倍，超出的部分由截取去掉
+    """
+    sizes = block_sizes()
+    units = math.ceil(duration_ms / FILLER_MIN_BLOCK_MS)
+    largest = sizes[-1] // FILLER_MIN_BLOCK_MS
+
+    blocks = [sizes[-1]] * (units // largest)
+    units %= largest
+    for size in reversed(sizes[:-1]):
+        if units >= size // FILLER_MIN_BLOCK_MS:
+            blocks.append(size)
+            units -= size // FILLER_MIN_BLOCK_MS
+    return blocks
+
+
+def _block_path(profile, block_ms):
+    # 规格参数变化后文件名随之变化，不会复用旧参数生成的素材
+    spec = json.dumps(FILLER_PROFILES[profile], sort_keys=True)
+    digest = hashlib.sha256(spec.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(FILLER_FOLDER, f'{profile}_{digest}_{block_ms}ms.webm')
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    跨进程的排它文件锁
+    """
+    with open(lock_path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 重试 10 秒后放弃，生成较长的素材块可能超过这个时间
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def ensure_block(profile, block_ms):
+    """
+    获取素材块路径，不存在时生成
+
+    Raises:
+        subprocess.CalledProcessError: FFmpeg 执行失败
+    """
+    path = _block_path(profile, block_ms)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(FILLER_FOLDER, exist_ok=True)
+    with file_lock(path + '.lock'):
+        # 等锁期间其它进程可能已经生成完毕
+        if os.path.exists(path):
+            return path
+
+        config = FILLER_PROFILES[profile]
+        temp_path = os.path.join(FILLER_FOLDER, f'.{profile}-{uuid.uuid4().hex[:8]}.webm')
+        try:
+            cmd = [
+                FFMPEG_PATH, '-f', 'lavfi', '-i', config['source'],
+                '-t', str(block_ms / 1000), *config['codec'], '-y', temp_path
+            ]
+            subprocess.run(cmd, check=True, capture_output=True)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    with _stats_lock:
+        _stats['blocksGenerated'] += 1
+    return path
+
+
+def compose_filler(profile, duration_ms, output_path):
+    """
+    生成指定时长的填充文件：素材块流复制拼接后截取
+
+    Args:
+        profile: FILLER_PROFILES 中的规格名
+        duration_ms: 填充时长（毫秒），必须大于 0
+
+    Raises:
+        ValueError: 时长不大于 0
+        subprocess.CalledProcessError: FFmpeg 执行失败
+    """
+    if duration_ms <= 0:
+        raise ValueError(f'填充时长必须大于 0: {duration_ms}')
+
+    blocks = [ensure_block(profile, block_ms) for block_ms in plan_blocks(duration_ms)]
+    concat_list = f'{output_path}.txt'
+    try:
+        with open(concat_list, 'w', encoding='utf-8') as f:
+            for path in blocks:
+                f.write(f"file '{path}'\n")
+        cmd = [
+            FFMPEG_PATH, '-f', 'concat', '-safe', '0', '-i', concat_list,
+            '-t', str(duration_ms / 1000), '-c', 'copy', '-y', output_path
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
+    finally:
+        if os.path.exists(concat_list):
+            os.unlink(concat_list)
+
+    with _stats_lock:
+        _stats['composed'] += 1
+    return output_path
+
+
+def get_filler_stats():
+    """
+    获取生成的素材块数量和拼接的填充数量
+    """
+    with _stats_lock:
+        return dict(_stats)
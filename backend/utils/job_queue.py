@@ -0,0 +1,217 @@
+"""
+后台处理任务队列
+
+上传接口只负责落盘并入队，字幕生成（Whisper）和音视频合并（FFmpeg）
+由本模块启动的后台工作线程完成。任务持久化在 SQLite 的 processing_jobs 表中，
+服务重启后处于 queued / running 状态的任务会被重新执行。
+"""
+import os
+import json
+import threading
+import time
+import traceback
+from dao.database import get_db_connection
+
+# 工作线程数量，可通过环境变量 JOB_WORKERS 配置
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+
+# 空闲时轮询数据库的间隔（秒），入队时会立即唤醒工作线程
+POLL_INTERVAL = 2.0
+
+# 单个任务最多尝试次数，超过后标记为 failed
+MAX_ATTEMPTS = 3
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def enqueue_job(recording_id, subtitle_status=None, merged_video_status=None):
+    """
+    将录制处理任务写入持久化队列并唤醒工作线程
+
+    Args:
+        recording_id: 录制 ID
+        subtitle_status: 字幕产物初始状态（有音频时为 pending）
+        merged_video_status: 合并视频产物初始状态（有音频时为 pending）
+
+    Returns:
+        任务 ID
+    """
+    now = _now_ms()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''INSERT INTO processing_jobs
+           (recording_id, status, subtitle_status, merged_video_status, attempts, created_at, updated_at)
+           VALUES (?, ?, ?, ?, 0, ?, ?)''',
+        (recording_id, 'queued', subtitle_status, merged_video_status, now, now)
+    )
+    job_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+
+    _wakeup.set()
+    return job_id
+
+
+def update_job(job_id, **fields):
+    """
+    更新任务字段（status、subtitle_status、merged_video_status、error、metrics）
+    """
+    if not fields:
+        return
+    if isinstance(fields.get('metrics'), dict):
+        fields['metrics'] = json.dumps(fields['metrics'])
+    fields['updated_at'] = _now_ms()
+    columns = ', '.join(f'{name} = ?' for name in fields)
+    conn = get_db_connection()
+    conn.execute(
+        f'UPDATE processing_jobs SET {columns} WHERE id = ?',
+        (*fields.values(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def mark_artifact_rebuilt(recording_id, field):
+    """
+    被淘汰的产物重新生成后，把处理任务中对应的 evicted 状态恢复为 ready
+
+    Args:
+        field: subtitle_status 或 merged_video_status
+    """
+    conn = get_db_connection()
+    conn.execute(
+        f"UPDATE processing_jobs SET {field} = 'ready', updated_at = ? WHERE recording_id = ? AND {field} = 'evicted'",
+        (_now_ms(), recording_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_job_status(recording_id):
+    """
+    获取录制最近一次处理任务的状态，没有任务时返回 None
+    """
+    conn = get_db_connection()
+    job = conn.execute(
+        'SELECT * FROM processing_jobs WHERE recording_id = ? ORDER BY id DESC LIMIT 1',
+        (recording_id,)
+    ).fetchone()
+    conn.close()
+
+    if not job:
+        return None
+
+    return {
+        'jobId': job['id'],
+        'status': job['status'],
+        'subtitle': job['subtitle_status'],
+        'mergedVideo': job['merged_video_status'],
+        'attempts': job['attempts'],
+        'error': job['error'],
+        'metrics': json.loads(job['metrics']) if job['metrics'] else None,
+        'updatedAt': job['updated_at'],
+    }
+
+
+def _claim_job():
+    """
+    原子地取出一个排队中的任务并标记为 running
+    """
+    conn = get_db_connection()
+    try:
+        # BEGIN IMMEDIATE 获取写锁，保证多个工作线程/进程不会领取同一个任务
+        conn.execute('BEGIN IMMEDIATE')
+        job = conn.execute(
+            "SELECT * FROM processing_jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if not job:
+            conn.rollback()
+            return None
+
+        conn.execute(
+            "UPDATE processing_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (_now_ms(), job['id'])
+        )
+        conn.commit()
+
+        job = dict(job)
+        job['attempts'] += 1
+        return job
+    finally:
+        conn.close()
+
+
+def _recover_jobs():
+    """
+    服务启动时把上次中断的 running 任务放回队列
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE processing_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+        (_now_ms(),)
+    )
+    recovered = cursor.rowcount
+    conn.commit()
+    conn.close()
+
+    if recovered:
+        print(f"[INFO] 恢复了 {recovered} 个中断的处理任务")
+
+
+def _worker_loop(handler):
+    while True:
+        try:
+            job = _claim_job()
+        except Exception as e:
+            print(f"[ERROR] 领取处理任务失败: {e}")
+            job = None
+
+        if not job:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        print(f"[INFO] 开始处理任务 {job['id']} (录制 {job['recording_id']}, 第 {job['attempts']} 次)")
+        try:
+            handler(job)
+            update_job(job['id'], status='completed', error=None)
+            print(f"[INFO] 任务 {job['id']} 处理完成")
+        except Exception as e:
+            traceback.print_exc()
+            status = 'queued' if job['attempts'] < MAX_ATTEMPTS else 'failed'
+            update_job(job['id'], status=status, error=str(e))
+            print(f"[WARN] 任务 {job['id']} 处理失败: {e}，状态: {status}")
+
+
+def start_workers(handler, num_workers=JOB_WORKERS):
+    """
+    启动后台工作线程（重复调用不会重复启动）
+
+    Args:
+        handler: 任务处理函数，接收 processing_jobs 行（dict），出错时抛出异常
+        num_workers: 工作线程数量
+    """
+    with _workers_lock:
+        if _workers:
+            return
+
+        _recover_jobs()
+        for i in range(num_workers):
+            worker = threading.Thread(
+                target=_worker_loop,
+                args=(handler,),
+                name=f'processing-worker-{i}',
+                daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
+
+    print(f"[INFO] 已启动 {num_workers} 个后台处理线程")
@@ -0,0 +1,171 @@
+"""
+分段录制的增量合成
+
+录制过程中每个分段上传后立即追加到对应轨道的输出文件（utils.live_webm），完成录制时只需写入索引：
+1. 轨道的第一个分段确定编码参数，注册一致的填充规格（smart_cut.source_profile），之后的分段编码参数必须相同
+2. 每个分段先补上与上一个分段之间的间隙（填充素材块拼接，不重新编码），
+   再由 FFmpeg 以 -itsoffset 流复制，时间戳对齐到分段在录制时间线上的位置，Cluster 追加到输出文件
+3. 完成录制时写入 Cues 和 Duration，耗时与录制总时长无关
+
+每条轨道的追加状态保存在输出文件旁的 .state.json 中，读写时持有文件锁，多个进程同时上传也不会交错写入。
+分段乱序到达、编码无法生成一致的填充、编码参数中途变化或追加失败时，该轨道标记为失效，完成录制时退回 track_assembly 整条合成。
+"""
+import os
+import json
+import time
+from utils import live_webm
+from utils.media_probe import probe_media
+from utils.filler_cache import compose_filler, file_lock
+from utils.smart_cut import source_profile
+from utils.track_assembly import run_ffmpeg
+
+# 是否在分段上传时增量合成，设为 0 时完成录制时整条合成
+LIVE_ASSEMBLY = int(os.environ.get('LIVE_ASSEMBLY', '1'))
+
+
+def _state_path(output_path):
+    return f'{output_path}.state.json'
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(path, state):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+
+def _remux(track, input_path, offset, output_path):
+    """
+    流复制为 -live 1 的单轨 WebM，时间戳从 offset（毫秒）开始
+    """
+    stream_map = '0:a:0' if track == 'audio' else '0:v:0'
+    run_ffmpeg([
+        '-itsoffset', str(offset / 1000), '-i', input_path, '-map', stream_map,
+        '-c', 'copy', '-live', '1', '-f', 'webm', '-y', output_path
+    ]).result()
+    return output_path
+
+
+def _append(track, state, segment, output_path):
+    if state['lastStart'] is not None and segment['start'] < state['lastStart']:
+        print(f"[INFO] {track} 分段乱序到达（{segment['start']}ms 早于 {state['lastStart']}ms），完成录制时整条合成")
+        state['dirty'] = True
+        return
+
+    # 每个分段都要与第一个分段的编码、分辨率、采样率一致，才能流复制追加到同一个 Tracks 头之后
+    stream_type = 'audio' if track == 'audio' else 'video'
+    stream = next((s for s in probe_media(segment['path'])['streams'] if s['type'] == stream_type), None)
+    source = source_profile(track, stream) if stream else None
+    if source is None:
+        print(f"[INFO] {segment['path']} 无法生成一致的填充，完成录制时整条合成")
+        state['dirty'] = True
+        return
+    if state['profile'] is None:
+        state['profile'] = source[1]
+        state['firstStart'] = segment['start']
+    elif source[1] != state['profile']:
+        print(f"[INFO] {track} 分段 {segment['path']} 的编码参数（{source[1]}）与轨道（{state['profile']}）不一致，完成录制时整条合成")
+        state['dirty'] = True
+        return
+
+    # 需要追加的片段: (路径, 在输出文件中的开始时间)，只填充分段之间的间隙
+    pieces = []
+    gap_path = f'{output_path}.gap.webm'
+    if state['lastEnd'] is not None and segment['start'] > state['lastEnd']:
+        compose_filler(state['profile'], segment['start'] - state['lastEnd'], gap_path)
+        pieces.append((gap_path, state['lastEnd'] - state['firstStart']))
+    pieces.append((segment['path'], segment['start'] - state['firstStart']))
+
+    piece_path = f'{output_path}.piece.webm'
+    try:
+        for path, offset in pieces:
+            last_timestamp = state['live']['lastTimestamp'] if state['live'] else None
+            if last_timestamp is not None:
+                # 分段实际时长可能比记录的略长，时间戳不能回退
+                offset = max(offset, last_timestamp + 1)
+            _remux(track, path, offset, piece_path)
+            state['live'] = live_webm.append_piece(output_path, state['live'], piece_path)
+    finally:
+        for path in (gap_path, piece_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    state['lastStart'] = segment['start']
+    state['lastEnd'] = max(state['lastEnd'] or 0, segment['end'])
+
+
+def append_segment(track, segment, output_path):
+    """
+    把刚上传的分段追加到轨道的输出文件，失败时只标记轨道失效，不抛出异常
+
+    Args:
+        track: 'screen'、'camera' 或 'audio'
+        segment: {'start', 'end', 'path'}（毫秒）
+        output_path: 轨道最终输出文件
+
+    Returns:
+        轨道是否仍可增量合成
+    """
+    if not LIVE_ASSEMBLY:
+        return False
+
+    state_path = _state_path(output_path)
+    with file_lock(f'{output_path}.lock'):
+        state = _load_state(state_path) or {
+            'live': None, 'profile': None, 'firstStart': None,
+            'lastStart': None, 'lastEnd': None, 'segments': 0, 'dirty': False,
+        }
+        state['segments'] += 1
+        if not state['dirty']:
+            try:
+                _append(track, state, segment, output_path)
+            except Exception as e:
+                print(f"[WARN] 增量合成 {track} 分段 {segment['path']} 失败，完成录制时整条合成: {e}")
+                state['dirty'] = True
+        _save_state(state_path, state)
+    return not state['dirty']
+
+
+def finalize_track(track, segments, output_path):
+    """
+    完成一条增量合成的轨道：写入索引和时长
+
+    Args:
+        segments: 数据库中该轨道的所有分段，数量与已追加的分段不一致时视为失效
+
+    Returns:
+        {'path', 'seconds', 'ffmpegJobs'}，轨道没有增量合成或已失效时返回 None（由调用方整条合成）
+    """
+    state_path = _state_path(output_path)
+    lock_path = f'{output_path}.lock'
+    if not os.path.exists(state_path):
+        return None
+
+    start = time.perf_counter()
+    with file_lock(lock_path):
+        state = _load_state(state_path)
+        os.unlink(state_path)
+        if state['dirty'] or state['live'] is None or state['segments'] != len(segments):
+            print(f"[INFO] {track} 轨道增量合成已失效（追加 {state['segments']} 个分段，共 {len(segments)} 个），整条合成")
+            usable = False
+        else:
+            # 时长取记录的结束时间和实际最后一帧中较晚的一个
+            duration = max(state['live']['lastTimestamp'] or 0, state['lastEnd'] - state['firstStart'])
+            live_webm.finalize(output_path, state['live'], duration)
+            usable = True
+    # 会话已完成，不会再有分段追加
+    try:
+        os.unlink(lock_path)
+    except OSError:
+        pass
+
+    if not usable:
+        return None
+    return {'path': output_path, 'seconds': round(time.perf_counter() - start, 3), 'ffmpegJobs': 0}
@@ -0,0 +1,271 @@
+"""
+可追加的 WebM 文件
+
+录制过程中每个分段到达时，把它的 Cluster 直接追加到轨道输出文件末尾，完成时只需写入索引：
+- 第一个片段写入文件头：EBML 头、未知大小的 Segment、预留了固定宽度字段的 SeekHead 和 Info（Duration）、Tracks
+- 之后的片段由 FFmpeg 以 -itsoffset 偏移输入时间戳、-live 1 流复制生成（时间戳接在轨道末尾），只追加其中的 Cluster
+- finalize 在文件末尾写入 Cues，再原地回填 SeekHead 中 Cues 的位置、Duration 和 Segment 大小
+
+追加和完成的耗时只与新片段的大小 / Cluster 数量有关，与录制总时长无关。
+状态（字段偏移、关键帧 Cluster 列表、最后的时间戳）可 JSON 序列化，由调用方在请求之间保存。
+"""
+import os
+import struct
+
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+CLUSTER = 0x1F43B675
+TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+REFERENCE_BLOCK = 0xFB
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+VOID = 0xEC
+
+# 8 字节的未知大小
+_UNKNOWN_SIZE = b'\x01\xff\xff\xff\xff\xff\xff\xff'
+
+
+class WebmFormatError(ValueError):
+    """
+    片段不是可以追加的 WebM 文件
+    """
+
+
+def _read_vint(data, pos, keep_marker=False):
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+        if length > 8:
+            raise WebmFormatError(f'无效的 EBML 变长整数（偏移 {pos}）')
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return (None if unknown else value), pos + length
+
+
+def _elements(data, start, end):
+    """
+    遍历 [start, end) 中的元素
+
+    Yields:
+        (ID, 元素开始位置, 数据开始位置, 数据结束位置)
+    """
+    pos = start
+    while pos < end:
+        element_id, data_start = _read_vint(data, pos, keep_marker=True)
+        size, data_start = _read_vint(data, data_start)
+        data_end = end if size is None else data_start + size
+        yield element_id, pos, data_start, data_end
+        pos = data_end
+
+
+def _id_bytes(element_id):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+
+def _size_bytes(size, width=None):
+    if width is None:
+        width = 1
+        while size >= (1 << (7 * width)) - 1:
+            width += 1
+    return ((1 << (7 * width)) | size).to_bytes(width, 'big')
+
+
+def _element(element_id, payload):
+    return _id_bytes(element_id) + _size_bytes(len(payload)) + payload
+
+
+def _uint(element_id, value, width=None):
+    width = width or max(1, (value.bit_length() + 7) // 8)
+    return _element(element_id, value.to_bytes(width, 'big'))
+
+
+def _block_info(data, data_start):
+    """
+    (相对 Cluster 的时间戳, 是否关键帧)
+    """
+    _, pos = _read_vint(data, data_start)
+    relative, flags = struct.unpack_from('>hB', data, pos)
+    return relative, bool(flags & 0x80)
+
+
+def read_piece(data):
+    """
+    解析一个由 FFmpeg 生成的单轨 WebM 片段
+
+    Returns:
+        {'ebml': EBML 头, 'info': Info 的子元素（不含 Duration）, 'tracks': Tracks 元素,
+         'clusters': 所有 Cluster 的原始字节, 'cues': [[时间戳, Cluster 在 clusters 中的偏移]]（只含以关键帧开头的 Cluster）,
+         'lastTimestamp': 最后一个块的时间戳（毫秒）}
+    """
+    piece = {'ebml': None, 'info': b'', 'tracks': None, 'cues': [], 'lastTimestamp': None}
+    cluster_ranges = []
+    segment = None
+
+    for element_id, start, data_start, data_end in _elements(data, 0, len(data)):
+        if element_id == EBML:
+            piece['ebml'] = data[start:data_end]
+        elif element_id == SEGMENT:
+            segment = (data_start, data_end)
+    if piece['ebml'] is None or segment is None:
+        raise WebmFormatError('缺少 EBML 头或 Segment')
+
+    for element_id, start, data_start, data_end in _elements(data, *segment):
+        if element_id == INFO:
+            piece['info'] = b''.join(
+                data[child_start:child_end]
+                for child_id, child_start, _, child_end in _elements(data, data_start, data_end)
+                if child_id != DURATION
+            )
+        elif element_id == TRACKS:
+            piece['tracks'] = data[start:data_end]
+        elif element_id == CLUSTER:
+            cluster_ranges.append((start, data_start, data_end))
+    if piece['tracks'] is None:
+        raise WebmFormatError('缺少 Tracks')
+
+    offset = 0
+    for start, data_start, data_end in cluster_ranges:
+        timecode = 0
+        first_key = None
+        for child_id, _, child_start, child_end in _elements(data, data_start, data_end):
+            if child_id == TIMECODE:
+                timecode = int.from_bytes(data[child_start:child_end], 'big')
+                continue
+            if child_id == SIMPLE_BLOCK:
+                relative, key = _block_info(data, child_start)
+            elif child_id == BLOCK_GROUP:
+                relative, key = None, True
+                for grand_id, _, grand_start, _ in _elements(data, child_start, child_end):
+                    if grand_id == BLOCK:
+                        relative, _ = _block_info(data, grand_start)
+                    elif grand_id == REFERENCE_BLOCK:
+                        key = False
+                if relative is None:
+                    continue
+            else:
+                continue
+            if first_key is None:
+                first_key = key
+            piece['lastTimestamp'] = max(piece['lastTimestamp'] or 0, timecode + relative)
+        if first_key:
+            piece['cues'].append([timecode, offset])
+        offset += data_end - start
+
+    piece['clusters'] = b''.join(data[start:data_end] for start, _, data_end in cluster_ranges)
+    return piece
+
+
+def _seek(element_id, position):
+    return _element(SEEK, _element(SEEK_ID, _id_bytes(element_id)) + _uint(SEEK_POSITION, position, width=8))
+
+
+def _void(size):
+    """
+    总长度为 size 字节的 Void 元素（size 不小于 2 且不超过 128）
+    """
+    return _id_bytes(VOID) + _size_bytes(size - 2, width=1) + bytes(size - 2)
+
+
+def _write_header(f, piece):
+    """
+    写入文件头，返回需要回填的字段位置
+    """
+    info = piece['info'] + _id_bytes(DURATION) + _size_bytes(8) + struct.pack('>d', 0.0)
+    info = _element(INFO, info)
+
+    # SeekHead 的字段宽度固定，先用占位值计算长度
+    seek_head_size = len(_element(SEEK_HEAD, _seek(INFO, 0) + _seek(TRACKS, 0) + _seek(CUES, 0)))
+    seek_head = _element(SEEK_HEAD, (
+        _seek(INFO, seek_head_size) + _seek(TRACKS, seek_head_size + len(info)) + _seek(CUES, 0)
+    ))
+
+    f.write(piece['ebml'])
+    segment_size_offset = f.tell() + len(_id_bytes(SEGMENT))
+    f.write(_id_bytes(SEGMENT) + _UNKNOWN_SIZE)
+    data_start = f.tell()
+    f.write(seek_head)
+    f.write(info)
+    f.write(piece['tracks'])
+    return {
+        'dataStart': data_start,
+        'segmentSizeOffset': segment_size_offset,
+        # 各字段都在所属元素的末尾
+        'cuesSeekOffset': data_start + seek_head_size - 8,
+        'durationOffset': data_start + seek_head_size + len(info) - 8,
+    }
+
+
+def append_piece(path, state, piece_path):
+    """
+    把片段追加到输出文件
+
+    Args:
+        state: 之前的状态，为 None 时创建输出文件
+        piece_path: FFmpeg 以 -live 1 生成的单轨 WebM，时间戳已偏移到轨道末尾
+
+    Returns:
+        新的状态
+    """
+    with open(piece_path, 'rb') as f:
+        piece = read_piece(f.read())
+
+    with open(path, 'wb' if state is None else 'r+b') as f:
+        if state is None:
+            state = {**_write_header(f, piece), 'cues': [], 'lastTimestamp': None}
+        f.seek(0, os.SEEK_END)
+        cluster_base = f.tell() - state['dataStart']
+        f.write(piece['clusters'])
+
+    state['cues'].extend([timecode, cluster_base + offset] for timecode, offset in piece['cues'])
+    if piece['lastTimestamp'] is not None:
+        state['lastTimestamp'] = max(state['lastTimestamp'] or 0, piece['lastTimestamp'])
+    return state
+
+
+def finalize(path, state, duration):
+    """
+    写入 Cues，回填 Cues 位置、Duration（毫秒）和 Segment 大小，没有可索引的 Cluster 时 SeekHead 中的 Cues 条目改为 Void
+    """
+    cues = b''.join(
+        _element(CUE_POINT, _uint(CUE_TIME, timecode) + _element(
+            CUE_TRACK_POSITIONS, _uint(CUE_TRACK, 1) + _uint(CUE_CLUSTER_POSITION, position)
+        ))
+        for timecode, position in state['cues']
+    )
+    with open(path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        cues_position = f.tell() - state['dataStart']
+        if cues:
+            f.write(_element(CUES, cues))
+            f.seek(state['cuesSeekOffset'])
+            f.write(cues_position.to_bytes(8, 'big'))
+        else:
+            # 没有关键帧 Cluster 时不写 Cues，SeekHead 中预留的 Cues 条目改为 Void，避免指向 Segment 开头
+            seek_size = len(_seek(CUES, 0))
+            f.seek(state['cuesSeekOffset'] + 8 - seek_size)
+            f.write(_void(seek_size))
+        segment_size = f.seek(0, os.SEEK_END) - state['dataStart']
+
+        f.seek(state['durationOffset'])
+        f.write(struct.pack('>d', float(duration)))
+        f.seek(state['segmentSizeOffset'])
+        f.write(_size_bytes(segment_size, width=8))
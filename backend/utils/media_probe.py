@@ -0,0 +1,147 @@
+"""
+媒体文件探测
+
+使用 ffprobe 获取时长、流结构、编码、分辨率和码率。每个文件（按路径 + 大小 + 修改时间识别）
+只探测一次：结果持久化在 probe_index 表中，并在进程内 LRU 缓存，之后的查询不再启动 ffprobe。
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+import ffmpeg
+from dao.database import get_db_connection
+
+# 进程内最多缓存的探测结果数量
+PROBE_CACHE_SIZE = int(os.environ.get('PROBE_CACHE_SIZE', '4096'))
+
+# 绝对路径 -> ((大小, 修改时间), 探测结果)
+_probes = OrderedDict()
+_probes_lock = threading.Lock()
+_probe_stats = {'probes': 0, 'memoryHits': 0, 'databaseHits': 0}
+
+
+def _to_number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _summarize(path, size, probe):
+    """
+    从 ffprobe 输出中提取需要的字段
+    """
+    format_info = probe.get('format', {})
+    streams = []
+    for stream in probe.get('streams', []):
+        streams.append({
+            'index': stream.get('index'),
+            'type': stream.get('codec_type'),
+            'codec': stream.get('codec_name'),
+            'width': stream.get('width'),
+            'height': stream.get('height'),
+            'sampleRate': _to_number(stream.get('sample_rate'), int),
+            'channels': stream.get('channels'),
+            'duration': _to_number(stream.get('duration')),
+            'bitRate': _to_number(stream.get('bit_rate'), int),
+        })
+
+    duration = _to_number(format_info.get('duration'))
+    if duration is None:
+        duration = next((stream['duration'] for stream in streams if stream['duration'] is not None), None)
+
+    main_stream = next((stream for stream in streams if stream['type'] == 'video'), None)
+    if main_stream is None and streams:
+        main_stream = streams[0]
+
+    return {
+        'size': size,
+        'duration': duration * 1000 if duration is not None else None,
+        'codec': main_stream['codec'] if main_stream else None,
+        'width': main_stream['width'] if main_stream else None,
+        'height': main_stream['height'] if main_stream else None,
+        'formatName': format_info.get('format_name'),
+        'bitRate': _to_number(format_info.get('bit_rate'), int),
+        'streams': streams,
+    }
+
+
+def _remember(path, version, result):
+    with _probes_lock:
+        _probes[path] = (version, result)
+        _probes.move_to_end(path)
+        while len(_probes) > PROBE_CACHE_SIZE:
+            _probes.popitem(last=False)
+
+
+def probe_media(path):
+    """
+    探测媒体文件（带缓存）
+
+    Returns:
+        {'size', 'duration'（毫秒，无法获取时为 None）, 'codec'（主要流的编码，视频优先）,
+         'width', 'height', 'formatName', 'bitRate', 'streams': [...]}
+
+    Raises:
+        ffmpeg.Error: ffprobe 无法解析文件
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+
+    with _probes_lock:
+        entry = _probes.get(path)
+        if entry and entry[0] == version:
+            _probes.move_to_end(path)
+            _probe_stats['memoryHits'] += 1
+            return entry[1]
+
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT result FROM probe_index WHERE path = ? AND size = ? AND mtime_ns = ?',
+        (path, *version)
+    ).fetchone()
+    conn.close()
+    if row:
+        result = json.loads(row['result'])
+        _remember(path, version, result)
+        with _probes_lock:
+            _probe_stats['databaseHits'] += 1
+        return result
+
+    if path.endswith('.vtt'):
+        # 字幕文件不需要 ffprobe
+        result = {
+            'size': stat.st_size, 'duration': None, 'codec': 'webvtt', 'width': None, 'height': None,
+            'formatName': 'webvtt', 'bitRate': None, 'streams': [],
+        }
+    else:
+        result = _summarize(path, stat.st_size, ffmpeg.probe(path))
+        with _probes_lock:
+            _probe_stats['probes'] += 1
+
+    conn = get_db_connection()
+    conn.execute(
+        '''INSERT INTO probe_index (path, size, mtime_ns, result, probed_at) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(path) DO UPDATE SET
+               size = excluded.size, mtime_ns = excluded.mtime_ns, result = excluded.result, probed_at = excluded.probed_at''',
+        (path, *version, json.dumps(result), int(time.time() * 1000))
+    )
+    conn.commit()
+    conn.close()
+
+    _remember(path, version, result)
+    return result
+
+
+def get_probe_stats():
+    """
+    获取探测缓存的命中情况，probesAvoided 为因缓存而省去的 ffprobe 调用次数
+    """
+    with _probes_lock:
+        return {
+            **_probe_stats,
+            'probesAvoided': _probe_stats['memoryHits'] + _probe_stats['databaseHits'],
+            'cached': len(_probes),
+        }
@@ -0,0 +1,216 @@
+"""
+媒体文件响应
+
+支持 HTTP Range（单范围 206 / 多范围 multipart/byteranges / 416）、
+ETag / Last-Modified 条件请求（304）以及 If-Range 校验。
+在 gunicorn（gunicorn.conf.py）下，完整响应和单范围响应交给 wsgi.file_wrapper，
+由服务器通过 os.sendfile 直接从文件发送到 socket；Werkzeug 开发服务器逐块读取发送。
+"""
+import os
+import uuid
+from datetime import datetime, timezone
+from flask import request, current_app
+from werkzeug.http import http_date
+
+# 非零拷贝时每次读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+# 单个请求最多接受的范围数量，超出时忽略 Range 头返回完整文件
+MAX_RANGES = 16
+
+# 这些服务器的 wsgi.file_wrapper 会按 Content-Length 使用 os.sendfile 发送，
+# 其它服务器（如 Werkzeug 开发服务器）的 file_wrapper 会读到文件末尾，不能用于范围响应
+SENDFILE_SERVERS = ('gunicorn',)
+
+
+def parse_range_header(header, file_size):
+    """
+    解析 Range 请求头
+
+    Returns:
+        None: 没有 Range 头或格式不合法（按完整文件响应）
+        []: 格式合法但没有可满足的范围（416）
+        [(start, end), ...]: 合并后的闭区间列表
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        start_str, end_str = spec.split('-', 1)
+
+        if start_str == '':
+            # 后缀范围：bytes=-500 表示最后 500 字节
+            if not end_str.isdigit():
+                return None
+            length = int(end_str)
+            if length == 0 or file_size == 0:
+                continue
+            ranges.append((max(0, file_size - length), file_size - 1))
+            continue
+
+        if not start_str.isdigit() or (end_str and not end_str.isdigit()):
+            return None
+        start = int(start_str)
+        if end_str and int(end_str) < start:
+            return None
+        if start >= file_size:
+            continue
+        end = int(end_str) if end_str else file_size - 1
+        ranges.append((start, min(end, file_size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # 合并重叠或相邻的范围
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _iter_file_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _iter_multipart(path, ranges, parts):
+    with open(path, 'rb') as f:
+        for (start, end), header in zip(ranges, parts):
+            yield header
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            yield b'\r\n'
+
+
+def _file_body(path, start, length):
+    """
+    单个连续范围的响应体，服务器支持时使用零拷贝发送
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    server = request.environ.get('SERVER_SOFTWARE', '')
+    if file_wrapper and server.startswith(SENDFILE_SERVERS):
+        f = open(path, 'rb')
+        f.seek(start)
+        return file_wrapper(f, CHUNK_SIZE)
+    return _iter_file_range(path, start, length)
+
+
+def _is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return request.if_modified_since >= last_modified
+    return False
+
+
+def _if_range_matches(etag, last_modified):
+    if_range = request.if_range
+    if if_range.etag:
+        # If-Range 要求强校验
+        return if_range.etag == etag
+    if if_range.date:
+        return if_range.date == last_modified
+    return True
+
+
+def send_media_file(path, mimetype, download_name=None):
+    """
+    发送媒体文件，支持范围请求和条件请求
+
+    Args:
+        path: 文件路径
+        mimetype: 文件 MIME 类型
+        download_name: 可选，作为附件下载时的文件名
+    """
+    stat = os.stat(path)
+    file_size = stat.st_size
+    etag = f'{file_size:x}-{stat.st_mtime_ns:x}'
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(last_modified),
+    }
+    if download_name:
+        headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+
+    response_class = current_app.response_class
+
+    if _is_not_modified(etag, last_modified):
+        return response_class(status=304, headers=headers)
+
+    ranges = parse_range_header(request.headers.get('Range'), file_size)
+    if ranges is not None and 'If-Range' in request.headers and not _if_range_matches(etag, last_modified):
+        # 文件已变化，忽略 Range 返回完整内容
+        ranges = None
+
+    if ranges is None:
+        headers['Content-Length'] = str(file_size)
+        return response_class(
+            _file_body(path, 0, file_size),
+            status=200,
+            headers=headers,
+            mimetype=mimetype,
+            direct_passthrough=True
+        )
+
+    if not ranges:
+        headers['Content-Range'] = f'bytes */{file_size}'
+        return response_class(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        headers['Content-Length'] = str(length)
+        return response_class(
+            _file_body(path, start, length),
+            status=206,
+            headers=headers,
+            mimetype=mimetype,
+            direct_passthrough=True
+        )
+
+    # 多范围：multipart/byteranges
+    boundary = uuid.uuid4().hex
+    parts = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n').encode('latin-1')
+        for start, end in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode('latin-1')
+    content_length = sum(len(part) + (end - start + 1) + 2 for part, (start, end) in zip(parts, ranges)) + len(closing)
+
+    def generate():
+        yield from _iter_multipart(path, ranges, parts)
+        yield closing
+
+    headers['Content-Length'] = str(content_length)
+    return response_class(
+        generate(),
+        status=206,
+        headers=headers,
+        content_type=f'multipart/byteranges; boundary={boundary}',
+        direct_passthrough=True
+    )
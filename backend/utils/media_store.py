@@ -0,0 +1,145 @@
+"""
+内容寻址的媒体存储
+
+上传的媒体文件按完整内容的 sha256 存放在 UPLOAD_FOLDER/blobs/ 下，相同内容只保存一份。
+media_blobs 表记录每个 blob 被 recordings 表引用的次数，引用归零时删除文件。
+重复上传（重试、重新提交、共用的片头片段）不再占用额外磁盘，
+后台处理也可以按内容哈希复用其它录制已经生成的字幕和合并视频。
+"""
+import os
+import json
+import time
+import hashlib
+from dao.database import get_db_connection
+
+# 上传目录路径
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+
+# blob 存放目录
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+
+# 计算哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    流式计算文件的 sha256
+
+    Returns:
+        (sha256 十六进制字符串, 文件大小)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def blob_path(sha256, ext='.webm'):
+    """
+    blob 的存放路径（按哈希前两位分目录，避免单目录文件过多）
+    """
+    return os.path.join(BLOB_FOLDER, sha256[:2], f'{sha256}{ext}')
+
+
+def store_blob(src_path, sha256=None, size=None, ext='.webm'):
+    """
+    将文件加入 blob 存储（硬链接，不拷贝数据），内容已存在时复用已有文件
+
+    源文件保持不变，调用方在写入 recordings 并提交后再删除源文件，
+    这样数据库写入失败时源文件仍然完整，可以直接重试。
+    引用计数由调用方在同一事务中通过 acquire_blob 增加。
+
+    Args:
+        src_path: 源文件路径（必须与 UPLOAD_FOLDER 在同一文件系统）
+        sha256: 已知的内容哈希（例如流式接收时已计算），为空时重新计算
+        size: 已知的文件大小
+        ext: 新建 blob 时使用的扩展名
+
+    Returns:
+        {'sha256', 'size', 'path', 'deduplicated'}
+    """
+    if sha256 is None or size is None:
+        sha256, size = hash_file(src_path)
+
+    conn = get_db_connection()
+    existing = conn.execute('SELECT path FROM media_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+    conn.close()
+
+    path = existing['path'] if existing else blob_path(sha256, ext)
+    deduplicated = os.path.exists(path)
+    if not deduplicated:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(src_path, path)
+        except FileExistsError:
+            # 并发上传了相同内容，另一个请求已经写入
+            deduplicated = True
+
+    return {'sha256': sha256, 'size': size, 'path': path, 'deduplicated': deduplicated}
+
+
+def acquire_blob(cursor, blob):
+    """
+    增加 blob 的引用计数（在写入 recordings 的同一事务中调用）
+
+    Args:
+        cursor: 数据库游标
+        blob: store_blob 的返回值
+    """
+    cursor.execute(
+        '''INSERT INTO media_blobs (sha256, path, size, ref_count, created_at)
+           VALUES (?, ?, ?, 1, ?)
+           ON CONFLICT(sha256) DO UPDATE SET ref_count = ref_count + 1''',
+        (blob['sha256'], blob['path'], blob['size'], int(time.time() * 1000))
+    )
+
+
+def release_blob(sha256):
+    """
+    减少 blob 的引用计数，归零时删除记录和文件
+
+    Returns:
+        是否删除了文件
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        blob = conn.execute('SELECT * FROM media_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if not blob:
+            conn.rollback()
+            return False
+        if blob['ref_count'] > 1:
+            conn.execute('UPDATE media_blobs SET ref_count = ref_count - 1 WHERE sha256 = ?', (sha256,))
+            conn.commit()
+            return False
+        conn.execute('DELETE FROM media_blobs WHERE sha256 = ?', (sha256,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    if os.path.exists(blob['path']):
+        os.unlink(blob['path'])
+    return True
+
+
+def content_id(hashes, trajectory_data=None):
+    """
+    根据各媒体文件和轨迹数据的内容哈希生成录制 ID，只有媒体和轨迹都相同的重复上传才得到相同的 ID
+
+    Args:
+        hashes: {字段名: sha256}
+        trajectory_data: 轨迹数据（鼠标点、白板操作、状态变化记录），为空时只按媒体文件计算
+    """
+    parts = [f'{field}:{hashes[field]}' for field in sorted(hashes)]
+    if trajectory_data:
+        canonical = json.dumps(trajectory_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        parts.append(f"trajectory:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}")
+    key = '|'.join(parts)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]
@@ -0,0 +1,448 @@
+"""
+录制后处理流水线
+
+由后台任务队列（utils.job_queue）调用：
+1. 使用 Whisper 生成字幕（提交到独立的转录进程池）
+2. 将音频合并到录屏视频中
+3. 探测各媒体文件的时长和编码，写入 media_assets 表
+
+产物通过 utils.artifact_cache 按输入内容和参数缓存，已生成过的直接复用。
+
+每个产物的状态（pending / ready / failed）会写回 processing_jobs 表，
+供 GET /api/recordings/<hashid> 查询进度。
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dao.database import get_db_connection
+from dao.recording_cache import get_recording, invalidate_recording
+from dao.media_assets import ASSET_KINDS, upsert_media_asset, update_probe_result, get_media_assets
+from utils.transcription_pool import submit_transcription
+from utils.combine_video import combine_video_with_audio, combine_video_with_subtitle, combine_video_audio_subtitle
+from utils.job_queue import enqueue_job, update_job, mark_artifact_rebuilt
+from utils.media_store import store_blob, acquire_blob, release_blob, hash_file
+from utils.artifact_cache import get_or_build
+from utils.media_probe import probe_media, get_probe_stats
+from utils.trajectory_store import write_trajectory
+
+# 上传目录路径
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+
+# 生成字幕使用的 Whisper 模型大小
+WHISPER_MODEL_SIZE = os.environ.get('WHISPER_MODEL_SIZE', 'base')
+
+# 音视频合并参数（直接复制流，不重新编码），参与派生产物的缓存键
+MERGE_PARAMS = {'vcodec': 'copy', 'acodec': 'copy'}
+
+# 字幕烧录参数，参与派生产物的缓存键
+SUBTITLE_BURN_PARAMS = {'filter': 'subtitles', 'format': 'webm'}
+
+# 懒生成带字幕视频的线程数量
+LAZY_BUILD_WORKERS = int(os.environ.get('LAZY_BUILD_WORKERS', '2'))
+
+# 请求等待懒生成完成的最长时间（秒），超时后返回 202，客户端稍后轮询
+LAZY_BUILD_WAIT_SECONDS = float(os.environ.get('LAZY_BUILD_WAIT_SECONDS', '10'))
+
+# 上传文件字段 -> media_assets.kind
+UPLOAD_ASSET_KINDS = {'screen_recording': 'screen', 'audio': 'audio', 'webcam_recording': 'webcam'}
+
+_lazy_executor = ThreadPoolExecutor(max_workers=LAZY_BUILD_WORKERS, thread_name_prefix='lazy-build')
+
+# 正在进行的懒生成任务：hashid -> {'future', 'startedAt'}，完成（成功或失败）后移除
+_lazy_builds = {}
+# 最近一次失败的懒生成：hashid -> {'startedAt', 'error'}，重新提交时清除
+_lazy_failures = {}
+_lazy_builds_lock = threading.Lock()
+
+
+def register_recording(hash_id, media, trajectory_data, total_duration):
+    """
+    将媒体文件存入内容寻址存储，保存录制元数据到数据库并入队后台处理任务
+
+    Args:
+        hash_id: 录制 ID（同时作为 recording_sessions 的 session_id）
+        media: {字段名: {'path', 'sha256', 'size'}}，字段名为 screen_recording（必须）、audio、webcam_recording，
+            sha256 / size 未知时会重新计算；提交成功后源文件会被删除
+        trajectory_data: 轨迹数据（鼠标点、白板操作、状态变化记录），以二进制轨迹格式保存
+        total_duration: 总时长（毫秒）
+
+    Returns:
+        {字段名: blob 信息}，deduplicated 为 True 表示内容已存在，没有占用新的磁盘空间
+    """
+    blobs = {
+        field: store_blob(info['path'], info.get('sha256'), info.get('size'))
+        for field, info in media.items()
+    }
+
+    def blob_column(field, key):
+        return blobs[field][key] if field in blobs else None
+
+    # 轨迹先写入本次请求独有的临时文件，录制写入数据库后再替换到正式路径，
+    # 相同 ID 的并发上传注册失败时不会覆盖已有录制的轨迹
+    trajectory_path = os.path.join(UPLOAD_FOLDER, f'{hash_id}.traj')
+    pending_path = write_trajectory(trajectory_data, f'{trajectory_path}.{uuid.uuid4().hex}.pending')
+
+    now = int(time.time() * 1000)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # 字幕和合并视频由后台任务生成后回写
+        cursor.execute(
+            '''INSERT INTO recordings 
+               (id, session_id, trajectory_path, audio_path, screen_recording_path, webcam_recording_path, subtitle_path, created_at,
+                screen_sha256, audio_sha256, webcam_sha256) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (
+                hash_id, hash_id, trajectory_path,
+                blob_column('audio', 'path'), blob_column('screen_recording', 'path'), blob_column('webcam_recording', 'path'),
+                None, now,
+                blob_column('screen_recording', 'sha256'), blob_column('audio', 'sha256'), blob_column('webcam_recording', 'sha256')
+            )
+        )
+        for field, blob in blobs.items():
+            acquire_blob(cursor, blob)
+            upsert_media_asset(cursor, hash_id, UPLOAD_ASSET_KINDS[field], blob['path'], size=blob['size'], sha256=blob['sha256'])
+
+        # 同时创建或更新 recording_sessions 记录（用于存储时长），断点续传时会话已存在
+        cursor.execute(
+            '''INSERT INTO recording_sessions 
+               (session_id, created_at, status, total_duration) 
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(session_id) DO UPDATE SET status = excluded.status, total_duration = excluded.total_duration''',
+            (hash_id, now, 'completed', total_duration)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        os.unlink(pending_path)
+        raise
+    finally:
+        conn.close()
+
+    os.replace(pending_path, trajectory_path)
+    invalidate_recording(hash_id)
+
+    # 数据已指向 blob，删除源文件
+    for field, info in media.items():
+        if os.path.exists(info['path']) and os.path.abspath(info['path']) != os.path.abspath(blobs[field]['path']):
+            os.unlink(info['path'])
+
+    artifact_status = 'pending' if 'audio' in blobs else None
+    enqueue_job(hash_id, subtitle_status=artifact_status, merged_video_status=artifact_status)
+    return blobs
+
+
+def delete_recording(hash_id):
+    """
+    删除录制及其元数据，释放对原始媒体 blob 的引用（引用归零时删除文件）
+
+    字幕、合并视频等派生产物按内容缓存，可能被其它录制复用，由缓存配额淘汰，这里不删除。
+
+    Returns:
+        是否找到并删除了录制
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    recording = cursor.execute(
+        'SELECT trajectory_path, screen_sha256, audio_sha256, webcam_sha256 FROM recordings WHERE id = ?',
+        (hash_id,)
+    ).fetchone()
+    if not recording:
+        conn.close()
+        return False
+
+    cursor.execute('DELETE FROM media_assets WHERE recording_id = ?', (hash_id,))
+    cursor.execute('DELETE FROM processing_jobs WHERE recording_id = ?', (hash_id,))
+    cursor.execute('DELETE FROM recordings WHERE id = ?', (hash_id,))
+    for table in ('upload_chunks', 'upload_files', 'recording_sessions'):
+        cursor.execute(f'DELETE FROM {table} WHERE session_id = ?', (hash_id,))
+    conn.commit()
+    conn.close()
+    invalidate_recording(hash_id)
+
+    for sha256 in (recording['screen_sha256'], recording['audio_sha256'], recording['webcam_sha256']):
+        if sha256:
+            release_blob(sha256)
+    if recording['trajectory_path'] and os.path.exists(recording['trajectory_path']):
+        os.unlink(recording['trajectory_path'])
+    return True
+
+
+def _source(recording, field):
+    """
+    获取录制原始媒体文件的内容哈希和路径
+
+    Args:
+        field: screen 或 audio
+
+    Returns:
+        (sha256, 路径)，没有该文件时返回 (None, None)
+    """
+    sha256 = recording[f'{field}_sha256']
+    path = recording['screen_recording_path' if field == 'screen' else 'audio_path']
+    if sha256:
+        # 录屏路径在合并音频后会指向合并视频，原始文件以 blob 为准
+        conn = get_db_connection()
+        blob = conn.execute('SELECT path FROM media_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        conn.close()
+        if blob:
+            return sha256, blob['path']
+    if not path or not os.path.exists(path):
+        return None, None
+    # 去重存储之前上传的录制没有记录哈希，现算一次
+    return hash_file(path)[0], path
+
+
+def build_subtitle(recording):
+    """
+    获取录制的字幕，相同音频内容和模型已生成过时直接返回缓存
+
+    Args:
+        recording: recordings 表中的一行
+
+    Returns:
+        (字幕路径, 耗时指标)，失败时路径为 None
+    """
+    audio_hash, audio_path = _source(recording, 'audio')
+    if not audio_path:
+        return None, {}
+
+    metrics = {}
+
+    def build(output_path):
+        # 是否攒批取决于音频文件的实际时长，客户端上报的 total_duration 不可信
+        try:
+            duration_ms = probe_media(audio_path)['duration']
+        except Exception as e:
+            print(f"[WARN] 探测音频时长失败，不参与攒批: {audio_path}: {e}")
+            duration_ms = None
+        try:
+            success, subtitle_metrics = submit_transcription(
+                audio_path, output_path, model_size=WHISPER_MODEL_SIZE, duration_ms=duration_ms
+            ).result()
+        except Exception as e:
+            print(f"[WARN] 转录进程执行失败: {e}")
+            success, subtitle_metrics = False, {}
+        metrics.update(subtitle_metrics)
+        return success
+
+    path, cached = get_or_build('subtitle', [audio_hash], {'model': WHISPER_MODEL_SIZE}, build, '.vtt')
+    if cached:
+        metrics['cached'] = True
+    return path, metrics
+
+
+def build_merged_video(recording):
+    """
+    获取音频合并到录屏后的视频，相同录屏和音频内容已合并过时直接返回缓存
+
+    Returns:
+        (视频路径, 耗时指标)，失败时路径为 None
+    """
+    screen_hash, screen_path = _source(recording, 'screen')
+    audio_hash, audio_path = _source(recording, 'audio')
+    if not screen_path or not audio_path:
+        return None, {}
+
+    start = time.perf_counter()
+    path, cached = get_or_build(
+        'merged', [screen_hash, audio_hash], MERGE_PARAMS,
+        lambda output_path: combine_video_with_audio(screen_path, audio_path, output_path),
+        '.webm'
+    )
+    if cached:
+        return path, {'cached': True}
+    return path, {'elapsedMs': round((time.perf_counter() - start) * 1000)}
+
+
+def build_subtitled_video(recording, subtitle_path):
+    """
+    获取烧录字幕后的视频（有音频时包含音频），命中缓存时不运行 FFmpeg
+
+    Returns:
+        (视频路径, 是否命中缓存)，失败时路径为 None
+    """
+    screen_hash, screen_path = _source(recording, 'screen')
+    audio_hash, audio_path = _source(recording, 'audio')
+    if not screen_path:
+        return None, False
+    subtitle_hash = hash_file(subtitle_path)[0]
+
+    def build(output_path):
+        if audio_path:
+            # 一次 FFmpeg 调用完成音频合并和字幕烧录，不产生中间文件
+            return combine_video_audio_subtitle(screen_path, audio_path, subtitle_path, output_path)
+        return combine_video_with_subtitle(screen_path, subtitle_path, output_path)
+
+    return get_or_build(
+        'subtitled', [screen_hash, audio_hash, subtitle_hash], SUBTITLE_BURN_PARAMS, build, '.webm'
+    )
+
+
+def _generate_subtitled_video(hash_id):
+    """
+    生成带字幕视频（在懒生成线程中执行），缺少字幕时先生成字幕
+
+    Returns:
+        视频路径，失败时抛出异常
+    """
+    recording = get_recording(hash_id)
+    if not recording:
+        raise Exception(f'未找到录制: {hash_id}')
+
+    subtitle_path = recording['subtitle_path']
+    if not subtitle_path or not os.path.exists(subtitle_path):
+        subtitle_path, _ = build_subtitle(recording)
+        if not subtitle_path:
+            raise Exception('生成字幕失败，无法生成带字幕的视频')
+        set_recording_path(hash_id, 'subtitle_path', subtitle_path)
+        mark_artifact_rebuilt(hash_id, 'subtitle_status')
+
+    subtitled_video_path, _ = build_subtitled_video(recording, subtitle_path)
+    if not subtitled_video_path:
+        raise Exception('生成带字幕视频失败')
+
+    set_recording_path(hash_id, 'subtitled_video_path', subtitled_video_path)
+    return subtitled_video_path
+
+
+def submit_subtitled_video(hash_id):
+    """
+    提交带字幕视频的懒生成任务，同一录制的并发请求共享同一个进行中的任务
+
+    Returns:
+        {'future': Future（结果为视频路径）, 'startedAt': 开始时间（毫秒）}
+    """
+    with _lazy_builds_lock:
+        build = _lazy_builds.get(hash_id)
+        if build is None:
+            build = {
+                'future': _lazy_executor.submit(_generate_subtitled_video, hash_id),
+                'startedAt': int(time.time() * 1000),
+            }
+            _lazy_builds[hash_id] = build
+            _lazy_failures.pop(hash_id, None)
+            created = True
+        else:
+            created = False
+
+    if created:
+        # 完成后移除登记：成功的结果已写入数据库，失败的只记录错误，下次请求重新生成
+        def forget(future):
+            with _lazy_builds_lock:
+                if _lazy_builds.get(hash_id) is build:
+                    del _lazy_builds[hash_id]
+                if future.exception() is not None:
+                    _lazy_failures[hash_id] = {'startedAt': build['startedAt'], 'error': str(future.exception())}
+        build['future'].add_done_callback(forget)
+    return build
+
+
+def get_subtitled_video_build(hash_id):
+    """
+    查询带字幕视频懒生成任务的状态，没有进行中的任务也没有失败记录时返回 None
+    """
+    with _lazy_builds_lock:
+        build = _lazy_builds.get(hash_id)
+        failure = _lazy_failures.get(hash_id)
+    if build is None and failure is None:
+        return None
+
+    if build is None:
+        return {'status': 'failed', 'startedAt': failure['startedAt'], 'elapsedMs': None, 'error': failure['error']}
+    return {
+        'status': 'building',
+        'startedAt': build['startedAt'],
+        'elapsedMs': int(time.time() * 1000) - build['startedAt'],
+        'error': None,
+    }
+
+
+def set_recording_path(hash_id, column, path):
+    """
+    更新录制的一个媒体路径列，同步 media_assets 并使元数据缓存失效
+
+    Args:
+        column: recordings 的路径列（subtitle_path、screen_recording_path、subtitled_video_path 等）
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'UPDATE recordings SET {column} = ? WHERE id = ?', (path, hash_id))
+    upsert_media_asset(cursor, hash_id, ASSET_KINDS[column], path, size=os.path.getsize(path))
+    conn.commit()
+    conn.close()
+    invalidate_recording(hash_id)
+
+
+def _probe_assets(hash_id, metrics):
+    """
+    探测尚未探测的媒体资源，保存时长和编码（探测失败不影响任务结果）
+    """
+    start = time.perf_counter()
+    for kind, asset in get_media_assets(hash_id, unprobed_only=True).items():
+        if not asset['path'] or not os.path.exists(asset['path']):
+            continue
+        try:
+            result = probe_media(asset['path'])
+        except Exception as e:
+            print(f"[WARN] 探测媒体文件失败: {asset['path']}: {e}")
+            continue
+        update_probe_result(asset['id'], result['size'], result['duration'], result['codec'])
+    metrics['probe'] = {
+        'elapsedMs': round((time.perf_counter() - start) * 1000),
+        # 进程内探测缓存的累计统计
+        'probesAvoided': get_probe_stats()['probesAvoided'],
+    }
+
+
+def process_recording_job(job):
+    """
+    处理一个录制任务（可重复执行，已完成的产物会被跳过）
+
+    Args:
+        job: processing_jobs 表中的一行（dict）
+    """
+    hash_id = job['recording_id']
+
+    recording = get_recording(hash_id)
+    if not recording:
+        raise Exception(f'未找到录制: {hash_id}')
+
+    audio_path = recording['audio_path']
+    metrics = json.loads(job['metrics']) if job.get('metrics') else {}
+
+    if not audio_path or not os.path.exists(audio_path):
+        print(f"[INFO] 录制 {hash_id} 没有音频，无需生成字幕和合并")
+        _probe_assets(hash_id, metrics)
+        update_job(job['id'], metrics=metrics)
+        return
+
+    # 1. 生成字幕（相同音频内容已有字幕时直接复用缓存，跳过转录）
+    if job['subtitle_status'] != 'ready':
+        subtitle_path, metrics['subtitle'] = build_subtitle(recording)
+        if subtitle_path:
+            set_recording_path(hash_id, 'subtitle_path', subtitle_path)
+            update_job(job['id'], subtitle_status='ready', metrics=metrics)
+            print(f"[INFO] 字幕文件已生成: {subtitle_path}")
+        else:
+            update_job(job['id'], subtitle_status='failed', metrics=metrics)
+            print(f"[WARN] 生成字幕失败: {hash_id}")
+
+    # 2. 合并音频到录屏视频（录屏和音频内容都相同时直接复用缓存，跳过重新合并）
+    if job['merged_video_status'] != 'ready':
+        merged_video_path, metrics['merge'] = build_merged_video(recording)
+        if merged_video_path:
+            set_recording_path(hash_id, 'screen_recording_path', merged_video_path)
+            update_job(job['id'], merged_video_status='ready', metrics=metrics)
+            print(f"[INFO] 音频已合并到视频: {merged_video_path}")
+        else:
+            # 合并失败时继续使用原始录屏
+            update_job(job['id'], merged_video_status='failed', metrics=metrics)
+            print(f"[WARN] 合并音频失败，使用原始录屏: {hash_id}")
+
+    # 3. 探测各媒体文件的时长和编码，写入 media_assets
+    _probe_assets(hash_id, metrics)
+    update_job(job['id'], metrics=metrics)
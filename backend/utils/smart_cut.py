@@ -0,0 +1,231 @@
+"""
+关键帧感知的流复制裁剪（smart-cut）
+
+上传接口补齐麦克风 / 摄像头轨道时，fill_gaps 会把整条轨道重新编码。cut_track 改为：
+1. 一次性探测源视频的关键帧位置
+2. 开启时段内完整的 GOP 直接流复制，只重新编码时段开头和结尾不完整的 GOP
+3. 关闭时段和源文件不足总时长的部分使用与源文件编码参数一致的填充素材
+4. 所有片段流复制拼接
+音频包都可以独立解码，开启时段整段流复制，不需要重新编码。
+源文件的编码没有对应的编码器（无法生成可以直接拼接的片段）或裁剪失败时，退回 utils.track_assembly.fill_gaps：
+一个滤镜图整条重新编码，一次 FFmpeg 调用，不生成填充文件和临时片段。
+"""
+import os
+import re
+import math
+import subprocess
+from utils.media_probe import probe_media
+from utils.filler_cache import register_profile
+from utils.track_assembly import FFMPEG_PATH, run_ffmpeg, run_filler, fill_gaps, state_spans
+
+# 源编码 -> 生成片段和填充使用的编码器，只包含 WebM 可以容纳的编码（H.264 等由 fill_gaps 整条重新编码为 VP9）
+VIDEO_ENCODERS = {'vp8': 'libvpx', 'vp9': 'libvpx-vp9'}
+AUDIO_ENCODERS = {'opus': 'libopus', 'vorbis': 'libvorbis'}
+
+# 重新编码片段和填充的码率（与 fill_gaps 相同，screen 与分段录制的录屏填充相同）
+SMART_CUT_BITRATES = {'audio': '128k', 'camera': '500k', 'screen': '2M'}
+
+# 短于一帧的重新编码片段直接丢弃
+_MIN_ENCODE_MS = 34
+
+_PTS_TIME = re.compile(r'pts_time:(\d+(?:\.\d+)?)')
+
+
+def probe_keyframes(path):
+    """
+    探测视频流关键帧的时间（毫秒），只解码关键帧（-skip_frame nokey）
+
+    向上取整到毫秒：流复制时 -ss 定位到不晚于该时间的关键帧，向下取整会落到前一个关键帧
+    """
+    cmd = [
+        FFMPEG_PATH, '-hide_banner', '-skip_frame', 'nokey', '-i', path,
+        '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True)
+    stderr = result.stderr.decode('utf-8', errors='replace')
+    return sorted({math.ceil(float(value) * 1000) for value in _PTS_TIME.findall(stderr)})
+
+
+def plan_timeline(state_changes, total_duration, source_duration):
+    """
+    规划轨道时间线：开启时段中源文件覆盖的部分取自源文件，其余为填充
+
+    Returns:
+        [(类型 'source' | 'filler', 开始, 结束)]（毫秒），相邻的同类片段已合并
+    """
+    spans = state_spans(state_changes, total_duration) or [{'isEnabled': True, 'start': 0, 'end': total_duration}]
+
+    pieces = []
+
+    def add(kind, start, end):
+        if end <= start:
+            return
+        if pieces and pieces[-1][0] == kind and pieces[-1][2] == start:
+            pieces[-1] = (kind, pieces[-1][1], end)
+        else:
+            pieces.append((kind, start, end))
+
+    for span in spans:
+        start, end = span['start'], min(span['end'], total_duration)
+        if span['isEnabled']:
+            covered = max(start, min(end, source_duration))
+            add('source', start, covered)
+            add('filler', covered, end)
+        else:
+            add('filler', start, end)
+    return pieces
+
+
+def plan_cuts(start, end, keyframes):
+    """
+    把源文件的 [start, end)（毫秒）分成流复制和重新编码的部分
+
+    Args:
+        keyframes: 关键帧时间（毫秒），源文件结尾也视为 GOP 边界；None 表示每个包都可以独立解码（音频）
+
+    Returns:
+        [('copy' | 'encode', 开始, 结束)]
+    """
+    if keyframes is None:
+        return [('copy', start, end)]
+
+    bounds = [keyframe for keyframe in keyframes if start <= keyframe <= end]
+    if len(bounds) < 2:
+        # 时段内没有完整的 GOP
+        return [('encode', start, end)] if end - start >= _MIN_ENCODE_MS else []
+
+    cuts = []
+    if bounds[0] - start >= _MIN_ENCODE_MS:
+        cuts.append(('encode', start, bounds[0]))
+    cuts.append(('copy', bounds[0], bounds[-1]))
+    if end - bounds[-1] >= _MIN_ENCODE_MS:
+        cuts.append(('encode', bounds[-1], end))
+    return cuts
+
+
+def source_profile(track, stream):
+    """
+    源文件流对应的编码器和填充规格（注册到 utils.filler_cache），无法生成一致的片段时返回 None
+
+    Args:
+        track: 'audio'、'camera' 或 'screen'
+        stream: probe_media 返回的流信息
+
+    Returns:
+        (编码参数, 填充规格名) 或 None
+    """
+    bitrate = SMART_CUT_BITRATES[track]
+    if track == 'audio':
+        encoder = AUDIO_ENCODERS.get(stream['codec'])
+        if not encoder or stream['channels'] not in (1, 2) or not stream['sampleRate']:
+            return None
+        layout = 'mono' if stream['channels'] == 1 else 'stereo'
+        codec = ['-c:a', encoder, '-b:a', bitrate]
+        profile = register_profile(
+            f"{track}_{stream['codec']}_{stream['sampleRate']}_{layout}",
+            f"anullsrc=r={stream['sampleRate']}:cl={layout}", codec
+        )
+        return codec, profile
+
+    encoder = VIDEO_ENCODERS.get(stream['codec'])
+    if not encoder or not stream['width'] or not stream['height']:
+        return None
+    size = f"{stream['width']}x{stream['height']}"
+    codec = ['-c:v', encoder, '-b:v', bitrate, '-pix_fmt', 'yuv420p']
+    profile = register_profile(f"{track}_{stream['codec']}_{size}", f'color=c=black:s={size}:r=30', codec)
+    return codec, profile
+
+
+def _smart_cut(track, input_path, state_changes, total_duration, output_path):
+    probe = probe_media(input_path)
+    stream_type = 'audio' if track == 'audio' else 'video'
+    stream = next((s for s in probe['streams'] if s['type'] == stream_type), None)
+    if stream is None or probe['duration'] is None:
+        return None
+    source = source_profile(track, stream)
+    if source is None:
+        print(f"[INFO] {input_path} 的编码 {stream['codec']} 无法直接拼接，整条重新编码")
+        return None
+    codec, profile = source
+
+    source_duration = probe['duration']
+    keyframes = None
+    if stream_type == 'video':
+        keyframes = probe_keyframes(input_path) + [source_duration]
+
+    stream_map = '0:a:0' if stream_type == 'audio' else '0:v:0'
+    stats = {'mode': 'smart-cut', 'copiedMs': 0, 'encodedMs': 0, 'fillerMs': 0}
+    parts = []
+    jobs = []
+    for kind, start, end in plan_timeline(state_changes, total_duration, source_duration):
+        if kind == 'filler':
+            part = f'{output_path}.part{len(parts)}.webm'
+            jobs.append(run_filler(profile, end - start, part))
+            parts.append(part)
+            stats['fillerMs'] += end - start
+            continue
+        for action, cut_start, cut_end in plan_cuts(start, end, keyframes):
+            part = f'{output_path}.part{len(parts)}.webm'
+            seek = ['-ss', str(cut_start / 1000)]
+            duration = ['-t', str((cut_end - cut_start) / 1000), '-map', stream_map]
+            if keyframes is None:
+                # 纯音频 webm 通常没有索引，输入端定位只能落到簇的开头，改为在输出端按包丢弃
+                args = ['-i', input_path, *seek, *duration]
+            else:
+                # 视频在输入端定位：流复制从关键帧开始，重新编码时先解码到定位点再输出
+                args = [*seek, '-i', input_path, *duration]
+            if action == 'copy':
+                args += ['-c', 'copy', '-avoid_negative_ts', 'make_zero']
+                stats['copiedMs'] += cut_end - cut_start
+            else:
+                args += codec
+                stats['encodedMs'] += cut_end - cut_start
+            jobs.append(run_ffmpeg([*args, '-y', part]))
+            parts.append(part)
+
+    concat_list = f'{output_path}.txt'
+    try:
+        for job in jobs:
+            job.result()
+        with open(concat_list, 'w', encoding='utf-8') as f:
+            for part in parts:
+                f.write(f"file '{part}'\n")
+        run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', concat_list, '-c', 'copy', '-y', output_path]).result()
+    finally:
+        # 某个片段失败时其它片段可能仍在生成，等待结束后再删除，避免留下临时文件
+        for job in jobs:
+            job.exception()
+        for path in [*parts, concat_list]:
+            if os.path.exists(path):
+                os.unlink(path)
+    return stats
+
+
+def cut_track(track, input_path, state_changes, total_duration, output_path):
+    """
+    按状态变化记录补齐一条上传的轨道，尽量流复制，只重新编码不完整的 GOP
+
+    Args:
+        track: 'audio' 或 'camera'
+        state_changes: 按时间排序的状态变化记录，为空时只把轨道补齐到总时长
+        total_duration: 录制总时长（毫秒）
+
+    Returns:
+        {'mode': 'smart-cut' | 're-encode', 'copiedMs', 'encodedMs', 'fillerMs'}
+
+    Raises:
+        subprocess.CalledProcessError: 退回整条重新编码后仍然失败
+    """
+    try:
+        stats = _smart_cut(track, input_path, state_changes, total_duration, output_path)
+    except Exception as e:
+        print(f"[WARN] 流复制裁剪 {input_path} 失败，整条重新编码: {e}")
+        stats = None
+
+    if stats is None:
+        fill_gaps(track, input_path, state_changes, total_duration, output_path)
+        return {'mode': 're-encode', 'copiedMs': 0, 'encodedMs': total_duration, 'fillerMs': 0}
+
+    print(f"[INFO] 流复制裁剪完成: {output_path}，复制 {stats['copiedMs']}ms，"
+          f"重新编码 {stats['encodedMs']}ms，填充 {stats['fillerMs']}ms")
+    return stats
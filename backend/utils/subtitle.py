@@ -1,6 +1,125 @@
 import whisper
+import torch
 import os
 import datetime
+import threading
+import time
+from collections import OrderedDict
+
+# 已加载模型的内存预算（MB），超出后按最久未使用淘汰其它模型
+WHISPER_MODEL_MEMORY_BUDGET_MB = int(os.environ.get('WHISPER_MODEL_MEMORY_BUDGET_MB', '3072'))
+
+# 启动时预热的模型，多个用逗号分隔，留空则不预热
+WHISPER_PRELOAD_MODELS = os.environ.get('WHISPER_PRELOAD_MODELS', 'base')
+
+# model_size -> {'model': ..., 'memory': 字节数, 'lock': 推理锁}
+_models = OrderedDict()
+_models_lock = threading.Lock()
+_load_locks = {}
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _model_memory(model):
+    """
+    估算模型参数和缓冲区占用的内存（字节）
+    """
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _evict_models(keep):
+    """
+    超出内存预算时淘汰最久未使用的模型（调用方需持有 _models_lock）
+    """
+    budget = WHISPER_MODEL_MEMORY_BUDGET_MB * 1024 * 1024
+    total = sum(entry['memory'] for entry in _models.values())
+    for size in list(_models.keys()):
+        if total <= budget:
+            break
+        if size == keep:
+            continue
+        total -= _models.pop(size)['memory']
+        _cache_stats['evictions'] += 1
+        print(f"[INFO] 淘汰 Whisper 模型: {size}")
+
+
+def get_model(model_size: str = "base"):
+    """
+    获取常驻内存的 Whisper 模型，每个进程中每种大小只加载一次
+
+    Returns:
+        (模型缓存项, 加载耗时秒数)，命中缓存时耗时为 0
+    """
+    with _models_lock:
+        entry = _models.get(model_size)
+        if entry:
+            _models.move_to_end(model_size)
+            _cache_stats['hits'] += 1
+            return entry, 0.0
+        load_lock = _load_locks.setdefault(model_size, threading.Lock())
+
+    # 同一模型只允许一个线程加载，其它线程等待后直接复用
+    with load_lock:
+        with _models_lock:
+            entry = _models.get(model_size)
+            if entry:
+                _models.move_to_end(model_size)
+                _cache_stats['hits'] += 1
+                return entry, 0.0
+
+        print(f"正在加载 Whisper 模型: {model_size}...")
+        start = time.perf_counter()
+        model = whisper.load_model(model_size)
+        load_seconds = time.perf_counter() - start
+
+        entry = {'model': model, 'memory': _model_memory(model), 'lock': threading.Lock()}
+        with _models_lock:
+            _models[model_size] = entry
+            _cache_stats['misses'] += 1
+            _evict_models(keep=model_size)
+
+        print(f"[INFO] Whisper 模型 {model_size} 加载完成，耗时 {load_seconds * 1000:.0f}ms，"
+              f"占用约 {entry['memory'] / 1024 / 1024:.0f}MB")
+        return entry, load_seconds
+
+
+def preload_models(model_sizes=None, background=True):
+    """
+    预热 Whisper 模型，避免第一个请求承担模型加载时间
+
+    Args:
+        model_sizes: 模型大小列表，默认读取 WHISPER_PRELOAD_MODELS
+        background: 是否在后台线程中加载
+    """
+    if model_sizes is None:
+        model_sizes = [size.strip() for size in WHISPER_PRELOAD_MODELS.split(',') if size.strip()]
+    if not model_sizes:
+        return
+
+    def load_all():
+        for size in model_sizes:
+            try:
+                get_model(size)
+            except Exception as e:
+                print(f"[WARN] 预热 Whisper 模型 {size} 失败: {e}")
+
+    if background:
+        threading.Thread(target=load_all, name='whisper-preload', daemon=True).start()
+    else:
+        load_all()
+
+
+def get_model_cache_stats():
+    """
+    获取模型缓存的命中情况和内存占用
+    """
+    with _models_lock:
+        return {
+            **_cache_stats,
+            'models': {size: entry['memory'] for size, entry in _models.items()},
+            'budgetBytes': WHISPER_MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+        }
+
 
 def format_timestamp(seconds: float):
     """
@@ -13,36 +132,143 @@ def format_timestamp(seconds: float):
     minutes = (total_seconds % 3600) // 60
     secs = total_seconds % 60
     millis = int(td.microseconds / 1000)
-    
+
     return f"{hours:02}:{minutes:02}:{secs:02}.{millis:03}"
 
-def generate_vtt(audio_path: str, output_path: str, model_size: str = "base"):
+def write_vtt(segments, output_path: str):
+    """
+    将转录片段写入 VTT 字幕文件
+
+    Args:
+        segments: [{'start': 秒, 'end': 秒, 'text': 文本}, ...]
+        output_path: 输出 VTT 文件路径
+    """
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for segment in segments:
+            start = format_timestamp(segment["start"])
+            end = format_timestamp(segment["end"])
+            text = segment["text"].strip()
+            f.write(f"{start} --> {end}\n{text}\n\n")
+
+def generate_vtt(audio_path: str, output_path: str, model_size: str = "base", metrics: dict = None):
     """
     使用 Whisper 生成 VTT 字幕文件
-    
+
     Args:
         audio_path: 音频文件路径
         output_path: 输出 VTT 文件路径
         model_size: Whisper 模型大小 (tiny, base, small, medium, large)
+        metrics: 可选，传入 dict 时写入本次的模型加载耗时和转录耗时（毫秒）
     """
     try:
-        print(f"正在加载 Whisper 模型: {model_size}...")
-        model = whisper.load_model(model_size)
-        
+        entry, load_seconds = get_model(model_size)
+
         print(f"正在转录 {audio_path}...")
-        result = model.transcribe(audio_path)
-        
+        start = time.perf_counter()
+        # 转录时会在模型上挂载 kv-cache 钩子，同一个模型实例需串行使用
+        with entry['lock']:
+            result = entry['model'].transcribe(audio_path)
+        transcribe_seconds = time.perf_counter() - start
+
         print(f"正在写入 VTT 字幕到 {output_path}...")
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write("WEBVTT\n\n")
-            for segment in result["segments"]:
-                start = format_timestamp(segment["start"])
-                end = format_timestamp(segment["end"])
-                text = segment["text"].strip()
-                f.write(f"{start} --> {end}\n{text}\n\n")
-                
+        write_vtt(result["segments"], output_path)
+
+        print(f"[INFO] 字幕生成耗时: 模型加载 {load_seconds * 1000:.0f}ms, 转录 {transcribe_seconds * 1000:.0f}ms")
+        if metrics is not None:
+            metrics.update({
+                'model': model_size,
+                'modelCached': load_seconds == 0,
+                'loadMs': round(load_seconds * 1000),
+                'transcribeMs': round(transcribe_seconds * 1000),
+            })
+
         return True
     except Exception as e:
         print(f"生成字幕出错: {str(e)}")
         # 即使失败也不要抛出异常中断主流程，返回 False 即可
         return False
+
+
+def _segments_from_tokens(tokens, tokenizer, duration: float):
+    """
+    根据解码结果中的时间戳 token 切分字幕片段（每个时间戳 token 间隔 0.02 秒）
+    """
+    segments = []
+    start = None
+    text_tokens = []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            timestamp = (token - tokenizer.timestamp_begin) * 0.02
+            if text_tokens:
+                segments.append({
+                    'start': start or 0.0,
+                    'end': min(timestamp, duration),
+                    'text': tokenizer.decode(text_tokens),
+                })
+                text_tokens = []
+                start = None
+            else:
+                start = timestamp
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+
+    if text_tokens:
+        segments.append({'start': start or 0.0, 'end': duration, 'text': tokenizer.decode(text_tokens)})
+
+    return [segment for segment in segments if segment['text'].strip()]
+
+
+def transcribe_clips(clips, model_size: str = "base"):
+    """
+    批量转录多个短音频（每个不超过 30 秒），一次前向计算解码整批音频
+
+    Args:
+        clips: [(音频路径, 输出 VTT 路径), ...]
+        model_size: Whisper 模型大小
+
+    Returns:
+        与 clips 一一对应的 [(是否成功, 耗时指标), ...]
+    """
+    entry, load_seconds = get_model(model_size)
+    model = entry['model']
+
+    start = time.perf_counter()
+    mels = []
+    durations = []
+    for audio_path, _ in clips:
+        audio = whisper.load_audio(audio_path)
+        durations.append(len(audio) / whisper.audio.SAMPLE_RATE)
+        mels.append(whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels))
+    mel = torch.stack(mels).to(model.device)
+
+    options = whisper.DecodingOptions(fp16=model.device.type == 'cuda')
+    with entry['lock']:
+        results = model.decode(mel, options)
+    transcribe_seconds = time.perf_counter() - start
+
+    print(f"[INFO] 批量转录 {len(clips)} 段音频: 模型加载 {load_seconds * 1000:.0f}ms, 转录 {transcribe_seconds * 1000:.0f}ms")
+
+    outcomes = []
+    for (audio_path, output_path), result, duration in zip(clips, results, durations):
+        metrics = {
+            'model': model_size,
+            'modelCached': load_seconds == 0,
+            'loadMs': round(load_seconds * 1000),
+            'transcribeMs': round(transcribe_seconds * 1000),
+            'batchSize': len(clips),
+        }
+        try:
+            tokenizer = whisper.tokenizer.get_tokenizer(
+                model.is_multilingual,
+                num_languages=model.num_languages,
+                language=result.language,
+                task='transcribe'
+            )
+            write_vtt(_segments_from_tokens(result.tokens, tokenizer, duration), output_path)
+            outcomes.append((True, metrics))
+        except Exception as e:
+            print(f"生成字幕出错: {audio_path}: {str(e)}")
+            outcomes.append((False, metrics))
+
+    return outcomes
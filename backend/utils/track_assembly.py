@@ -0,0 +1,220 @@
+"""
+旧版分段录制的轨道合成
+
+录制会话完成时，录屏、摄像头、音频三条轨道的分段需要各自拼接成完整文件，分段之间的间隙用黑屏 / 静音填充。
+三条轨道互不依赖：
+1. 先为所有轨道规划时间线（分段和间隙）
+2. 每条轨道由一个协调线程负责，间隙填充和最终拼接作为独立的 FFmpeg 任务提交到共享的有界进程池，
+   同时运行的 FFmpeg 进程数不超过 ASSEMBLY_WORKERS（默认等于 CPU 核数）
+3. 返回每条轨道的耗时，合成总耗时取决于最慢的轨道而不是分段总数
+
+上传接口补齐麦克风 / 摄像头轨道时，utils.smart_cut.cut_track 无法流复制的轨道由 fill_gaps 整条重新编码：原始文件与录制时间线对齐，
+关闭时段在同一个滤镜图里静音 / 涂黑，不足总时长的部分补齐，一次 FFmpeg 调用得到完整的轨道，不生成填充文件。
+"""
+import os
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from utils.filler_cache import compose_filler
+
+FFMPEG_PATH = 'ffmpeg'
+
+# 同时运行的 FFmpeg 进程数
+ASSEMBLY_WORKERS = int(os.environ.get('ASSEMBLY_WORKERS', str(os.cpu_count() or 1)))
+
+# 会话的轨道，填充使用 utils.filler_cache 中同名的规格
+TRACKS = ('screen', 'camera', 'audio')
+
+# 上传接口补齐轨道时的编码参数
+GAP_FILL_CODECS = {
+    'audio': ['-c:a', 'libopus', '-b:a', '128k'],
+    'camera': ['-c:v', 'libvpx-vp9', '-b:v', '500k'],
+}
+
+# 每个工作线程同一时间只等待一个 FFmpeg 子进程，线程数即 FFmpeg 进程数上限
+_ffmpeg_pool = ThreadPoolExecutor(max_workers=ASSEMBLY_WORKERS, thread_name_prefix='ffmpeg')
+
+
+def run_ffmpeg(args):
+    """
+    提交一个 FFmpeg 命令到进程池
+
+    Returns:
+        Future，失败时 result() 抛出 subprocess.CalledProcessError
+    """
+    return _ffmpeg_pool.submit(subprocess.run, [FFMPEG_PATH, *args], check=True, capture_output=True)
+
+
+def run_filler(profile, duration, output_path):
+    """
+    提交一个填充片段的生成任务到进程池
+
+    Returns:
+        Future，结果为输出路径
+    """
+    return _ffmpeg_pool.submit(compose_filler, profile, duration, output_path)
+
+
+def plan_track(segments, total_duration):
+    """
+    规划一条轨道的时间线
+
+    Args:
+        segments: [{'start', 'end', 'path'}]（毫秒），按开始时间排序
+        total_duration: 会话总时长（毫秒），没有任何分段时整条轨道为填充
+
+    Returns:
+        [{'type': 'segment', 'path'} | {'type': 'gap', 'duration'（毫秒）}]
+
+    每个间隙按精确时长填充（compose_filler 从素材块截取任意时长），时间线不会累积偏差。
+    """
+    if not segments:
+        return [{'type': 'gap', 'duration': total_duration}]
+
+    pieces = []
+    prev_end = 0
+    for i, segment in enumerate(segments):
+        # 只填充分段之间的间隙
+        if i > 0 and segment['start'] > prev_end:
+            pieces.append({'type': 'gap', 'duration': segment['start'] - prev_end})
+        pieces.append({'type': 'segment', 'path': segment['path']})
+        prev_end = segment['end']
+    return pieces
+
+
+def _assemble_track(track, pieces, output_path):
+    start = time.perf_counter()
+    work_folder = os.path.dirname(output_path)
+
+    if len(pieces) == 1 and pieces[0]['type'] == 'gap':
+        run_filler(track, pieces[0]['duration'], output_path).result()
+        return {'path': output_path, 'seconds': round(time.perf_counter() - start, 3), 'ffmpegJobs': 1}
+
+    # 所有间隙的填充片段并发生成（由缓存的素材块拼接，不重新编码）
+    files = []
+    fillers = []
+    jobs = []
+    for i, piece in enumerate(pieces):
+        if piece['type'] == 'segment':
+            files.append(piece['path'])
+            continue
+        filler_path = os.path.join(work_folder, f'{track}_gap_{i}.webm')
+        jobs.append(run_filler(track, piece['duration'], filler_path))
+        files.append(filler_path)
+        fillers.append(filler_path)
+
+    concat_list = os.path.join(work_folder, f'{track}_concat.txt')
+    try:
+        for job in jobs:
+            job.result()
+        with open(concat_list, 'w', encoding='utf-8') as f:
+            for path in files:
+                f.write(f"file '{path}'\n")
+        run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', concat_list, '-c', 'copy', '-y', output_path]).result()
+    finally:
+        for path in [*fillers, concat_list]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    return {'path': output_path, 'seconds': round(time.perf_counter() - start, 3), 'ffmpegJobs': len(jobs) + 1}
+
+
+def assemble_session(segments, total_duration, output_paths, tracks=TRACKS):
+    """
+    合成一个会话的轨道
+
+    Args:
+        segments: {轨道名: [{'start', 'end', 'path'}]}，轨道名为 screen、camera、audio
+        total_duration: 会话总时长（毫秒）
+        output_paths: {轨道名: 输出路径}
+        tracks: 需要合成的轨道，默认全部（已增量合成的轨道不需要再合成）
+
+    Returns:
+        {轨道名: {'path', 'seconds', 'ffmpegJobs'}}
+
+    Raises:
+        subprocess.CalledProcessError: 任一 FFmpeg 任务失败（其它轨道仍会执行完毕）
+    """
+    plans = {track: plan_track(segments.get(track, []), total_duration) for track in tracks}
+
+    if not plans:
+        return {}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plans), thread_name_prefix='assemble') as coordinators:
+        futures = {
+            track: coordinators.submit(_assemble_track, track, pieces, output_paths[track])
+            for track, pieces in plans.items()
+        }
+        results = {track: future.result() for track, future in futures.items()}
+
+    timings = ', '.join(f"{track} {result['seconds']}s" for track, result in results.items())
+    print(f"[INFO] 会话轨道合成完成，耗时 {time.perf_counter() - start:.2f}s（{timings}）")
+    return results
+
+
+def state_spans(state_changes, total_duration):
+    """
+    把按时间排序的状态变化记录展开为覆盖整个录制的时间段，第一次状态变化之前沿用第一条记录的状态
+
+    Returns:
+        [{'isEnabled', 'start', 'end'}]（毫秒）
+    """
+    if not state_changes:
+        return []
+
+    spans = []
+    first = state_changes[0]
+    if first['timestamp'] > 0:
+        spans.append({'isEnabled': first['isEnabled'], 'start': 0, 'end': first['timestamp']})
+    for i, change in enumerate(state_changes):
+        end = state_changes[i + 1]['timestamp'] if i + 1 < len(state_changes) else total_duration
+        spans.append({'isEnabled': change['isEnabled'], 'start': change['timestamp'], 'end': end})
+    return spans
+
+
+def gap_fill_filter(track, state_changes, total_duration):
+    """
+    构造补齐一条轨道的滤镜图，输入为 [0]，输出为 [out]
+
+    原始文件的时间与录制时间线一致：先补齐（apad / tpad）并截取到总时长，
+    再对关闭时段启用 volume=0 / 黑色 drawbox，关闭时段的时间戳来自状态变化记录。
+    """
+    seconds = f'{total_duration / 1000:.3f}'
+    disabled = [
+        f"between(t,{span['start'] / 1000:.3f},{span['end'] / 1000:.3f})"
+        for span in state_spans(state_changes, total_duration)
+        if not span['isEnabled'] and span['end'] > span['start']
+    ]
+
+    if track == 'audio':
+        chain = [f'[0:a]apad=whole_dur={seconds}', f'atrim=0:{seconds}', 'asetpts=PTS-STARTPTS']
+        if disabled:
+            chain.append(f"volume=0:enable='{'+'.join(disabled)}'")
+    else:
+        # 录制文件通常是可变帧率，先统一为 30fps 再在结尾补黑帧
+        chain = ['[0:v]fps=30', 'tpad=stop=-1', f'trim=0:{seconds}', 'setpts=PTS-STARTPTS']
+        if disabled:
+            chain.append(f"drawbox=x=0:y=0:w=iw:h=ih:color=black:t=fill:enable='{'+'.join(disabled)}'")
+    return ','.join(chain) + '[out]'
+
+
+def fill_gaps(track, input_path, state_changes, total_duration, output_path):
+    """
+    按状态变化记录补齐一条上传的轨道，一次 FFmpeg 调用完成
+
+    Args:
+        track: 'audio' 或 'camera'
+        state_changes: 按时间排序的状态变化记录，为空时只把轨道补齐到总时长
+        total_duration: 录制总时长（毫秒）
+
+    Raises:
+        subprocess.CalledProcessError: FFmpeg 执行失败
+    """
+    args = [
+        '-i', input_path,
+        '-filter_complex', gap_fill_filter(track, state_changes, total_duration),
+        '-map', '[out]', *GAP_FILL_CODECS[track], '-y', output_path
+    ]
+    run_ffmpeg(args).result()
+    return output_path
@@ -0,0 +1,503 @@
+"""
+轨迹数据的二进制存储
+
+轨迹（鼠标点 {x, y, timestamp}、白板操作、音频 / 摄像头状态变化）按时间排序后分块存储：
+- 鼠标点按列存储，timestamp / x / y 分别做差分编码，按数值范围选用最小的整数类型，再用 zlib 压缩
+- 其它带 timestamp 的事件序列按块序列化为紧凑 JSON 后压缩
+- 文件头保存每个块的偏移、点数和时间范围，按时间窗口读取时只解压与窗口重叠的块
+- 鼠标点额外保存若干简化层级（Ramer–Douglas–Peucker，容差逐级增大），缩略图、拖动预览等场景按 level / max_points 读取
+
+文件结构：MAGIC | 版本号 (uint16) | 索引长度 (uint32) | zlib 压缩的 JSON 索引 | 数据块...
+整数均为小端序。
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import bisect
+import heapq
+import threading
+from array import array
+from itertools import accumulate
+from collections import OrderedDict
+import numpy as np
+
+MAGIC = b'SRTJ'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHI')
+
+# 鼠标点每块的点数
+TRAJECTORY_BLOCK_POINTS = int(os.environ.get('TRAJECTORY_BLOCK_POINTS', '4096'))
+
+# 事件序列每块的事件数
+TRAJECTORY_BLOCK_EVENTS = int(os.environ.get('TRAJECTORY_BLOCK_EVENTS', '512'))
+
+# 鼠标点简化层级的容差（像素），从细到粗，逗号分隔
+TRAJECTORY_LEVEL_TOLERANCES = [
+    float(value) for value in os.environ.get('TRAJECTORY_LEVEL_TOLERANCES', '1,4,16').split(',') if value.strip()
+]
+
+# 简化时每次处理的点数（分段端点保留），限制最坏情况下的计算量
+_SIMPLIFY_CHUNK = 4096
+
+# 简化后点数超过上一层的该比例时不保存这一层
+_LEVEL_MIN_REDUCTION = 0.8
+
+# 按列存储的点序列的字段
+POINT_COLUMNS = ('timestamp', 'x', 'y')
+
+# 非整数坐标 / 时间戳保留的小数位数（按 10^3 缩放为整数存储）
+_FLOAT_SCALE = 1000
+
+# 按数值范围从小到大尝试的整数类型
+_TYPECODES = ('b', 'h', 'i', 'q')
+_TYPE_RANGES = {'b': 2 ** 7, 'h': 2 ** 15, 'i': 2 ** 31, 'q': 2 ** 63}
+
+# 已解析的索引缓存：路径 -> ((大小, 修改时间), 索引)
+_INDEX_CACHE_SIZE = 256
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class TrajectoryFormatError(ValueError):
+    """
+    轨迹文件不是有效的二进制轨迹格式
+    """
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_point_series(items):
+    return bool(items) and all(
+        isinstance(item, dict) and item.keys() == set(POINT_COLUMNS) and all(_is_number(v) for v in item.values())
+        for item in items
+    )
+
+
+def _is_event_series(items):
+    return bool(items) and all(
+        isinstance(item, dict) and _is_number(item.get('timestamp')) for item in items
+    )
+
+
+def _column_scale(values):
+    return 1 if all(float(v).is_integer() for v in values) else _FLOAT_SCALE
+
+
+def _encode_column(values, scale):
+    """
+    差分编码一列数值，返回 (类型码, 字节)
+    """
+    scaled = [round(v * scale) for v in values]
+    deltas = [scaled[0]] + [b - a for a, b in zip(scaled, scaled[1:])]
+    low, high = min(deltas), max(deltas)
+    typecode = next(t for t in _TYPECODES if -_TYPE_RANGES[t] <= low and high < _TYPE_RANGES[t])
+    encoded = array(typecode, deltas)
+    if sys.byteorder == 'big':
+        encoded.byteswap()
+    return typecode, encoded.tobytes()
+
+
+def _decode_column(data, typecode, scale):
+    decoded = array(typecode)
+    decoded.frombytes(data)
+    if sys.byteorder == 'big':
+        decoded.byteswap()
+    values = accumulate(decoded)
+    if scale == 1:
+        return list(values)
+    return [v / scale for v in values]
+
+
+def _simplify_chunk(xs, ys, tolerance, keep):
+    stack = [(0, len(xs) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        px = xs[first + 1:last] - xs[first]
+        py = ys[first + 1:last] - ys[first]
+        dx = xs[last] - xs[first]
+        dy = ys[last] - ys[first]
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(dy * px - dx * py) / norm
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+
+def simplify_points(items, tolerance):
+    """
+    Ramer–Douglas–Peucker 简化鼠标点（按 x / y 计算距离，保留点的原始时间戳）
+
+    按 _SIMPLIFY_CHUNK 分段简化，分段端点总是保留。
+
+    Returns:
+        保留的点列表
+    """
+    if len(items) < 3:
+        return list(items)
+    xs = np.fromiter((item['x'] for item in items), dtype=np.float64, count=len(items))
+    ys = np.fromiter((item['y'] for item in items), dtype=np.float64, count=len(items))
+    keep = np.zeros(len(items), dtype=bool)
+    keep[0] = keep[-1] = True
+    for first in range(0, len(items) - 1, _SIMPLIFY_CHUNK):
+        last = min(first + _SIMPLIFY_CHUNK, len(items) - 1)
+        keep[last] = True
+        _simplify_chunk(xs[first:last + 1], ys[first:last + 1], tolerance, keep[first:last + 1])
+    return [items[i] for i in np.flatnonzero(keep)]
+
+
+def decimate(items, max_points):
+    """
+    按下标均匀抽取最多 max_points 个点（保留首尾）
+    """
+    if len(items) <= max_points:
+        return items
+    if max_points <= 1:
+        return items[:max_points]
+    step = (len(items) - 1) / (max_points - 1)
+    return [items[round(i * step)] for i in range(max_points)]
+
+
+def _encode_points(items):
+    scales = {column: _column_scale([item[column] for item in items]) for column in POINT_COLUMNS}
+    blocks = []
+    for i in range(0, len(items), TRAJECTORY_BLOCK_POINTS):
+        chunk = items[i:i + TRAJECTORY_BLOCK_POINTS]
+        typecodes = []
+        payload = b''
+        for column in POINT_COLUMNS:
+            typecode, data = _encode_column([item[column] for item in chunk], scales[column])
+            typecodes.append(typecode)
+            payload += data
+        blocks.append(({
+            'count': len(chunk),
+            'start': chunk[0]['timestamp'],
+            'end': chunk[-1]['timestamp'],
+            'types': ''.join(typecodes),
+        }, zlib.compress(payload)))
+    return {'type': 'points', 'scales': scales}, blocks
+
+
+def _encode_events(items):
+    blocks = []
+    for i in range(0, len(items), TRAJECTORY_BLOCK_EVENTS):
+        chunk = items[i:i + TRAJECTORY_BLOCK_EVENTS]
+        payload = json.dumps(chunk, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        blocks.append(({
+            'count': len(chunk),
+            'start': chunk[0]['timestamp'],
+            'end': chunk[-1]['timestamp'],
+        }, zlib.compress(payload)))
+    return {'type': 'events'}, blocks
+
+
+def encode_trajectory(trajectory_data):
+    """
+    将 JSON 结构的轨迹数据编码为二进制格式
+
+    值为列表且每项都带数值 timestamp 的字段按时间排序（稳定排序）后分块存储，
+    其中只含 x / y / timestamp 的按列存储；其它字段原样保存在索引中。
+
+    Returns:
+        bytes
+    """
+    series = {}
+    extra = {}
+    data = bytearray()
+
+    def layout(items, encoded):
+        meta, blocks = encoded
+        meta['count'] = len(items)
+        meta['start'] = items[0]['timestamp']
+        meta['end'] = items[-1]['timestamp']
+        meta['blocks'] = []
+        for block, payload in blocks:
+            block['offset'] = len(data)
+            block['length'] = len(payload)
+            meta['blocks'].append(block)
+            data.extend(payload)
+        return meta
+
+    for name, items in trajectory_data.items():
+        is_points = isinstance(items, list) and _is_point_series(items)
+        if not is_points and not (isinstance(items, list) and _is_event_series(items)):
+            extra[name] = items
+            continue
+
+        items = sorted(items, key=lambda item: item['timestamp'])
+        if not is_points:
+            series[name] = layout(items, _encode_events(items))
+            continue
+
+        meta = layout(items, _encode_points(items))
+        # 每层在上一层的基础上继续简化
+        meta['levels'] = []
+        previous = items
+        for tolerance in TRAJECTORY_LEVEL_TOLERANCES:
+            simplified = simplify_points(previous, tolerance)
+            if len(simplified) > len(previous) * _LEVEL_MIN_REDUCTION:
+                continue
+            level = layout(simplified, _encode_points(simplified))
+            level['tolerance'] = tolerance
+            meta['levels'].append(level)
+            previous = simplified
+        series[name] = meta
+
+    index = zlib.compress(json.dumps({'series': series, 'extra': extra}, separators=(',', ':')).encode('utf-8'))
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, len(index)) + index + bytes(data)
+
+
+def write_trajectory(trajectory_data, path):
+    """
+    将轨迹数据以二进制格式写入文件（先写临时文件再原子替换）
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(encode_trajectory(trajectory_data))
+    os.replace(temp_path, path)
+    return path
+
+
+def convert_json_trajectory(json_path, output_path=None):
+    """
+    将旧的 JSON 轨迹文件转换为二进制格式
+
+    Args:
+        json_path: JSON 轨迹文件
+        output_path: 输出路径，默认与 JSON 文件同名、扩展名为 .traj
+
+    Returns:
+        输出路径
+    """
+    if output_path is None:
+        output_path = os.path.splitext(json_path)[0] + '.traj'
+    with open(json_path, 'r', encoding='utf-8') as f:
+        trajectory_data = json.load(f)
+    return write_trajectory(trajectory_data, output_path)
+
+
+def _parse_index(path):
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise TrajectoryFormatError(f'轨迹文件头不完整: {path}')
+        magic, version, index_length = _HEADER.unpack(header)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise TrajectoryFormatError(f'不支持的轨迹文件格式: {path}')
+        index = json.loads(zlib.decompress(f.read(index_length)))
+
+    index['dataOffset'] = _HEADER.size + index_length
+    for meta in index['series'].values():
+        for view in [meta, *meta.get('levels', [])]:
+            # 块按时间排序，起止时间均单调不减，可二分查找与窗口重叠的块
+            view['blockStarts'] = [block['start'] for block in view['blocks']]
+            view['blockEnds'] = [block['end'] for block in view['blocks']]
+        for level in meta.get('levels', []):
+            level['type'] = meta['type']
+    return index
+
+
+def load_index(path):
+    """
+    读取轨迹文件的索引（按路径 + 大小 + 修改时间缓存）
+    """
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    with _indexes_lock:
+        entry = _indexes.get(path)
+        if entry and entry[0] == version:
+            _indexes.move_to_end(path)
+            return entry[1]
+
+    index = _parse_index(path)
+    with _indexes_lock:
+        _indexes[path] = (version, index)
+        _indexes.move_to_end(path)
+        while len(_indexes) > _INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _decode_block(f, index, meta, block):
+    f.seek(index['dataOffset'] + block['offset'])
+    payload = zlib.decompress(f.read(block['length']))
+    if meta['type'] == 'events':
+        return json.loads(payload)
+
+    columns = {}
+    position = 0
+    for column, typecode in zip(POINT_COLUMNS, block['types']):
+        length = array(typecode).itemsize * block['count']
+        columns[column] = _decode_column(payload[position:position + length], typecode, meta['scales'][column])
+        position += length
+    return [
+        {'x': x, 'y': y, 'timestamp': timestamp}
+        for timestamp, x, y in zip(columns['timestamp'], columns['x'], columns['y'])
+    ]
+
+
+def _series_view(meta, level):
+    """
+    获取序列的某个层级，0 为原始数据，超过已有层级时取最粗的一层
+    """
+    levels = meta.get('levels', [])
+    if not level or not levels:
+        return meta
+    return levels[min(level, len(levels)) - 1]
+
+
+def _pick_level(meta, start, end, max_points):
+    """
+    选择时间窗口内点数估计不超过 max_points 的最细层级
+    """
+    levels = [meta, *meta.get('levels', [])]
+    span = meta['end'] - meta['start']
+    low = meta['start'] if start is None else max(start, meta['start'])
+    high = meta['end'] if end is None else min(end, meta['end'])
+    fraction = 1 if span <= 0 else max(high - low, 0) / span
+    for level, view in enumerate(levels):
+        if view['count'] * fraction <= max_points:
+            return level
+    return len(levels) - 1
+
+
+def _read_points(path, name, meta, start, end, level, max_points):
+    if max_points:
+        level = _pick_level(meta, start, end, max_points)
+    items = [item for items in iter_series_blocks(path, name, start, end, level) for item in items]
+    return decimate(items, max_points) if max_points else items
+
+
+def iter_series_blocks(path, name, start=None, end=None, level=0):
+    """
+    逐块读取一个序列在时间窗口 [start, end] 内的数据
+
+    Args:
+        level: 鼠标点的简化层级，0 为原始数据，事件序列忽略
+
+    Yields:
+        每块中落在窗口内的数据列表
+    """
+    index = load_index(path)
+    meta = index['series'].get(name)
+    if not meta:
+        return
+    meta = _series_view(meta, level)
+
+    first = 0 if start is None else bisect.bisect_left(meta['blockEnds'], start)
+    last = len(meta['blocks']) if end is None else bisect.bisect_right(meta['blockStarts'], end)
+    if first >= last:
+        return
+
+    with open(path, 'rb') as f:
+        for block in meta['blocks'][first:last]:
+            items = _decode_block(f, index, meta, block)
+            timestamps = [item['timestamp'] for item in items]
+            low = 0 if start is None else bisect.bisect_left(timestamps, start)
+            high = len(items) if end is None else bisect.bisect_right(timestamps, end)
+            if low < high:
+                yield items[low:high]
+
+
+def read_trajectory(path, start=None, end=None, series=None, level=0, max_points=None):
+    """
+    读取轨迹数据，可只读取时间窗口 [start, end]（毫秒，含端点）内的部分
+
+    Args:
+        path: 二进制轨迹文件；旧的 .json 轨迹文件会被完整读取后按窗口过滤
+        start / end: 时间窗口，None 表示不限
+        series: 只读取指定的字段名集合，None 表示全部
+        level: 鼠标点的简化层级，0 为原始数据
+        max_points: 每个鼠标点序列最多返回的点数，自动选择层级，仍超出时均匀抽取（优先于 level）；
+            白板操作等事件序列不做简化
+
+    Returns:
+        与原 JSON 结构相同的 dict
+    """
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            trajectory_data = json.load(f)
+        return _filter_json(trajectory_data, start, end, series, max_points)
+
+    index = load_index(path)
+    result = {name: value for name, value in index['extra'].items() if series is None or name in series}
+    for name, meta in index['series'].items():
+        if series is not None and name not in series:
+            continue
+        if meta['type'] == 'points':
+            result[name] = _read_points(path, name, meta, start, end, level, max_points)
+        else:
+            result[name] = [item for items in iter_series_blocks(path, name, start, end) for item in items]
+    return result
+
+
+def _tag_events(name, blocks):
+    for items in blocks:
+        for item in items:
+            yield item['timestamp'], name, item
+
+
+def iter_trajectory(path, start=None, end=None, series=None, level=0, max_points=None):
+    """
+    按时间顺序逐个读取轨迹事件，用于流式输出（每次只解压一个块）
+
+    Args:
+        同 read_trajectory
+
+    Returns:
+        (extra, events)
+        - extra: 不带时间戳的字段 {名称: 值}
+        - events: 迭代器，按 timestamp 顺序产生 (序列名, 事件)，多个序列归并排序
+    """
+    if path.endswith('.json'):
+        extra = {}
+        iterators = []
+        for name, items in read_trajectory(path, series=series).items():
+            if isinstance(items, list) and _is_event_series(items):
+                items = _filter_json({name: items}, start, end, None, max_points)[name]
+                iterators.append(_tag_events(name, [sorted(items, key=lambda item: item['timestamp'])]))
+            else:
+                extra[name] = items
+    else:
+        index = load_index(path)
+        extra = {name: value for name, value in index['extra'].items() if series is None or name in series}
+        iterators = []
+        for name, meta in index['series'].items():
+            if series is not None and name not in series:
+                continue
+            if meta['type'] == 'points' and max_points:
+                # 需要先知道窗口内的点数才能均匀抽取
+                blocks = [_read_points(path, name, meta, start, end, level, max_points)]
+            else:
+                blocks = iter_series_blocks(path, name, start, end, level)
+            iterators.append(_tag_events(name, blocks))
+
+    merged = heapq.merge(*iterators, key=lambda entry: entry[0])
+    return extra, ((name, item) for _, name, item in merged)
+
+
+def _filter_json(trajectory_data, start, end, series, max_points=None):
+    result = {}
+    for name, items in trajectory_data.items():
+        if series is not None and name not in series:
+            continue
+        if isinstance(items, list) and (start is not None or end is not None) and _is_event_series(items):
+            items = [
+                item for item in items
+                if (start is None or item['timestamp'] >= start) and (end is None or item['timestamp'] <= end)
+            ]
+        if max_points and isinstance(items, list) and _is_point_series(items):
+            items = decimate(items, max_points)
+        result[name] = items
+    return result
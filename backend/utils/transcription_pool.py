@@ -0,0 +1,196 @@
+"""
+Whisper 转录进程池
+
+转录是 CPU 密集型任务，放在独立的进程池中执行，不与 Flask 请求线程争抢 GIL。
+每个工作进程启动时预热模型并常驻内存；不超过 30 秒的短音频会在一个很短的
+时间窗口内攒批，跨录制合并成一次批量解码，提高 CPU 利用率。
+"""
+import os
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+_CPU_COUNT = os.cpu_count() or 1
+
+# 工作进程数量，默认使用一半的 CPU 核心
+TRANSCRIBE_WORKERS = int(os.environ.get('TRANSCRIBE_WORKERS', str(max(1, _CPU_COUNT // 2))))
+
+# 单批最多合并的短音频数量，设为 1 可关闭攒批
+TRANSCRIBE_BATCH_SIZE = int(os.environ.get('TRANSCRIBE_BATCH_SIZE', '8'))
+
+# 攒批等待时间（毫秒）
+TRANSCRIBE_BATCH_WINDOW_MS = int(os.environ.get('TRANSCRIBE_BATCH_WINDOW_MS', '500'))
+
+# Whisper 单个窗口为 30 秒，不超过该时长的音频才可以批量解码
+BATCH_MAX_CLIP_MS = 30 * 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = queue.Queue()
+_dispatcher = None
+
+
+def _init_worker(num_threads):
+    """
+    工作进程初始化：限制每个进程的 torch 线程数并预热模型
+    """
+    import torch
+    from utils.subtitle import preload_models
+
+    torch.set_num_threads(num_threads)
+    preload_models(background=False)
+
+
+def _run_single(audio_path, output_path, model_size):
+    from utils.subtitle import generate_vtt
+
+    metrics = {}
+    success = generate_vtt(audio_path, output_path, model_size=model_size, metrics=metrics)
+    return success, metrics
+
+
+def _run_batch(model_size, clips):
+    from utils.subtitle import generate_vtt, transcribe_clips
+
+    try:
+        return transcribe_clips(clips, model_size=model_size)
+    except Exception as e:
+        # 批量解码失败时逐个转录，避免一个坏文件拖垮整批
+        print(f"[WARN] 批量转录失败，改为逐个转录: {e}")
+        outcomes = []
+        for audio_path, output_path in clips:
+            metrics = {}
+            outcomes.append((generate_vtt(audio_path, output_path, model_size=model_size, metrics=metrics), metrics))
+        return outcomes
+
+
+def start_transcription_pool():
+    """
+    启动转录进程池和攒批调度线程（重复调用不会重复启动）
+    """
+    global _executor, _dispatcher
+
+    with _executor_lock:
+        if _executor is not None:
+            return
+
+        # 使用 spawn 启动子进程，避免 fork 时继承 Flask 和其它线程持有的锁
+        threads_per_worker = max(1, _CPU_COUNT // TRANSCRIBE_WORKERS)
+        _executor = ProcessPoolExecutor(
+            max_workers=TRANSCRIBE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(threads_per_worker,)
+        )
+        _dispatcher = threading.Thread(target=_dispatch_loop, name='transcription-dispatcher', daemon=True)
+        _dispatcher.start()
+
+    print(f"[INFO] 已启动 {TRANSCRIBE_WORKERS} 个转录进程，每个进程 {threads_per_worker} 个线程")
+
+
+def submit_transcription(audio_path, output_path, model_size='base', duration_ms=None):
+    """
+    提交转录任务
+
+    Args:
+        audio_path: 音频文件路径
+        output_path: 输出 VTT 文件路径
+        model_size: Whisper 模型大小
+        duration_ms: 音频文件探测得到的时长（毫秒），已知且较短时参与攒批，None 或 0 视为未知
+
+    Returns:
+        concurrent.futures.Future，结果为 (是否成功, 耗时指标)
+    """
+    start_transcription_pool()
+
+    future = Future()
+    _pending.put({
+        'audio_path': audio_path,
+        'output_path': output_path,
+        'model_size': model_size,
+        'duration_ms': duration_ms,
+        'future': future,
+    })
+    return future
+
+
+def _resolve(futures, executor_future):
+    """
+    将进程池的结果分发给各个调用方的 Future
+    """
+    try:
+        results = executor_future.result()
+    except Exception as e:
+        for future in futures:
+            future.set_exception(e)
+        return
+
+    for future, result in zip(futures, results):
+        future.set_result(result)
+
+
+def _submit_batch(model_size, items):
+    try:
+        _submit_to_executor(model_size, items)
+    except Exception as e:
+        # 进程池已损坏等情况，直接通知调用方失败
+        for item in items:
+            item['future'].set_exception(e)
+
+
+def _submit_to_executor(model_size, items):
+    if len(items) == 1:
+        item = items[0]
+        executor_future = _executor.submit(_run_single, item['audio_path'], item['output_path'], model_size)
+        executor_future.add_done_callback(lambda f: _resolve([item['future']], _wrap_single(f)))
+        return
+
+    clips = [(item['audio_path'], item['output_path']) for item in items]
+    executor_future = _executor.submit(_run_batch, model_size, clips)
+    executor_future.add_done_callback(lambda f: _resolve([item['future'] for item in items], f))
+
+
+def _wrap_single(executor_future):
+    """
+    把单个任务的结果包装成列表形式，与批量任务统一处理
+    """
+    wrapped = Future()
+    try:
+        wrapped.set_result([executor_future.result()])
+    except Exception as e:
+        wrapped.set_exception(e)
+    return wrapped
+
+
+def _dispatch_loop():
+    # model_size -> {'items': [...], 'deadline': 截止时间}
+    batches = {}
+    while True:
+        timeout = None
+        if batches:
+            timeout = max(0.0, min(batch['deadline'] for batch in batches.values()) - time.monotonic())
+
+        try:
+            item = _pending.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+
+        if item is not None:
+            # 时长未知的音频可能超过 30 秒，批量解码会被截断，只能单独转录
+            short_clip = bool(item['duration_ms']) and 0 < item['duration_ms'] <= BATCH_MAX_CLIP_MS
+            if short_clip and TRANSCRIBE_BATCH_SIZE > 1:
+                batch = batches.setdefault(item['model_size'], {
+                    'items': [],
+                    'deadline': time.monotonic() + TRANSCRIBE_BATCH_WINDOW_MS / 1000,
+                })
+                batch['items'].append(item)
+            else:
+                _submit_batch(item['model_size'], [item])
+
+        now = time.monotonic()
+        for model_size, batch in list(batches.items()):
+            if len(batch['items']) >= TRANSCRIBE_BATCH_SIZE or now >= batch['deadline']:
+                del batches[model_size]
+                _submit_batch(model_size, batch['items'])
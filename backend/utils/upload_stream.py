@@ -0,0 +1,167 @@
+"""
+流式上传解析
+
+直接从 request.stream 增量解析 multipart 请求体，每个文件分片边接收边写入
+UPLOAD_FOLDER 下的 .ingest-<token>-<字段名>.part 文件，同时计算 sha256 和大小。
+分片文件不会再重命名或拷贝：register_recording 把它硬链接进内容寻址存储后删除。
+与 request.files 相比，不会先落一份临时文件再拷贝，每个字节只写盘一次。
+"""
+import os
+import time
+import uuid
+import hashlib
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+
+# 每次从请求流读取的块大小，同时也是内存中最多缓冲的数据量
+INGEST_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE_KB', '1024')) * 1024
+
+# 单个文件分片的最大大小（MB），0 表示不限制
+MAX_UPLOAD_PART_MB = int(os.environ.get('MAX_UPLOAD_PART_MB', '4096'))
+
+# 普通表单字段的最大大小
+MAX_FORM_FIELD_SIZE = 1024 * 1024
+
+# 每写入多少 MB 调用一次 fsync，每个分片在页缓存中尚未落盘的数据不超过该值，0 表示不主动 fsync
+UPLOAD_FSYNC_INTERVAL_MB = int(os.environ.get('UPLOAD_FSYNC_INTERVAL_MB', '64'))
+
+
+class UploadError(Exception):
+    """
+    上传请求不合法，status 为应返回的 HTTP 状态码
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _open_part(dest_dir, token, name, filename):
+    path = os.path.join(dest_dir, f'.ingest-{token}-{name}.part')
+    return {
+        'name': name,
+        'filename': filename,
+        'path': path,
+        'file': open(path, 'wb'),
+        'sha256': hashlib.sha256(),
+        'size': 0,
+        'unsynced': 0,
+    }
+
+
+def _write_part(part, data):
+    part['size'] += len(data)
+    if MAX_UPLOAD_PART_MB and part['size'] > MAX_UPLOAD_PART_MB * 1024 * 1024:
+        raise UploadError(f"文件 {part['name']} 超过大小限制 {MAX_UPLOAD_PART_MB}MB", status=413)
+
+    part['sha256'].update(data)
+    part['file'].write(data)
+
+    part['unsynced'] += len(data)
+    if UPLOAD_FSYNC_INTERVAL_MB and part['unsynced'] >= UPLOAD_FSYNC_INTERVAL_MB * 1024 * 1024:
+        part['file'].flush()
+        os.fsync(part['file'].fileno())
+        part['unsynced'] = 0
+
+
+def _close_part(part):
+    part['file'].close()
+    return {
+        'filename': part['filename'],
+        'path': part['path'],
+        'size': part['size'],
+        'sha256': part['sha256'].hexdigest(),
+    }
+
+
+def discard_ingested(files):
+    """
+    删除已接收但不再需要的分片文件
+    """
+    for info in files.values():
+        if os.path.exists(info['path']):
+            os.unlink(info['path'])
+
+
+def ingest_multipart(request, dest_dir, file_fields):
+    """
+    增量解析 multipart/form-data 请求
+
+    Args:
+        request: Flask 请求对象（调用前不能访问 request.form / request.files）
+        dest_dir: 文件分片的写入目录（应与最终存放位置在同一文件系统，方便硬链接进 blob 存储）
+        file_fields: 需要保存的文件字段名集合，其它文件字段会被丢弃
+
+    Returns:
+        (form, files, stats)
+        - form: 普通表单字段 {name: value}
+        - files: {name: {'filename', 'path', 'size', 'sha256'}}，path 为 .part 分片文件，由调用方存入 blob 后删除
+        - stats: {'bytes', 'seconds', 'mbps'} 本次接收的吞吐量
+    """
+    if request.mimetype != 'multipart/form-data':
+        raise UploadError('请求必须是 multipart/form-data')
+    boundary = request.mimetype_params.get('boundary')
+    if not boundary:
+        raise UploadError('缺少 multipart boundary')
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=MAX_FORM_FIELD_SIZE)
+    token = uuid.uuid4().hex[:8]
+    stream = request.stream
+
+    form = {}
+    files = {}
+    field = None
+    part = None
+    skipping = False
+    total_bytes = 0
+    start = time.perf_counter()
+
+    try:
+        while True:
+            chunk = stream.read(INGEST_CHUNK_SIZE)
+            total_bytes += len(chunk)
+            decoder.receive_data(chunk or None)
+
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    field = {'name': event.name, 'data': bytearray()}
+                elif isinstance(event, File):
+                    skipping = event.name not in file_fields or not event.filename
+                    if not skipping:
+                        part = _open_part(dest_dir, token, event.name, event.filename)
+                elif isinstance(event, Data):
+                    if field is not None:
+                        field['data'] += event.data
+                        if len(field['data']) > MAX_FORM_FIELD_SIZE:
+                            raise UploadError(f"表单字段 {field['name']} 过大", status=413)
+                        if not event.more_data:
+                            form[field['name']] = field['data'].decode('utf-8', 'replace')
+                            field = None
+                    elif part is not None:
+                        _write_part(part, event.data)
+                        if not event.more_data:
+                            if part['name'] in files:
+                                discard_ingested({part['name']: files[part['name']]})
+                            files[part['name']] = _close_part(part)
+                            part = None
+                    elif skipping and not event.more_data:
+                        skipping = False
+                event = decoder.next_event()
+
+            if isinstance(event, Epilogue):
+                break
+            if not chunk:
+                raise UploadError('上传数据不完整')
+    except Exception:
+        if part is not None:
+            files[part['name']] = _close_part(part)
+        discard_ingested(files)
+        raise
+
+    seconds = time.perf_counter() - start
+    stats = {
+        'bytes': total_bytes,
+        'seconds': round(seconds, 3),
+        'mbps': round(total_bytes / 1024 / 1024 / seconds, 2) if seconds > 0 else None,
+    }
+    return form, files, stats
@@ -0,0 +1,221 @@
+"""
+流式 ZIP 打包
+
+边读取文件边生成 ZIP 数据，直接写入响应，不在磁盘上生成临时压缩包：
+- 写入目标不可 seek，zipfile 在每个条目后写数据描述符（CRC 和大小在写入时计算）
+- 已压缩的媒体（webm 等）使用 STORED，只有字幕、JSON 等文本使用 DEFLATE
+- 超过 4GB 的条目和总大小超过 4GB 的压缩包使用 ZIP64
+
+批量导出时用 prefetch_files 在后台线程中提前读取后续文件，读盘与打包发送重叠。
+"""
+import os
+import time
+import queue
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 每次读取文件的块大小
+ZIP_STREAM_CHUNK_SIZE = int(os.environ.get('ZIP_STREAM_CHUNK_SIZE_KB', '1024')) * 1024
+
+# 使用 DEFLATE 压缩的扩展名，其它文件（音视频）原样存储
+COMPRESSIBLE_EXTENSIONS = {'.vtt', '.json', '.txt', '.csv'}
+
+
+class _StreamBuffer:
+    """
+    zipfile 的写入目标：记录写入位置，数据由生成器取走后发送
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compress_type(entry):
+    compress = entry.get('compress')
+    if compress is None:
+        compress = os.path.splitext(entry['name'])[1].lower() in COMPRESSIBLE_EXTENSIONS
+    return zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+
+
+def _read_file(f, chunk_size):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _open_entry(entry, chunk_size):
+    """
+    打开条目的数据源
+
+    Returns:
+        (ZipInfo, 数据块迭代器, 需要关闭的文件)，文件已不存在时返回 None
+    """
+    if 'path' in entry:
+        try:
+            f = open(entry['path'], 'rb')
+        except FileNotFoundError:
+            return None
+        info = zipfile.ZipInfo.from_file(entry['path'], entry['name'])
+        info.file_size = os.fstat(f.fileno()).st_size
+        return info, _read_file(f, chunk_size), f
+
+    info = zipfile.ZipInfo(entry['name'], date_time=time.localtime(entry.get('mtime'))[:6])
+    info.external_attr = 0o644 << 16
+    if 'data' in entry:
+        info.file_size = len(entry['data'])
+        return info, iter([entry['data']]), None
+    # 大小未知时按 ZIP64 写入
+    info.file_size = entry.get('size', zipfile.ZIP64_LIMIT)
+    return info, entry['chunks'], None
+
+
+def stream_zip(entries, chunk_size=ZIP_STREAM_CHUNK_SIZE):
+    """
+    生成 ZIP 数据流
+
+    Args:
+        entries: 条目的可迭代对象，每项为 dict：
+            - name: 压缩包内的文件名
+            - path: 文件路径；或 data: bytes；或 chunks: bytes 迭代器（可附带 size、mtime）
+            - compress: 是否使用 DEFLATE，默认按扩展名决定
+            文件在开始写入该条目时才打开，已不存在的文件会被跳过
+        chunk_size: 读取文件的块大小
+
+    Yields:
+        ZIP 数据块，第一个文件的数据读出后立即产生
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as zf:
+        for entry in entries:
+            opened = _open_entry(entry, chunk_size)
+            if opened is None:
+                print(f"[WARN] 打包时文件不存在，已跳过: {entry['path']}")
+                continue
+            info, chunks, f = opened
+            info.compress_type = _compress_type(entry)
+            try:
+                # zipfile 按 file_size 决定是否使用 ZIP64
+                with zf.open(info, 'w') as dest:
+                    for chunk in chunks:
+                        dest.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            finally:
+                if f:
+                    f.close()
+            data = buffer.drain()
+            if data:
+                yield data
+    # 中央目录
+    yield buffer.drain()
+
+
+# 读取结束标记
+_EOF = object()
+
+
+def _put(q, item, cancelled):
+    while not cancelled.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fill(f, q, chunk_size, cancelled):
+    try:
+        with f:
+            while not cancelled.is_set():
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                if not _put(q, chunk, cancelled):
+                    return
+    except OSError as e:
+        _put(q, e, cancelled)
+    _put(q, _EOF, cancelled)
+
+
+def _drain(q):
+    while True:
+        item = q.get()
+        if item is _EOF:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def prefetch_files(entries, workers, chunk_size, depth):
+    """
+    在后台线程中提前读取条目的文件内容
+
+    同时最多有 workers 个文件在读取（当前正在打包的文件和其后的 workers - 1 个），
+    每个文件最多缓冲 depth 个块，内存占用上限约为 workers * depth * chunk_size。
+
+    Args:
+        entries: stream_zip 的条目，带 path 的条目转换为 chunks 条目，其它原样返回
+
+    Yields:
+        stream_zip 的条目，已不存在的文件被跳过
+    """
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-prefetch')
+    cancelled = threading.Event()
+
+    def start(entry):
+        if 'path' not in entry:
+            return entry
+        try:
+            f = open(entry['path'], 'rb')
+        except FileNotFoundError:
+            print(f"[WARN] 打包时文件不存在，已跳过: {entry['path']}")
+            return None
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        stat = os.fstat(f.fileno())
+        q = queue.Queue(maxsize=depth)
+        executor.submit(_fill, f, q, chunk_size, cancelled)
+        prefetched = {key: value for key, value in entry.items() if key != 'path'}
+        prefetched.update(chunks=_drain(q), size=stat.st_size, mtime=stat.st_mtime)
+        return prefetched
+
+    window = deque()
+    try:
+        for entry in entries:
+            window.append(start(entry))
+            if len(window) >= workers:
+                entry = window.popleft()
+                if entry:
+                    yield entry
+        while window:
+            entry = window.popleft()
+            if entry:
+                yield entry
+    finally:
+        # 客户端断开时停止后台读取
+        cancelled.set()
+        executor.shutdown(wait=False)
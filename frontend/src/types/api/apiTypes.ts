@@ -39,7 +39,7 @@ export interface RecordingDetailResponse {
 /** 录制列表项响应 */
 export interface RecordingListItem {
   hashid: RecordingHashed; // 录制唯一ID
-  created_at: number; // 创建时间戳（毫秒）
+  createdAt: number; // 创建时间戳（毫秒）
   duration: number; // 视频时长（秒）
   hasScreenRecording?: boolean; // 是否有屏幕录制
   hasWebcamRecording?: boolean; // 是否有摄像头录制